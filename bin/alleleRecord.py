@@ -0,0 +1,106 @@
+#
+#  alleleRecord.py
+###########################################################################
+#
+#  Purpose:
+#
+#      The general-Allele input file format, shared by makeIKMC.py (which
+#      writes it) and makeAllele.py (which reads it), and the serializers
+#      for the Allele file and the BCP files.
+#
+#      A tab-delimited file, one allele per line:
+#
+#	field 1:  MGI Marker ID
+#	field 2:  Allele Symbol
+#	field 3:  Allele Name
+#	field 4:  Allele Status
+#	field 5:  Allele Generation (Type)
+#	field 6:  Allele Subtype
+#	field 7:  Allele Collection
+#	field 8:  Germ Line Transmission
+#	field 9:  Reference Type/J#
+#	field 10: Strain of Origin
+#	field 11: Mutant Cell Line ID
+#	field 12: Molecular Notes (_NoteType_key = 1021)
+#	field 13: Driver Gene (MGI_Relationship._Category_key = 1006/_Object_key_2 = marker)
+#	field 14: IKMC Colony Name (_NoteType_key = 1041)
+#	field 15: Molecular Mutation
+#	field 16: Inheritance Mode
+#	field 17: Mixed
+#	field 18: Extinct
+#	field 19: Created By
+#	field 20: Add mutant cell line
+#	field 21: Add IKMC Colony Note
+#	field 22: Set the child's Allele Status = Approved (847114)
+#	field 23: Allele MGI ID (if child allele already exists)
+#	field 24: Allele Symbol minus Marker Symbol (for IKMC format)
+#
+#  Usage:
+#
+#      import alleleRecord
+#      fp.write(alleleRecord.format(alleleRecord.AlleleRecord(markerID = ..., ...)))
+#      record = alleleRecord.parse(line)
+#      fp.write(alleleRecord.bcpRow(key, ...))
+#
+###########################################################################
+
+import collections
+
+FIELDS = [
+    'markerID',
+    'symbol',
+    'name',
+    'alleleStatus',
+    'alleleType',
+    'alleleSubtypes',
+    'collectionKey',
+    'germLine',
+    'references',
+    'strainOfOrigin',
+    'mutantCellLine',
+    'molecularNotes',
+    'driverNotes',
+    'ikmcNotes',
+    'mutations',
+    'inheritanceMode',
+    'isMixed',
+    'isExtinct',
+    'createdBy',
+    'createMCL',
+    'createNote',
+    'setStatus',
+    'existingAlleleID',
+    'ikmcSymbol',
+    ]
+
+AlleleRecord = collections.namedtuple('AlleleRecord', FIELDS)
+
+fieldCount = len(FIELDS)
+
+#
+# Purpose: parse one line of the Allele file
+# Returns: AlleleRecord, or None if the line has too few fields
+#
+def parse(line):
+
+    if line.endswith('\n'):
+        line = line[:-1]
+
+    tokens = line.split('\t')
+
+    if len(tokens) < fieldCount:
+        return None
+
+    return AlleleRecord._make(tokens[:fieldCount])
+
+#
+# Purpose: returns one line of the Allele file
+#
+def format(record):
+    return '\t'.join(map(str, record)) + '\n'
+
+#
+# Purpose: returns one line of a BCP file ('|' delimited)
+#
+def bcpRow(*values):
+    return '|'.join(map(str, values)) + '\n'
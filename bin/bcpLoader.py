@@ -0,0 +1,132 @@
+#
+#  bcpLoader.py
+###########################################################################
+#
+#  Purpose:
+#
+#      Runs the bcp commands of a load in dependency order.
+#
+#      The tables are given as a list of stages.  The stages are run one
+#      after another; the tables within a stage do not depend on each
+#      other and are bcp-ed concurrently.
+#
+#  Usage:
+#
+#      import bcpLoader
+#      results = bcpLoader.bcpStages([[('ALL_Allele', fileName, bcpCmd)],
+#                                     [('MGI_Note', fileName, bcpCmd), ...]],
+#                                    workers, done)
+#
+#      done : optional; done(result) is called (on the calling thread) as
+#      soon as each table is bcp-ed, e.g. to checkpoint the load
+#
+#  Outputs:
+#
+#      For each table, a dictionary:
+#
+#      table	table name
+#      fileName	bcp file name
+#      command	bcp command
+#      status	exit status of the bcp command (None if it was not run)
+#      rows	number of rows in the bcp file
+#      seconds	wall time of the bcp command
+#      output	stdout/stderr of the bcp command
+#
+#  Notes:
+#
+#      If any table of a stage fails, the later stages are not run.
+#
+###########################################################################
+
+import time
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+#
+# Purpose: returns the number of rows in a bcp file
+#
+def countRows(fileName):
+
+    rows = 0
+
+    try:
+        fp = open(fileName, 'r')
+        for line in fp:
+            rows += 1
+        fp.close()
+    except:
+        pass
+
+    return rows
+
+#
+# Purpose: bcp one table
+#
+def bcpTable(table, fileName, bcpCmd):
+
+    result = {
+        'table' : table,
+        'fileName' : fileName,
+        'command' : bcpCmd,
+        'status' : None,
+        'rows' : countRows(fileName),
+        'seconds' : 0,
+        'output' : '',
+        }
+
+    startTime = time.time()
+    p = subprocess.run(bcpCmd, shell = True, stdout = subprocess.PIPE, \
+            stderr = subprocess.STDOUT, universal_newlines = True)
+    result['seconds'] = time.time() - startTime
+    result['status'] = p.returncode
+    result['output'] = p.stdout
+
+    return result
+
+#
+# Purpose: bcp the tables, stage by stage
+# Returns: list of results (one per table, in the order given)
+#
+def bcpStages(stages, workers = 1, done = None):
+
+    results = []
+    failed = 0
+
+    for stage in stages:
+
+        if failed:
+            for table, fileName, bcpCmd in stage:
+                results.append({
+                    'table' : table,
+                    'fileName' : fileName,
+                    'command' : bcpCmd,
+                    'status' : None,
+                    'rows' : countRows(fileName),
+                    'seconds' : 0,
+                    'output' : 'not run: an earlier stage failed\n',
+                    })
+            continue
+
+        with ThreadPoolExecutor(max_workers = max(1, workers)) as executor:
+            futures = [executor.submit(bcpTable, table, fileName, bcpCmd) \
+                    for table, fileName, bcpCmd in stage]
+            for f in as_completed(futures):
+                r = f.result()
+                if r['status'] != 0:
+                    failed = 1
+                if done:
+                    done(r)
+            results = results + [f.result() for f in futures]
+
+    return results
+
+#
+# Purpose: returns 1 if any table failed or was not run, else 0
+#
+def anyFailed(results):
+
+    for r in results:
+        if r['status'] != 0:
+            return 1
+
+    return 0
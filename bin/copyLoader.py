@@ -0,0 +1,146 @@
+#
+#  copyLoader.py
+###########################################################################
+#
+#  Purpose:
+#
+#      Streams bcp rows straight into PostgreSQL (copy ... from stdin)
+#      instead of writing them to a .bcp file and running bcpin.csh.
+#
+#      openTable() returns a file-like object; the rows written to it
+#      are kept in a bounded in-memory buffer and copied into the table
+#      when the buffer is full, or when the table is closed.
+#
+#  Usage:
+#
+#      import copyLoader
+#      fp = copyLoader.openTable('ALL_Allele', teeFileName)
+#      fp.write('1|2|...\n')
+#      copyLoader.flushAll()
+#      fp.close()
+#      copyLoader.commit()
+#
+#  Env Vars:
+#
+#      COPY_BUFFER_SIZE	optional; buffer size per table in bytes
+#      MGD_DBUSER, MGD_DBPASSWORDFILE	the database user/password
+#
+#  Notes:
+#
+#      Requires psycopg2.  The rows are copied over a psycopg2 connection
+#      of its own, opened to the server/database of the db module
+#      (db.get_sqlServer(), db.get_sqlDatabase()); they are committed by
+#      commit(), in one transaction.
+#
+#      The rows use the same format as the .bcp files ('|' delimited,
+#      empty string = null).
+#
+#      The buffers are always flushed in the order the tables were opened,
+#      so that the parent table (ALL_Allele) is copied before the tables
+#      that reference it.
+#
+#      If teeFileName is given, the rows are also written to that file
+#      (for audit).
+#
+#      A failed copy raises CopyError (from write(), close(), flushAll()).
+#
+###########################################################################
+
+import os
+import io
+import db
+
+bufferSize = int(os.getenv('COPY_BUFFER_SIZE', 1048576))
+
+# open tables, in flush order
+tables = []
+
+# the psycopg2 connection of the copy loads
+conn = None
+
+#
+# Purpose: returns the psycopg2 connection of the copy loads (opened on first use)
+#
+def getConnection():
+
+    global conn
+
+    if conn is None:
+        import psycopg2
+        fp = open(os.environ['MGD_DBPASSWORDFILE'], 'r')
+        password = fp.read().strip()
+        fp.close()
+        conn = psycopg2.connect(host = db.get_sqlServer(), dbname = db.get_sqlDatabase(), \
+                user = os.environ['MGD_DBUSER'], password = password)
+
+    return conn
+
+class CopyError(Exception):
+    pass
+
+#
+# Purpose: commit the copied rows
+#
+def commit():
+
+    if conn is not None:
+        conn.commit()
+
+class TableStream:
+
+    def __init__(self, table, teeFileName = None):
+        self.table = table
+        self.buffer = []
+        self.size = 0
+        self.rows = 0
+        self.closed = 0
+        self.teeFile = None
+        if teeFileName:
+            self.teeFile = open(teeFileName, 'w')
+
+    def write(self, row):
+        self.buffer.append(row)
+        self.size += len(row)
+        self.rows += row.count('\n')
+        if self.teeFile:
+            self.teeFile.write(row)
+        if self.size >= bufferSize:
+            flushAll()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        try:
+            cursor = getConnection().cursor()
+            cursor.copy_expert('''copy %s from stdin with (delimiter '|', null '')''' % (self.table), \
+                    io.StringIO(''.join(self.buffer)))
+            cursor.close()
+        except Exception as e:
+            raise CopyError('copy into %s failed: %s' % (self.table, e))
+        self.buffer = []
+        self.size = 0
+
+    def close(self):
+        if self.closed:
+            return
+        flushAll()
+        self.closed = 1
+        if self.teeFile:
+            self.teeFile.close()
+
+#
+# Purpose: open a table for streaming
+#
+def openTable(table, teeFileName = None):
+
+    t = TableStream(table, teeFileName)
+    tables.append(t)
+    return t
+
+#
+# Purpose: copy the buffered rows of all tables, in the order the tables were opened
+#
+def flushAll():
+
+    for t in tables:
+        t.flush()
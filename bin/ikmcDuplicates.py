@@ -0,0 +1,176 @@
+#
+#  ikmcDuplicates.py
+###########################################################################
+#
+#  Purpose:
+#
+#      Tracks the children created by this run of makeIKMC.py, so that a
+#      later row for the same child is either attached to it (new ES cell
+#      line and/or new colony) or skipped as a duplicate.
+#
+#	(child symbol, ES cell line) and (child symbol, colony) are kept
+#	in sets, so each check is O(1)
+#	the colonies of each child are also kept in the order they were
+#	added (the IKMC Colony note of the new child)
+#
+#      Once more than IKMC_DUPLICATE_SPILL children are tracked, the
+#      tracker moves to a sqlite database on disk (IKMC_DUPLICATE_FILE)
+#      and stays there for the rest of the run.
+#
+#  Usage:
+#
+#      import ikmcDuplicates
+#      if ikmcDuplicates.hasChild(childSymbol):
+#          if ikmcDuplicates.hasCellLine(childSymbol, cellLine): ...
+#      ikmcDuplicates.add(childSymbol, cellLine, colony)
+#      ikmcDuplicates.colonies(childSymbol)
+#      ikmcDuplicates.close()
+#      ikmcDuplicates.reset()
+#
+#  Env Vars:
+#
+#      IKMC_DUPLICATE_SPILL	optional; number of children held in memory
+#				(default 0 = never spill)
+#      IKMC_DUPLICATE_FILE	optional; the sqlite file
+#				(default ${OUTPUTDIR}/ikmcDuplicates.db)
+#
+###########################################################################
+
+import os
+import sqlite3
+import loadLog
+
+spillAt = int(os.getenv('IKMC_DUPLICATE_SPILL', 0))
+spillFile = os.getenv('IKMC_DUPLICATE_FILE', os.path.join(os.getenv('OUTPUTDIR', '.'), 'ikmcDuplicates.db'))
+
+# in memory
+# key = child symbol, value = list of colonies (in the order added)
+childColonies = {}
+# (child symbol, ES cell line)
+childCellLines = set()
+# (child symbol, colony)
+childColonySet = set()
+
+# on disk (after the spill), else None
+conn = None
+
+#
+# Purpose: move the tracker to the sqlite file
+#
+def spill():
+    global conn
+
+    if os.path.exists(spillFile):
+        os.remove(spillFile)
+
+    loadLog.info('spilling duplicate tracker (%s children) to %s', len(childColonies), spillFile)
+
+    conn = sqlite3.connect(spillFile)
+    conn.execute('pragma journal_mode = off')
+    conn.execute('pragma synchronous = off')
+    conn.execute('create table child (symbol text primary key)')
+    conn.execute('create table cellLine (symbol text, cellLine text, primary key (symbol, cellLine))')
+    conn.execute('create table colony (seq integer primary key, symbol text, colony text)')
+    conn.execute('create index colony_idx on colony (symbol, colony)')
+
+    conn.executemany('insert into child values (?)', [(s,) for s in childColonies])
+    conn.executemany('insert into cellLine values (?, ?)', childCellLines)
+    for s in childColonies:
+        conn.executemany('insert into colony (symbol, colony) values (?, ?)', \
+                [(s, c) for c in childColonies[s]])
+
+    childColonies.clear()
+    childCellLines.clear()
+    childColonySet.clear()
+
+def exists(sql, args):
+    return conn.execute(sql, args).fetchone() is not None
+
+#
+# Purpose: has the child been created by this load
+#
+def hasChild(symbol):
+
+    if conn:
+        return exists('select 1 from child where symbol = ?', (symbol,))
+
+    return symbol in childColonies
+
+#
+# Purpose: has the ES cell line been attached to the child
+#
+def hasCellLine(symbol, cellLine):
+
+    if conn:
+        return exists('select 1 from cellLine where symbol = ? and cellLine = ?', (symbol, cellLine))
+
+    return (symbol, cellLine) in childCellLines
+
+#
+# Purpose: has the colony been attached to the child
+#
+def hasColony(symbol, colony):
+
+    if conn:
+        return exists('select 1 from colony where symbol = ? and colony = ?', (symbol, colony))
+
+    return (symbol, colony) in childColonySet
+
+#
+# Purpose: add the child (if new) with its ES cell line and colony
+#
+def add(symbol, cellLine, colony):
+
+    if not conn and spillAt > 0 and symbol not in childColonies and len(childColonies) >= spillAt:
+        spill()
+
+    if conn:
+        conn.execute('insert or ignore into child values (?)', (symbol,))
+        conn.execute('insert or ignore into cellLine values (?, ?)', (symbol, cellLine))
+        conn.execute('insert into colony (symbol, colony) values (?, ?)', (symbol, colony))
+        return
+
+    childColonies.setdefault(symbol, []).append(colony)
+    childCellLines.add((symbol, cellLine))
+    childColonySet.add((symbol, colony))
+
+#
+# Purpose: returns the colonies of the child, in the order they were added
+#
+def colonies(symbol):
+
+    if conn:
+        return [r[0] for r in \
+                conn.execute('select colony from colony where symbol = ? order by seq', (symbol,))]
+
+    return childColonies.get(symbol, [])
+
+#
+# Purpose: number of children tracked
+#
+def count():
+
+    if conn:
+        return conn.execute('select count(*) from child').fetchone()[0]
+
+    return len(childColonies)
+
+#
+# Purpose: close the sqlite file (if any)
+#
+def close():
+    global conn
+
+    if conn:
+        conn.close()
+        conn = None
+
+#
+# Purpose: forget all the children (and close the sqlite file)
+#
+def reset():
+
+    close()
+    childColonies.clear()
+    childCellLines.clear()
+    childColonySet.clear()
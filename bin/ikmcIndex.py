@@ -0,0 +1,75 @@
+#
+#  ikmcIndex.py
+###########################################################################
+#
+#  Purpose:
+#
+#      Hash indexes for the makeIKMC.py rule checks, built once from the
+#      MGI snapshot (see ikmcSnapshot.py), so that each check is O(1):
+#
+#	marker MGI IDs of the parents
+#	(cell line, _Allele_key) pairs (parents and children)
+#	IKMC Colony names of each child, from its IKMC Colony note ('|' delimited)
+#
+#  Usage:
+#
+#      import ikmcIndex
+#      ikmcIndex.add('parents', rows)
+#      if ikmcIndex.hasMarker(markerID): ...
+#
+###########################################################################
+
+# marker MGI IDs
+markerIDs = set()
+
+# (cellLine, _Allele_key)
+cellLineAlleles = set()
+
+# key = child _Allele_key, value = set of IKMC Colony names
+childColonies = {}
+
+#
+# Purpose: returns the colony names of an IKMC Colony note
+#
+def colonyTokens(note):
+    return set([t.strip() for t in note.split('|')])
+
+#
+# Purpose: index the rows of one snapshot query
+#
+def add(name, results):
+
+    if name == 'parents':
+        for r in results:
+            markerIDs.add(r['markerID'])
+
+    elif name == 'cellLines':
+        for r in results:
+            cellLineAlleles.add((r['cellLine'], r['_Allele_key']))
+
+    elif name == 'notes':
+        for r in results:
+            childColonies[r['_Object_key']] = colonyTokens(r['note'])
+
+def hasMarker(markerID):
+    return markerID in markerIDs
+
+#
+# Purpose: is the cell line associated with the allele
+#
+def hasCellLine(alleleKey, cellLine):
+    return (cellLine, alleleKey) in cellLineAlleles
+
+#
+# Purpose: is the colony in the IKMC Colony note of the child
+#	an empty colony name matches any note (as note.find('') did)
+#
+def hasColony(alleleKey, colony):
+
+    if alleleKey not in childColonies:
+        return 0
+
+    if colony == '':
+        return 1
+
+    return colony in childColonies[alleleKey]
@@ -0,0 +1,330 @@
+#
+#  ikmcSnapshot.py
+###########################################################################
+#
+#  Purpose:
+#
+#      The MGI snapshot used by makeIKMC.py: KOMP/EUCOMM parents,
+#      children, their mutant cell lines and the IKMC Colony notes.
+#
+#      The queries are independent; they run concurrently, each on its
+#      own connection (the db module opens one per statement unless
+#      db.useOneConnection(1) is in effect, see makeIKMCAllele.py).
+#
+#      The snapshot can be kept in a local cache file.  Each query is
+#      re-used from the cache only if its rows are unchanged: the row count
+#      and the last modification date of the rows the query selects (over
+#      all the tables of its join, see fingerprint()); a query whose rows
+#      changed is re-run and the cache is refreshed.
+#
+#  Usage:
+#
+#      import ikmcSnapshot
+#      snapshot = ikmcSnapshot.load(cacheFileName)
+#      for r in snapshot['parents']: ...
+#
+#      or, to process each result as soon as its query completes:
+#      ikmcSnapshot.load(cacheFileName, build)	(build(name, rows))
+#
+#  Env Vars:
+#
+#      IKMC_SNAPSHOT_MAXAGE	optional; max age of the cache file in seconds
+#      IKMC_SNAPSHOT_WORKERS	optional; number of concurrent queries (default 4)
+#
+#  Notes:
+#
+#      The cache file is a json file:
+#	fingerprints : key = query name, value = [row count, last modification date]
+#	queries : key = query name, value = list of result rows
+#
+#      The fingerprint relies on every update of these tables setting
+#      modification_date (as the curator interfaces and makeAllele.py do);
+#      a row added to or removed from a query changes its row count.
+#
+#      If the fingerprint of a query cannot be read, the query is re-run.
+#
+###########################################################################
+
+import os
+import json
+import time
+import db
+import loadLog
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+mgiIKMCNoteTypeKey = 1041
+
+snapshotMaxAge = 86400
+
+# number of queries run concurrently
+workers = int(os.getenv('IKMC_SNAPSHOT_WORKERS', 4))
+
+# queries re-used from the cache / re-run by the last load()
+reused = []
+refreshed = []
+
+# key = query name, value = seconds (last load())
+queryTimes = {}
+
+#
+# Parent: Allele Accession ID/Key/Symbol/Name/Strain/Marker Acc ID/Marker Symbol
+#
+# KOMP, EUCOMM only : existing parents
+# excluding NCOM (for now)
+#		or a.symbol like "%<tm%[ae](NCOM%"
+#		or a.symbol like "%<tm[0-9](NCOM%"
+#
+# includes:  Approved
+#
+parentsFrom = '''
+        from ALL_Allele a, ACC_Accession aa, ACC_Accession am, MRK_Marker m, PRB_Strain s
+        where (lower(a.symbol) ~ '.*<tm([0-9])\(komp.*'
+                or lower(a.symbol) ~ '.*<tm.*([ae])\(komp.*'
+                or lower(a.symbol) ~ '.*<tm([0-9])\(eucomm.*'
+                or lower(a.symbol) ~ '.*<tm.*([ae])\(eucomm.*'
+                )
+        and a._Allele_Status_key in (847114)
+        and a._Allele_key = aa._Object_key
+        and a._Strain_key = s._Strain_key
+        and aa._MGIType_key = 11
+        and aa._LogicalDB_key = 1
+        and aa.prefixPart = 'MGI:'
+        and aa.preferred = 1
+        and a._Marker_key = am._Object_key
+        and am._MGIType_key = 2
+        and am.prefixPart = 'MGI:'
+        and am._LogicalDB_key = 1
+        and am.preferred = 1
+        and a._Marker_key = m._Marker_key
+        '''
+
+def queryParents():
+
+    loadLog.info('querying for parents')
+    return db.sql('''
+        select aa.accID, a._Allele_key, a._Allele_Status_key, a.symbol, a.name, a._Collection_key,
+                s.strain, am.accID as markerID, m.symbol as markerSym
+        %s
+        ''' % (parentsFrom), 'auto')
+
+# KOMP, EUCOMM children (see queryChildren, queryNotes)
+childWhere = '''
+        (lower(a.symbol) ~ '.*<tm.*\..*\(komp.*'
+                or lower(a.symbol) ~ '.*<tm.*b\(komp.*'
+                or lower(a.symbol) ~ '.*<tm.*c\(komp.*'
+                or lower(a.symbol) ~ '.*<tm.*\..*\(eucomm.*'
+                or lower(a.symbol) ~ '.*<tm.*b\(eucomm.*'
+                or lower(a.symbol) ~ '.*<tm.*c\(eucomm.*'
+                )
+        and a._Allele_Status_key in (847114, 847113)
+        '''
+
+#
+# Child: Allele Accession ID/Key/Symbol
+#
+# KOMP, EUCOMM only : existing children
+#	excluding NCOM (for now)
+#		or a.symbol like "%<tm%.%(NCOM%"
+#
+# includes:  Approved, Reserved
+#
+childrenFrom = '''
+        from ALL_Allele a, ACC_Accession aa
+        where %s
+        and a._Allele_key = aa._Object_key
+        and aa._MGIType_key = 11
+        and aa._LogicalDB_key = 1
+        and aa.prefixPart = 'MGI:'
+        and aa.preferred = 1
+        ''' % (childWhere)
+
+def queryChildren():
+
+    loadLog.info('querying for children')
+    return db.sql('''
+        select aa.accID, a._Allele_key, a._Allele_Status_key, a.symbol, a._Collection_key
+        %s
+        ''' % (childrenFrom), 'auto')
+
+#
+# Mutant Cell Lines and their Alleles
+#
+# KOMP, EUCOMM only
+#	excluding NCOM (for now)
+#		or a.symbol like "%<tm%(NCOM%"
+#
+# includes:  Approved, Reserved
+#
+cellLinesFrom = '''
+        from ALL_Allele a, ALL_Allele_CellLine ac, ALL_CellLine c
+        where (lower(a.symbol) ~ '.*<tm.*\(komp.*'
+                or lower(a.symbol) ~ '.*<tm.*\(eucomm.*'
+                )
+        and a._Allele_Status_key in (847114, 847113)
+        and a._Allele_key = ac._Allele_key
+        and ac._MutantCellLine_key = c._CellLine_key
+        '''
+
+def queryCellLines():
+
+    loadLog.info('querying for cell lines')
+    return db.sql('''
+        select a._Allele_key, c._CellLine_key, c.cellLine
+        %s
+        ''' % (cellLinesFrom), 'auto')
+
+#
+# IKMC Notes
+#
+# only the notes of KOMP, EUCOMM children (the only notes makeIKMC.py
+# looks up), not every IKMC Colony note in MGI
+#
+notesFrom = '''
+        from MGI_Note n, ALL_Allele a
+        where n._NoteType_key = %s
+        and n._Object_key = a._Allele_key
+        and %s
+        ''' % (mgiIKMCNoteTypeKey, childWhere)
+
+def queryNotes():
+
+    loadLog.info('quering for ikmc notes')
+    return db.sql('''
+        select n._Note_key, n._Object_key, rtrim(n.note) as note
+        %s
+        ''' % (notesFrom), 'auto')
+
+# key = query name
+# value = (query function, from/where of the query, aliases of the tables it joins)
+queries = {
+    'parents' : (queryParents, parentsFrom, ['a', 'aa', 'am', 'm', 's']),
+    'children' : (queryChildren, childrenFrom, ['a', 'aa']),
+    'cellLines' : (queryCellLines, cellLinesFrom, ['a', 'ac', 'c']),
+    'notes' : (queryNotes, notesFrom, ['n', 'a']),
+    }
+
+#
+# Purpose: run a query, timed
+#
+def runQuery(name):
+
+    startTime = time.time()
+    results = queries[name][0]()
+    queryTimes[name] = round(time.time() - startTime, 3)
+
+    return results
+
+#
+# Purpose: returns the (row count, last modification date) of the rows a
+#	query selects, over all the tables of its join
+# Returns: None if the fingerprint cannot be read (the query is re-run)
+#
+def fingerprint(name):
+
+    fn, fromWhere, aliases = queries[name]
+
+    try:
+        results = db.sql('''
+            select count(*) as rowCount,
+                max(greatest(%s)) as lastModified
+            %s
+            ''' % (', '.join(['%s.modification_date' % (a) for a in aliases]), fromWhere), 'auto')
+    except:
+        loadLog.warning('Cannot read the snapshot fingerprint of %s: the query is re-run', name)
+        return None
+
+    return [results[0]['rowCount'], str(results[0]['lastModified'])]
+
+#
+# Purpose: read the cache file, if it is still valid
+# Returns: the cache, or None
+#
+def readCache(cacheFileName):
+
+    if not cacheFileName or not os.path.exists(cacheFileName):
+        return None
+
+    maxAge = int(os.getenv('IKMC_SNAPSHOT_MAXAGE', snapshotMaxAge))
+    if time.time() - os.path.getmtime(cacheFileName) > maxAge:
+        return None
+
+    try:
+        fp = open(cacheFileName, 'r')
+        cache = json.load(fp)
+        fp.close()
+    except:
+        return None
+
+    return cache
+
+#
+# Purpose: write the cache file
+#
+def writeCache(cacheFileName, fingerprints, snapshot):
+
+    try:
+        fp = open(cacheFileName + '.tmp', 'w')
+        json.dump({'fingerprints' : fingerprints, 'queries' : snapshot}, fp, default = str)
+        fp.close()
+        os.replace(cacheFileName + '.tmp', cacheFileName)
+    except:
+        loadLog.warning('Cannot write snapshot cache file: %s', cacheFileName)
+
+#
+# Purpose: load the snapshot
+#	cacheFileName : optional; the queries whose tables are unchanged
+#	are re-used from this file, the others are re-run
+#	build : optional; build(name, rows) is called for each query as
+#	soon as its rows are available
+# Returns: dictionary, key = query name, value = list of result rows
+#
+def load(cacheFileName = None, build = None):
+
+    del reused[:]
+    del refreshed[:]
+    queryTimes.clear()
+
+    snapshot = {}
+    cache = None
+    fingerprints = {}
+    toRun = []
+
+    pool = ThreadPoolExecutor(max_workers = max(1, workers))
+    try:
+        # the fingerprint queries run while the cache file is read
+        if cacheFileName:
+            futures = dict([(name, pool.submit(fingerprint, name)) for name in queries])
+            cache = readCache(cacheFileName)
+            for name in futures:
+                fingerprints[name] = futures[name].result()
+
+        for name in sorted(queries):
+
+            if cache and name in cache['queries'] and fingerprints[name] is not None \
+                    and cache['fingerprints'].get(name) == fingerprints[name]:
+                snapshot[name] = cache['queries'][name]
+                reused.append(name)
+                if build:
+                    build(name, snapshot[name])
+            else:
+                toRun.append(name)
+
+        futures = dict([(pool.submit(runQuery, name), name) for name in toRun])
+        for f in as_completed(futures):
+            name = futures[f]
+            snapshot[name] = f.result()
+            refreshed.append(name)
+            if build:
+                build(name, snapshot[name])
+    finally:
+        pool.shutdown()
+
+    loadLog.info('snapshot queries (seconds): %s', queryTimes)
+
+    if cacheFileName and refreshed:
+        writeCache(cacheFileName, fingerprints, snapshot)
+
+    if cacheFileName:
+        loadLog.info('snapshot cache: reused %s, refreshed %s', reused, refreshed)
+
+    return snapshot
@@ -0,0 +1,175 @@
+#
+#  ikmcUpdate.py
+###########################################################################
+#
+#  Purpose:
+#
+#      Collects the updates makeAllele.py makes to existing IKMC data and
+#      turns them into set-based SQL.
+#
+#      1) IKMC Colony notes (MGI_Note, _NoteType_key = 1041)
+#
+#         All changes to the same _Note_key are merged in memory, so
+#         each note gets a single write, and all notes are updated by
+#         one statement.
+#
+#      2) Allele Status = Approved (847114) for existing reserved alleles
+#
+#         The allele keys are collected and updated by one array-based
+#         statement per chunk; each chunk is committed on its own so that
+#         lock time stays bounded.
+#
+#      Both updates set modification_date, so that the snapshot cache of
+#      makeIKMC.py sees the change (see ikmcSnapshot.py).
+#
+#  Usage:
+#
+#      import ikmcUpdate
+#      ikmcUpdate.appendNote(noteKey, colony)
+#      ikmcUpdate.appendNote(noteKey, colony, existingNote)
+#      ikmcUpdate.replaceNote(noteKey, note)
+#      cmd = ikmcUpdate.noteSQL()
+#      ikmcUpdate.approveAllele(alleleKey)
+#      counts = ikmcUpdate.applyStatusUpdates(chunkSize)
+#      ikmcUpdate.save(fileName)
+#      ikmcUpdate.load(fileName)
+#
+###########################################################################
+
+import json
+import db
+import lookupCache
+
+approvedStatusKey = 847114
+
+# key = _Note_key
+# value = [note, [colonies]]
+#	note = None : append the colonies to the note text in MGI
+#	note = text : the new note text is note + colonies
+noteUpdates = {}
+
+#
+# key = _Allele_key of the alleles to set to Approved
+statusUpdates = set()
+
+#
+# Purpose: append a colony to a note
+#	existingNote : text of the note when it was read from MGI;
+#	if None, the colony is appended to the note text in MGI
+#
+def appendNote(noteKey, colony, existingNote = None):
+
+    noteKey = int(noteKey)
+
+    if noteKey not in noteUpdates:
+        noteUpdates[noteKey] = [existingNote, []]
+    elif noteUpdates[noteKey][0] is None and existingNote is not None:
+        noteUpdates[noteKey][0] = existingNote
+
+    if colony not in noteUpdates[noteKey][1]:
+        noteUpdates[noteKey][1].append(colony)
+
+#
+# Purpose: replace the text of a note
+#
+def replaceNote(noteKey, note):
+
+    noteKey = int(noteKey)
+    noteUpdates[noteKey] = [note, []]
+
+#
+# Purpose: returns the merged note text of each note
+# Returns: list of (_Note_key, isAppend, note)
+#	isAppend = 1 : note is appended to the note text in MGI
+#
+def mergedNotes():
+
+    notes = []
+
+    for noteKey in sorted(noteUpdates):
+        note, colonies = noteUpdates[noteKey]
+        if note is None:
+            notes.append((noteKey, 1, '|' + '|'.join(colonies)))
+        else:
+            notes.append((noteKey, 0, '|'.join([note] + colonies)))
+
+    return notes
+
+#
+# Purpose: returns one update statement for all notes
+# Returns: '' if there is nothing to update
+#
+def noteSQL():
+
+    notes = mergedNotes()
+
+    if len(notes) == 0:
+        return ''
+
+    values = []
+    for noteKey, isAppend, note in notes:
+        values.append('(%s, %s, %s)' % (noteKey, isAppend, lookupCache.sqlString(note)))
+
+    return '''update MGI_Note n
+        set note = case when v.isAppend = 1 then rtrim(n.note) || v.note else v.note end,
+            modification_date = now()
+        from (values %s) as v(_Note_key, isAppend, note)
+        where n._Note_key = v._Note_key;''' % (',\n'.join(values))
+
+#
+# Purpose: set the Allele Status of an existing allele to Approved
+#
+def approveAllele(alleleKey):
+
+    statusUpdates.add(int(alleleKey))
+
+#
+# Purpose: set Allele Status = Approved for all collected alleles
+#	chunkSize alleles are updated and committed at a time
+# Returns: list of (number of alleles in the chunk, number of rows updated)
+#
+def applyStatusUpdates(chunkSize = 1000):
+
+    counts = []
+    alleleKeys = sorted(statusUpdates)
+    chunkSize = max(1, chunkSize)
+
+    for i in range(0, len(alleleKeys), chunkSize):
+        chunk = alleleKeys[i:i + chunkSize]
+        results = db.sql('''
+            update ALL_Allele set _Allele_Status_key = %s, modification_date = now()
+            where _Allele_key = any(array[%s])
+            returning _Allele_key
+            ''' % (approvedStatusKey, ','.join(map(str, chunk))), 'auto')
+        db.commit()
+        counts.append((len(chunk), len(results)))
+
+    return counts
+
+#
+# Purpose: save the collected updates to a file (see makeAllele.py --resume)
+#
+def save(fileName):
+
+    fp = open(fileName, 'w')
+    json.dump({
+        'notes' : [[k, noteUpdates[k][0], noteUpdates[k][1]] for k in sorted(noteUpdates)],
+        'status' : sorted(statusUpdates),
+        }, fp)
+    fp.close()
+
+#
+# Purpose: load the collected updates from a file
+#
+def load(fileName):
+
+    fp = open(fileName, 'r')
+    updates = json.load(fp)
+    fp.close()
+
+    noteUpdates.clear()
+    for noteKey, note, colonies in updates['notes']:
+        noteUpdates[noteKey] = [note, colonies]
+
+    statusUpdates.clear()
+    statusUpdates.update(updates['status'])
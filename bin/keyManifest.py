@@ -0,0 +1,114 @@
+#
+#  keyManifest.py
+###########################################################################
+#
+#  Purpose:
+#
+#      Keeps the range of primary keys a load used per table, and sets
+#      the table's sequence from that range after the load, instead of
+#      re-scanning the table with max().
+#
+#  Usage:
+#
+#      import keyManifest
+#      keyManifest.addTable('MGI_Note', '_Note_key', 'mgi_note_seq', firstKey, nextKey)
+#      keyManifest.write(fileName)
+#      keyManifest.read(fileName)
+#      results = keyManifest.resyncSequences()
+#
+#  Notes:
+#
+#      The keys of a load are reserved from the sequences before the rows
+#      are written, so after a normal load each sequence is already past
+#      the manifest range and the resync does not move it.  The resync is
+#      a safety net: if the table holds rows the load did not reserve
+#      (e.g. another load, or keys not taken from the sequence), the
+#      sequence is moved past max() of the table.
+#
+#      Before a sequence is set, the key range is checked against the
+#      table (index range scan).  If the table does not hold exactly the
+#      rows of the manifest, the sequence is set from max() of the table.
+#
+#      A sequence is never moved backwards.
+#
+###########################################################################
+
+import json
+import db
+
+# list of dictionaries:
+#	table, keyColumn, sequence
+#	firstKey : first key used
+#	lastKey	 : last key used
+#	rows	 : number of keys used
+manifest = []
+
+#
+# Purpose: add the key range of a table
+#	nextKey is the key after the last key used
+#
+def addTable(table, keyColumn, sequence, firstKey, nextKey):
+
+    manifest.append({
+        'table' : table,
+        'keyColumn' : keyColumn,
+        'sequence' : sequence,
+        'firstKey' : firstKey,
+        'lastKey' : nextKey - 1,
+        'rows' : max(0, nextKey - firstKey),
+        })
+
+#
+# Purpose: write the manifest to a file
+#
+def write(fileName):
+
+    fp = open(fileName, 'w')
+    json.dump(manifest, fp, indent = 1)
+    fp.close()
+
+#
+# Purpose: read the manifest from a file
+#
+def read(fileName):
+
+    fp = open(fileName, 'r')
+    manifest[:] = json.load(fp)
+    fp.close()
+
+#
+# Purpose: set each sequence from the manifest
+# Returns: list of (table, sequence value, method)
+#	sequence value = the value the sequence holds after the resync
+#	method = 'manifest', 'max' or 'unused'
+#
+def resyncSequences():
+
+    results = []
+
+    for m in manifest:
+
+        if m['rows'] == 0:
+            results.append((m['table'], None, 'unused'))
+            continue
+
+        check = db.sql('''
+            select count(*) as rows, max(%s) as lastKey from %s
+            where %s between %s and %s
+            ''' % (m['keyColumn'], m['table'], m['keyColumn'], m['firstKey'], m['lastKey']), 'auto')
+
+        if check[0]['rows'] == m['rows'] and check[0]['lastKey'] == m['lastKey']:
+            lastKey = str(m['lastKey'])
+            method = 'manifest'
+        else:
+            lastKey = '(select max(%s) from %s)' % (m['keyColumn'], m['table'])
+            method = 'max'
+
+        value = db.sql(''' select setval('%s', greatest(%s, (select last_value from %s))) as value ''' \
+                % (m['sequence'], lastKey, m['sequence']), 'auto')
+
+        results.append((m['table'], value[0]['value'], method))
+
+    db.commit()
+
+    return results
@@ -0,0 +1,111 @@
+#
+#  loadLog.py
+###########################################################################
+#
+#  Purpose:
+#
+#      Leveled logging (to stdout, which the wrappers redirect to
+#      ${LOG_DIAG}) and progress lines for the per-row loops.
+#
+#	debug	: per-row trace
+#	info	: steps and progress (default)
+#	warning	: warnings and errors only
+#	error	: always written
+#
+#      A message below LOG_LEVEL is not formatted at all, so the per-row
+#      trace costs next to nothing when it is off.
+#
+#  Usage:
+#
+#      import loadLog
+#      loadLog.debug('line: %s', line)
+#      loadLog.startProgress('reading input file')
+#      for ...:
+#          loadLog.progress(rows)
+#      loadLog.endProgress(rows)
+#
+#  Env Vars:
+#
+#      LOG_LEVEL	optional; debug, info (default), warning or error
+#      LOG_PROGRESS	optional; a progress line every LOG_PROGRESS rows
+#			(default 100000, 0 = none)
+#
+###########################################################################
+
+import os
+import sys
+import time
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+levels = {'debug' : DEBUG, 'info' : INFO, 'warning' : WARNING, 'error' : ERROR}
+
+level = levels.get(os.getenv('LOG_LEVEL', 'info').lower(), INFO)
+progressEvery = int(os.getenv('LOG_PROGRESS', 100000))
+
+progressLabel = ''
+progressStart = 0
+
+#
+# Purpose: write the message at the given level
+#
+def log(msgLevel, msg, args):
+
+    if msgLevel < level:
+        return
+
+    if args:
+        msg = msg % args
+
+    sys.stdout.write(msg + '\n')
+
+def debug(msg, *args):
+    log(DEBUG, msg, args)
+
+def info(msg, *args):
+    log(INFO, msg, args)
+
+def warning(msg, *args):
+    log(WARNING, msg, args)
+
+def error(msg, *args):
+    log(ERROR, msg, args)
+
+def isDebug():
+    return level <= DEBUG
+
+#
+# Purpose: start timing a per-row loop
+#
+def startProgress(label):
+    global progressLabel, progressStart
+
+    progressLabel = label
+    progressStart = time.time()
+    info(label)
+
+#
+# Purpose: a progress line every progressEvery rows
+#
+def progress(rows):
+
+    if progressEvery > 0 and rows % progressEvery == 0:
+        progressLine(rows)
+
+#
+# Purpose: the last progress line of the loop
+#
+def endProgress(rows):
+    progressLine(rows)
+
+def progressLine(rows):
+
+    seconds = time.time() - progressStart
+    rate = 0
+    if seconds > 0:
+        rate = int(rows / seconds)
+
+    info('%s: %s rows processed, %.1f seconds, %s rows/sec', progressLabel, rows, seconds, rate)
@@ -0,0 +1,101 @@
+#
+#  loadMetrics.py
+###########################################################################
+#
+#  Purpose:
+#
+#      Per-stage timing and throughput metrics of a load.
+#
+#      For each stage: wall time, CPU time, rows in/out, rows/second and
+#      the peak RSS of the process at the end of the stage, plus the
+#      increase of each registered counter (e.g. sqlCalls).
+#
+#  Usage:
+#
+#      import loadMetrics
+#      with loadMetrics.stage('processFile') as s:
+#          ...
+#          s['rowsIn'] = lineNum
+#      loadMetrics.write(fileName, 'makeAllele.py')
+#
+#      loadMetrics.counters['sqlCalls'] = sqlProfile.totalCalls
+#
+#  Outputs:
+#
+#      metrics file (json):
+#
+#      program, start, end
+#      stages: list of
+#	stage, rowsIn, rowsOut, wallSeconds, cpuSeconds, rowsPerSecond, peakRSSKB
+#	and one value per counter
+#
+###########################################################################
+
+import os
+import json
+import time
+import resource
+import contextlib
+
+startTime = time.time()
+
+# completed stages, in order
+stages = []
+
+# key = counter name, value = function returning the current count
+# a counter registered during a stage counts from 0
+counters = {}
+
+#
+# Purpose: returns the peak RSS of the process in KB
+#
+def peakRSS():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+#
+# Purpose: time a stage
+#	the caller sets s['rowsIn'] / s['rowsOut']
+#
+@contextlib.contextmanager
+def stage(name):
+
+    s = {'stage' : name, 'rowsIn' : 0, 'rowsOut' : 0}
+    counterStart = dict([(c, counters[c]()) for c in counters])
+    wallStart = time.time()
+    cpuStart = time.process_time()
+
+    try:
+        yield s
+    finally:
+        s['wallSeconds'] = round(time.time() - wallStart, 3)
+        s['cpuSeconds'] = round(time.process_time() - cpuStart, 3)
+        rows = max(s['rowsIn'], s['rowsOut'])
+        if s['wallSeconds'] > 0:
+            s['rowsPerSecond'] = round(rows / s['wallSeconds'], 1)
+        else:
+            s['rowsPerSecond'] = None
+        s['peakRSSKB'] = peakRSS()
+        for c in counters:
+            s[c] = counters[c]() - counterStart.get(c, 0)
+        stages.append(s)
+
+#
+# Purpose: write the metrics file
+#
+def write(fileName, program):
+
+    metrics = {
+        'program' : program,
+        'start' : time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(startTime)),
+        'end' : time.strftime('%Y-%m-%d %H:%M:%S'),
+        'wallSeconds' : round(time.time() - startTime, 3),
+        'peakRSSKB' : peakRSS(),
+        'stages' : stages,
+        }
+
+    try:
+        fp = open(fileName, 'w')
+        json.dump(metrics, fp, indent = 1)
+        fp.close()
+    except:
+        print('Cannot write metrics file: ' + fileName)
@@ -0,0 +1,383 @@
+#
+#  lookupCache.py
+###########################################################################
+#
+#  Purpose:
+#
+#      In-memory lookups used by makeAllele.py so that the per-row
+#      verification of the input file does not go back to the database
+#      for every field of every row.
+#
+#      1) vocabulary terms (VOC_Term) for a fixed set of vocabularies,
+#         loaded once at startup by a single query
+#
+#      2) users, markers, strains and references; the distinct values
+#         found in the input file are resolved by one set-based query
+#         per entity type
+#
+#      3) mutant cell lines; the distinct cell lines of the input file are
+#         resolved by one set-based query, any later lookup goes through a
+#         bounded LRU
+#
+#  Usage:
+#
+#      import lookupCache
+#      lookupCache.loadTerms([37, 38], cacheFileName)
+#      termKey = lookupCache.verifyTerm(37, 'Approved', lineNum, errorFile)
+#      lookupCache.loadMarkers(['MGI:95661'])
+#      markerKey = lookupCache.verifyMarker('MGI:95661', lineNum, errorFile)
+#
+#  Env Vars:
+#
+#      TERM_CACHE_FILE	 optional; local copy of the term lookup
+#      TERM_CACHE_MAXAGE optional; max age of TERM_CACHE_FILE in seconds
+#      CELLLINE_LRU_SIZE optional; size of the late cell line lookup LRU
+#
+#  Notes:
+#
+#      A term/user/marker/strain/reference that is not found in the cache
+#      is passed to loadlib (sourceloadlib) so that the error is reported
+#      exactly as loadlib reports it.
+#
+#      The local copy of the term lookup is only re-used if it is younger
+#      than TERM_CACHE_MAXAGE and the count/last modification date of the
+#      vocabularies still match the database.
+#
+###########################################################################
+
+import os
+import json
+import time
+import functools
+import db
+import loadlib
+import sourceloadlib
+
+# key = (vocabKey, term)
+# value = _Term_key
+termLookup = {}
+
+# vocabularies in termLookup
+termVocabs = []
+
+termCacheMaxAge = 86400
+
+# key = MGI_User.login, value = _User_key
+userLookup = {}
+
+# key = marker MGI ID, value = _Marker_key
+markerLookup = {}
+
+# key = PRB_Strain.strain, value = _Strain_key
+strainLookup = {}
+
+# key = J:, value = _Refs_key
+referenceLookup = {}
+
+# key = mutant ALL_CellLine.cellLine, value = _CellLine_key
+cellLineLookup = {}
+
+# number of values per set-based query
+bulkChunkSize = 1000
+
+# number of set-based queries issued by the load*() functions
+bulkQueryCount = 0
+
+#
+# Purpose: returns a quoted SQL string literal
+#
+def sqlString(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+#
+# Purpose: run a query for a set of values
+#	cmd contains one '%s' that is replaced by the (quoted) list of values
+#	large sets are split into chunks of bulkChunkSize values
+# Returns: list of result rows
+#
+def bulkQuery(cmd, values):
+
+    global bulkQueryCount
+
+    results = []
+    values = sorted(set(values) - set(['']))
+
+    for i in range(0, len(values), bulkChunkSize):
+        chunk = values[i:i + bulkChunkSize]
+        results = results + db.sql(cmd % (','.join(map(sqlString, chunk))), 'auto')
+        bulkQueryCount += 1
+
+    return results
+
+#
+# Purpose: returns the (count, last modification date) of the vocabularies
+#
+def termFingerprint(vocabKeys):
+
+    results = db.sql('''
+        select count(*) as termCount, max(modification_date) as lastModified
+        from VOC_Term
+        where _Vocab_key in (%s)
+        ''' % (','.join(map(str, vocabKeys))), 'auto')
+
+    return [results[0]['termCount'], str(results[0]['lastModified'])]
+
+#
+# Purpose: read the local copy of the term lookup, if it is still valid
+# Returns: 1 if the lookup was loaded from the file, else 0
+#
+def readTermCache(cacheFileName, vocabKeys, fingerprint):
+
+    if not cacheFileName or not os.path.exists(cacheFileName):
+        return 0
+
+    maxAge = int(os.getenv('TERM_CACHE_MAXAGE', termCacheMaxAge))
+    if time.time() - os.path.getmtime(cacheFileName) > maxAge:
+        return 0
+
+    try:
+        fp = open(cacheFileName, 'r')
+        cache = json.load(fp)
+        fp.close()
+    except:
+        return 0
+
+    if cache.get('vocabs') != vocabKeys or cache.get('fingerprint') != fingerprint:
+        return 0
+
+    for vocabKey, term, termKey in cache['terms']:
+        termLookup[(vocabKey, term)] = termKey
+
+    return 1
+
+#
+# Purpose: write the local copy of the term lookup
+#
+def writeTermCache(cacheFileName, vocabKeys, fingerprint):
+
+    cache = {
+        'vocabs' : vocabKeys,
+        'fingerprint' : fingerprint,
+        'terms' : [[k[0], k[1], termLookup[k]] for k in termLookup],
+        }
+
+    try:
+        fp = open(cacheFileName, 'w')
+        json.dump(cache, fp)
+        fp.close()
+    except:
+        print('Cannot write term cache file: ' + cacheFileName)
+
+#
+# Purpose: load all terms of the given vocabularies
+# Returns: number of terms loaded
+#
+def loadTerms(vocabKeys, cacheFileName = None):
+
+    global termVocabs
+
+    vocabKeys = sorted(vocabKeys)
+    termVocabs = vocabKeys
+    termLookup.clear()
+
+    if cacheFileName:
+        fingerprint = termFingerprint(vocabKeys)
+        if readTermCache(cacheFileName, vocabKeys, fingerprint):
+            return len(termLookup)
+
+    results = db.sql('''
+        select _Vocab_key, _Term_key, term
+        from VOC_Term
+        where _Vocab_key in (%s)
+        ''' % (','.join(map(str, vocabKeys))), 'auto')
+
+    for r in results:
+        termLookup[(r['_Vocab_key'], r['term'])] = r['_Term_key']
+
+    if cacheFileName:
+        writeTermCache(cacheFileName, vocabKeys, fingerprint)
+
+    return len(termLookup)
+
+#
+# Purpose: returns the _Term_key of the term
+# Returns: 0 if the term is invalid (the error is written by loadlib)
+#
+def verifyTerm(vocabKey, term, lineNum, errorFile):
+
+    key = (vocabKey, term)
+
+    if key in termLookup:
+        return termLookup[key]
+
+    return loadlib.verifyTerm('', vocabKey, term, lineNum, errorFile)
+
+#
+# Purpose: load the _CellLine_key of each mutant cell line
+#	(isMutant = 1 and a derivation exists)
+#
+def loadCellLines(cellLines):
+
+    results = bulkQuery('''
+        select _CellLine_key, cellLine
+        from ALL_CellLine
+        where cellLine in (%s)
+        and isMutant = 1
+        and _Derivation_key is not null
+        ''', cellLines)
+
+    for r in results:
+        cellLineLookup[r['cellLine']] = r['_CellLine_key']
+
+    return len(cellLineLookup)
+
+#
+# Purpose: query the _CellLine_key of a mutant cell line that was not
+#	loaded by loadCellLines()
+# Returns: 0 if the cell line does not exist
+#
+@functools.lru_cache(maxsize = int(os.getenv('CELLLINE_LRU_SIZE', 1024)))
+def queryCellLine(cellLine):
+
+    cellLineKey = 0
+
+    results = db.sql('''
+        select _CellLine_key from ALL_CellLine
+        where isMutant = 1 and _Derivation_key is not null
+        and cellLine = %s
+        ''' % (sqlString(cellLine)), 'auto')
+
+    for r in results:
+        cellLineKey = r['_CellLine_key']
+
+    return cellLineKey
+
+#
+# Purpose: returns the _CellLine_key of a mutant cell line
+# Returns: 0 if the cell line does not exist
+#
+def getCellLine(cellLine):
+
+    if cellLine in cellLineLookup:
+        return cellLineLookup[cellLine]
+
+    return queryCellLine(cellLine)
+
+#
+# Purpose: load the _User_key of each login
+#
+def loadUsers(logins):
+
+    results = bulkQuery('''
+        select _User_key, login
+        from MGI_User
+        where login in (%s)
+        ''', logins)
+
+    for r in results:
+        userLookup[r['login']] = r['_User_key']
+
+    return len(userLookup)
+
+#
+# Purpose: load the _Marker_key of each marker MGI ID
+#	only official markers are loaded; anything else is left to loadlib
+#
+def loadMarkers(markerIDs):
+
+    results = bulkQuery('''
+        select a.accID, a._Object_key
+        from ACC_Accession a, MRK_Marker m
+        where a.accID in (%s)
+        and a._MGIType_key = 2
+        and a._LogicalDB_key = 1
+        and a.prefixPart = 'MGI:'
+        and a.preferred = 1
+        and a._Object_key = m._Marker_key
+        and m._Marker_Status_key = 1
+        ''', markerIDs)
+
+    for r in results:
+        markerLookup[r['accID']] = r['_Object_key']
+
+    return len(markerLookup)
+
+#
+# Purpose: load the _Strain_key of each strain
+#
+def loadStrains(strains):
+
+    results = bulkQuery('''
+        select _Strain_key, strain
+        from PRB_Strain
+        where strain in (%s)
+        ''', strains)
+
+    for r in results:
+        strainLookup[r['strain']] = r['_Strain_key']
+
+    return len(strainLookup)
+
+#
+# Purpose: load the _Refs_key of each J:
+#
+def loadReferences(jnums):
+
+    results = bulkQuery('''
+        select accID, _Object_key
+        from ACC_Accession
+        where accID in (%s)
+        and _MGIType_key = 1
+        and _LogicalDB_key = 1
+        and prefixPart = 'J:'
+        and preferred = 1
+        ''', jnums)
+
+    for r in results:
+        referenceLookup[r['accID']] = r['_Object_key']
+
+    return len(referenceLookup)
+
+#
+# Purpose: returns the _User_key of the login
+# Returns: 0 if the login is invalid (the error is written by loadlib)
+#
+def verifyUser(login, lineNum, errorFile):
+
+    if login in userLookup:
+        return userLookup[login]
+
+    return loadlib.verifyUser(login, lineNum, errorFile)
+
+#
+# Purpose: returns the _Marker_key of the marker MGI ID
+# Returns: 0 if the marker is invalid (the error is written by loadlib)
+#
+def verifyMarker(markerID, lineNum, errorFile):
+
+    if markerID in markerLookup:
+        return markerLookup[markerID]
+
+    return loadlib.verifyMarker(markerID, lineNum, errorFile)
+
+#
+# Purpose: returns the _Strain_key of the strain
+# Returns: 0 if the strain is invalid (the error is written by sourceloadlib)
+#
+def verifyStrain(strain, lineNum, errorFile):
+
+    if strain in strainLookup:
+        return strainLookup[strain]
+
+    return sourceloadlib.verifyStrain(strain, lineNum, errorFile)
+
+#
+# Purpose: returns the _Refs_key of the J:
+# Returns: 0 if the J: is invalid (the error is written by loadlib)
+#
+def verifyReference(jnum, lineNum, errorFile):
+
+    if jnum in referenceLookup:
+        return referenceLookup[jnum]
+
+    return loadlib.verifyReference(jnum, lineNum, errorFile)
@@ -11,37 +11,21 @@
 #
 # Usage:
 #	makeAllele.py
+#	makeAllele.py --resume
+#
+#	--resume : re-run the load phase of a previous run from the files in
+#	OUTPUTDIR; only the tables that were not loaded are bcp-ed, then the
+#	IKMC updates and the sequence resync are applied if not yet done
+#
+#	a run without --resume removes the checkpoint of the previous run;
+#	--resume refuses a bcp file newer than the checkpoint
 #
 # Envvars:
 #
 # Inputs:
 #
-#	A tab-delimited file in the format:
-#
-#	field 1:  MGI Marker ID
-#	field 2:  Allele Symbol
-#	field 3:  Allele Name
-#	field 4:  Allele Status
-#	field 5:  Allele Generation (Type)
-#	field 6:  Allele Subtype (currently not used)
-#	field 7:  Allele Collection (currently not used)
-#	field 8:  Germ Line Transmission
-#	field 9:  Reference Type/J#
-#	field 10: Strain of Origin
-#	field 11: Mutant Cell Line ID
-#	field 12: Molecular Notes (_NoteType_key = 1021)
-#	field 13: Driver Gene (MGI_Relationship._Category_key = 1006/_Object_key_2 = marker)
-#	field 14: IKMC Colony Name (_NoteType_key = 1041)
-#	field 15: Molecular Mutation
-#	field 16: Inheritance Mode
-#	field 17: Mixed
-#	field 18: Extinct
-#	field 19: Created By
-#	field 20: Add mutant cell line
-#	field 21: Add IKMC Colony Note
-#	field 22: Set the child's Allele Status = Approved (847114)
-#       field 23: Allele MGI ID (if child allele already exists)
-#       field 24: Allele Symbol minus Marker Symbol (for IKMC format)
+#	The general-Allele input file ($INPUTFILE); see alleleRecord.py
+#	for its 24 tab-delimited fields
 #
 # Outputs:
 #
@@ -57,7 +41,19 @@
 #       ACC_Accession.bcp               Accession records
 #       ACC_AccessionReference.bcp      Accession Reference records
 #
-#       Diagnostics file of all input parameters and SQL commands
+#       If LOAD_MODE = copy, the rows are streamed into the tables
+#       (copy from stdin) and the BCP files are only written if COPY_TEE = 1
+#
+#       Key manifest (key ranges used per table)
+#
+#       Checkpoint for --resume: load status per table/step (.status) and
+#       the collected IKMC updates (.ikmc)
+#
+#       Metrics file (makeAllele.metrics.json): wall/CPU time, rows in/out,
+#       rows/sec and peak RSS per stage
+#
+#       Diagnostics file of all input parameters and the SQL profile
+#       (or all SQL commands if SQL_LOG = all)
 #       Error file
 #	New file (input + new accession ids)
 #
@@ -65,7 +61,12 @@
 #
 # Assumes:
 #
-#	That no one else is adding such records to the database.
+#	That the database has acc_accession_seq and the other key sequences;
+#	all keys and MGI ids are reserved from them (see setPrimaryKeys).
+#
+#	The reserved keys and MGI ids are used up even if the run fails
+#	later (sequences/ACC_AccessionMax are not rolled back); a failed run
+#	leaves a gap in the keys and MGI ids.
 #
 # Bugs:
 #
@@ -92,10 +93,18 @@
 
 import sys
 import os
+import json
 import db
 import mgi_utils
 import loadlib
-import sourceloadlib
+import lookupCache
+import bcpLoader
+import copyLoader
+import ikmcUpdate
+import keyManifest
+import loadMetrics
+import sqlProfile
+import alleleRecord
 
 #globals
 
@@ -108,6 +117,26 @@ inputFileName = os.environ['INPUTFILE']
 outputDir = os.environ['OUTPUTDIR']
 jnum = os.environ['JNUMBER']
 BCP_COMMAND = os.environ['PG_DBUTILS'] + '/bin/bcpin.csh'
+termCacheFileName = os.getenv('TERM_CACHE_FILE')
+bcpWorkers = int(os.getenv('BCP_WORKERS', 4))
+
+# LOAD_MODE = bcp : write the .bcp files and bcp them (bcpin.csh)
+# LOAD_MODE = copy : stream the rows into the database (copy from stdin)
+# COPY_TEE = 1 : in copy mode, also write the .bcp files
+loadMode = os.getenv('LOAD_MODE', 'bcp')
+copyTee = os.getenv('COPY_TEE', '0') == '1'
+
+# SQL_LOG = profile : aggregated SQL profile at exit (default)
+# SQL_LOG = all : log every SQL statement to the diagnostics file
+# SQL_LOG = none : no SQL logging
+sqlLog = os.getenv('SQL_LOG', 'profile')
+sqlProfileTop = int(os.getenv('SQL_PROFILE_TOP', 20))
+
+# number of Allele Status updates per transaction
+statusChunkSize = int(os.getenv('STATUS_CHUNK_SIZE', 1000))
+
+# resume the load phase of a previous run
+resume = '--resume' in sys.argv
 
 DEBUG = 0		# if 0, not in debug mode
 
@@ -135,6 +164,10 @@ accRefTable = 'ACC_AccessionReference'
 noteTable = 'MGI_Note'
 annotTable = 'VOC_Annot'
 
+# tables, in bcp order
+bcpTableNames = [alleleTable, mutationTable, mutantTable, refTable, \
+                 accTable, accRefTable, noteTable, annotTable]
+
 alleleFileName = outputDir + '/' + alleleTable + '.bcp'
 mutationFileName = outputDir + '/' + mutationTable + '.bcp'
 mutantFileName =  outputDir + '/' + mutantTable + '.bcp'
@@ -147,6 +180,12 @@ annotFileName = outputDir + '/' + annotTable + '.bcp'
 diagFileName = ''	# diagnostic file name
 errorFileName = ''	# error file name
 newAlleleFileName = ''	# output file with new accession ids
+keyManifestFileName = ''	# key ranges used by this load
+loadStatusFileName = ''	# load status per table/step (checkpoint)
+ikmcUpdateFileName = ''	# collected IKMC updates (checkpoint)
+metricsFileName = outputDir + '/makeAllele.metrics.json'	# per-stage metrics
+metricsProgram = 'makeAllele.py'
+loadedRows = 0		# number of rows bcp-ed/copied
 
 alleleKey = 0           # ALL_Allele._Allele_key
 mutantionKey = 0 	# ALL_Allele_Mutation.bcp._Assoc_key
@@ -159,7 +198,6 @@ annotKey = 0		# VOC_Annot._Annot_key
 mgiNoteObjectKey = 11   # MGI_Note._MGIType_key
 mgiMolecularNoteTypeKey = 1021   # MGI_Note._NoteType_key
 mgiIKMCNoteTypeKey = 1041   	 # MGI_Note._NoteType_key
-ikmcSQLs = []
 
 mgiTypeKey = 11		# Allele
 mgiPrefix = 'MGI:'
@@ -170,6 +208,24 @@ qualifierKey = 1614158
 # value = (alleleKey, noteKey, mgiKey)
 alleleLookup = {}
 
+# lines of the input file
+inputLines = []
+
+# number of keys needed by processFile(), by key (see countKeys)
+keyCounts = {}
+
+# first key reserved by setPrimaryKeys(), by key
+firstKeys = {}
+
+# key = table name or load step ('notes', 'status', 'resync')
+# value = 'pending', 'loaded' (table), 'failed' (table), 'done' (step)
+loadStatus = {}
+
+# vocabularies verified by processFile()
+# 35 (Inheritance Mode), 36 (Molecular Mutation), 37 (Allele Status)
+# 38 (Allele Type), 61 (Allele Transmission), 93 (Allele Subtype)
+termVocabKeys = [35, 36, 37, 38, 61, 93]
+
 loaddate = loadlib.loaddate
 
 #
@@ -184,27 +240,35 @@ def exit(
         sys.stderr.write('\n' + str(message) + '\n')
  
     try:
+        if sqlLog == 'profile':
+            diagFile.write('\n' + sqlProfile.summary(sqlProfileTop))
         diagFile.write('\n\nEnd Date/Time: %s\n' % (mgi_utils.date()))
         errorFile.write('\n\nEnd Date/Time: %s\n' % (mgi_utils.date()))
         diagFile.close()
         errorFile.close()
-        inputFile.close()
         newAlleleFile.close()
+        if inputFile:
+            inputFile.close()
     except:
         print('issued closing files from exit function')
         pass
 
+    loadMetrics.write(metricsFileName, metricsProgram)
+
     db.useOneConnection(0)
     sys.exit(status)
  
 #
 # Purpose: process command line options
+#	readInputFile = 0 : the input lines are passed to preprocessFile()
+#	(see makeIKMCAllele.py)
 #
-def initialize():
+def initialize(readInputFile = 1):
     global diagFile, errorFile, inputFile, errorFileName, diagFileName
     global alleleFile, mutationFile, mutantFile, refFile
     global accFile, accRefFile, noteFile, annotFile
-    global newAlleleFile
+    global newAlleleFile, keyManifestFileName
+    global loadStatusFileName, ikmcUpdateFileName
     
     db.useOneConnection(1)
     db.set_sqlUser(user)
@@ -215,75 +279,120 @@ def initialize():
     diagFileName = outputDir + '/' + tail + '.diagnostics'
     errorFileName = outputDir + '/' + tail + '.error'
     newAlleleFileName = outputDir + '/' + tail + '.new'
+    keyManifestFileName = outputDir + '/' + tail + '.keys'
+    loadStatusFileName = outputDir + '/' + tail + '.status'
+    ikmcUpdateFileName = outputDir + '/' + tail + '.ikmc'
+
+    # the checkpoint of a previous run does not match the files of this run
+    if not resume:
+        for fileName in [loadStatusFileName, keyManifestFileName, ikmcUpdateFileName]:
+            try:
+                if os.path.exists(fileName):
+                    os.remove(fileName)
+            except:
+                exit(1, 'Could not remove file %s\n' % fileName)
+
+    # a resumed run appends to the files of the previous run
+    if resume:
+        fileMode = 'a'
+    else:
+        fileMode = 'w'
 
     try:
-        diagFile = open(diagFileName, 'w')
+        diagFile = open(diagFileName, fileMode)
     except:
         exit(1, 'Could not open file %s\n' % diagFileName)
                 
     try:
-        errorFile = open(errorFileName, 'w')
+        errorFile = open(errorFileName, fileMode)
     except:
         exit(1, 'Could not open file %s\n' % errorFileName)
                 
     try:
-        newAlleleFile = open(newAlleleFileName, 'w')
+        newAlleleFile = open(newAlleleFileName, fileMode)
     except:
         exit(1, 'Could not open file %s\n' % newAlleleFileName)
 
-    try:
-        inputFile = open(inputFileName, 'r')
-    except:
-        exit(1, 'Could not open file %s\n' % inputFileName)
+    # Log all SQL, or profile it
+    if sqlLog == 'all':
+        db.set_sqlLogFunction(db.sqlLogAll)
+    elif sqlLog == 'profile':
+        sqlProfile.enable()
+        loadMetrics.counters['sqlCalls'] = sqlProfile.totalCalls
+
+    diagFile.write('Start Date/Time: %s\n' % (mgi_utils.date()))
+    diagFile.write('Server: %s\n' % (db.get_sqlServer()))
+    diagFile.write('Database: %s\n' % (db.get_sqlDatabase()))
+
+    errorFile.write('Start Date/Time: %s\n\n' % (mgi_utils.date()))
+
+    # the bcp files of the previous run are re-used
+    if resume:
+        diagFile.write('Resume: %s\n' % (loadStatusFileName))
+        return
+
+    if readInputFile:
+        try:
+            inputFile = open(inputFileName, 'r')
+        except:
+            exit(1, 'Could not open file %s\n' % inputFileName)
 
     try:
-        alleleFile = open(alleleFileName, 'w')
+        alleleFile = openBcpFile(alleleTable, alleleFileName)
     except:
         exit(1, 'Could not open file %s\n' % alleleFileName)
 
     try:
-        mutationFile = open(mutationFileName, 'w')
+        mutationFile = openBcpFile(mutationTable, mutationFileName)
     except:
         exit(1, 'Could not open file %s\n' % mutationFileName)
 
     try:
-        mutantFile = open(mutantFileName, 'w')
+        mutantFile = openBcpFile(mutantTable, mutantFileName)
     except:
         exit(1, 'Could not open file %s\n' % mutantFileName)
 
     try:
-        refFile = open(refFileName, 'w')
+        refFile = openBcpFile(refTable, refFileName)
     except:
         exit(1, 'Could not open file %s\n' % refFileName)
 
     try:
-        accFile = open(accFileName, 'w')
+        accFile = openBcpFile(accTable, accFileName)
     except:
         exit(1, 'Could not open file %s\n' % accFileName)
 
     try:
-        accRefFile = open(accRefFileName, 'w')
+        accRefFile = openBcpFile(accRefTable, accRefFileName)
     except:
         exit(1, 'Could not open file %s\n' % accRefFileName)
 
     try:
-        noteFile = open(noteFileName, 'w')
+        noteFile = openBcpFile(noteTable, noteFileName)
     except:
         exit(1, 'Could not open file %s\n' % noteFileName)
 
     try:
-        annotFile = open(annotFileName, 'w')
+        annotFile = openBcpFile(annotTable, annotFileName)
     except:
         exit(1, 'Could not open file %s\n' % annotFileName)
 
-    # Log all SQL
-    db.set_sqlLogFunction(db.sqlLogAll)
+    # load the vocabulary terms used by processFile()
+    termCount = lookupCache.loadTerms(termVocabKeys, termCacheFileName)
+    diagFile.write('Terms loaded: %s\n' % (termCount))
 
-    diagFile.write('Start Date/Time: %s\n' % (mgi_utils.date()))
-    diagFile.write('Server: %s\n' % (db.get_sqlServer()))
-    diagFile.write('Database: %s\n' % (db.get_sqlDatabase()))
+#
+# Purpose: open the bcp file of a table
+#	in copy mode, the rows are streamed into the table instead
+#
+def openBcpFile(table, fileName):
 
-    errorFile.write('Start Date/Time: %s\n\n' % (mgi_utils.date()))
+    if loadMode == 'copy':
+        if copyTee:
+            return copyLoader.openTable(table, fileName)
+        return copyLoader.openTable(table)
+
+    return open(fileName, 'w')
 
 #
 # Purpose: Close files.
@@ -299,36 +408,303 @@ def closeFiles():
     noteFile.close()
     annotFile.close()
 
+#
+# Purpose:  reserves a block of keys from a sequence
+# Returns:  the first key of the block (0 if count = 0)
+#
+# the sequence is advanced by count in one step (alter sequence blocks
+# any concurrent nextval() until commit), so the block is never
+# used by anyone else
+#
+def reserveKeys(sequence, count):
+
+    if count == 0:
+        return 0
+
+    db.sql(''' alter sequence %s increment by %d ''' % (sequence, count), None)
+    results = db.sql(''' select nextval('%s') as lastKey ''' % (sequence), 'auto')
+    db.sql(''' alter sequence %s increment by 1 ''' % (sequence), None)
+    db.commit()
+
+    return results[0]['lastKey'] - count + 1
+
+#
+# Purpose:  reserves a block of accession keys
+# Returns:  the first key of the block (0 if count = 0)
+#
+# requires acc_accession_seq: without it, the block could not be reserved
+# and a concurrent load could use the same keys
+#
+def reserveAccessionKeys(count):
+
+    if count == 0:
+        return 0
+
+    results = db.sql(''' select to_regclass('acc_accession_seq') is not null as hasSeq ''', 'auto')
+    if not results[0]['hasSeq']:
+        exit(1, 'acc_accession_seq does not exist; the accession keys cannot be reserved')
+
+    return reserveKeys('acc_accession_seq', count)
+
+#
+# Purpose:  reserves a block of MGI ids (ACC_AccessionMax.maxNumericPart)
+# Returns:  the first numeric part of the block (0 if count = 0)
+#
+def reserveMGIIDs(count):
+
+    if count == 0:
+        return 0
+
+    results = db.sql('''
+        update ACC_AccessionMax set maxNumericPart = maxNumericPart + %d
+        where prefixPart = '%s'
+        returning maxNumericPart
+        ''' % (count, mgiPrefix), 'auto')
+    db.commit()
+
+    return results[0]['maxNumericPart'] - count + 1
+
 #
 # Purpose:  sets global primary key variables
 #
+# reserves exactly the number of keys counted by countKeys()
+#
 def setPrimaryKeys():
 
     global alleleKey, refAssocKey, accKey, noteKey, mgiKey, mutationKey, mutantKey, annotKey
 
-    results = db.sql(''' select nextval('all_allele_seq') as maxKey ''', 'auto')
-    alleleKey = results[0]['maxKey']
+    alleleKey = reserveKeys('all_allele_seq', keyCounts['allele'])
+    refAssocKey = reserveKeys('mgi_reference_assoc_seq', keyCounts['reference'])
+    accKey = reserveAccessionKeys(keyCounts['accession'])
+    noteKey = reserveKeys('mgi_note_seq', keyCounts['note'])
+    mgiKey = reserveMGIIDs(keyCounts['mgiID'])
+    mutationKey = reserveKeys('all_allele_mutation_seq', keyCounts['mutation'])
+    mutantKey = reserveKeys('all_allele_cellline_seq', keyCounts['cellLine'])
+    annotKey = reserveKeys('voc_annot_seq', keyCounts['annot'])
+
+    firstKeys['allele'] = alleleKey
+    firstKeys['reference'] = refAssocKey
+    firstKeys['note'] = noteKey
+    firstKeys['mutation'] = mutationKey
+    firstKeys['cellLine'] = mutantKey
+    firstKeys['annot'] = annotKey
+
+    for k in sorted(keyCounts):
+        diagFile.write('Keys reserved: %s %s\n' % (k, keyCounts[k]))
+
+#
+# Purpose:  records the status of a table as soon as it is bcp-ed
+#	(so that --resume does not bcp a loaded table again)
+#
+def bcpDone(r):
+
+    if r['status'] == 0:
+        loadStatus[r['table']] = 'loaded'
+    elif r['status'] is not None:
+        loadStatus[r['table']] = 'failed'
+
+    writeLoadStatus()
+
+#
+# Purpose:  BCPs the bcp files of the given tables into the database
+#
+def bcpTables(tables):
+
+    global loadedRows
+
+    bcpI = '%s %s %s' % (BCP_COMMAND, db.get_sqlServer(), db.get_sqlDatabase())
+    bcpII = '"|" "\\n" mgd'
+
+    # ALL_Allele first; then the tables that only depend on ALL_Allele;
+    # ACC_AccessionReference last, it depends on ACC_Accession
+    stages = [[alleleTable], \
+              [mutationTable, mutantTable, refTable, accTable, noteTable, annotTable], \
+              [accRefTable]]
+
+    bcpFileNames = {
+        alleleTable : alleleFileName,
+        mutationTable : mutationFileName,
+        mutantTable : mutantFileName,
+        refTable : refFileName,
+        accTable : accFileName,
+        accRefTable : accRefFileName,
+        noteTable : noteFileName,
+        annotTable : annotFileName,
+        }
+
+    bcpStages = []
+    for stage in stages:
+        bcpStage = []
+        for table in stage:
+            if table not in tables:
+                continue
+            bcpCmd = '%s %s "/" %s %s' % (bcpI, table, bcpFileNames[table], bcpII)
+            diagFile.write('%s\n' % bcpCmd)
+            bcpStage.append((table, bcpFileNames[table], bcpCmd))
+        bcpStages.append(bcpStage)
 
-    results = db.sql(''' select nextval('mgi_reference_assoc_seq') as maxKey ''', 'auto')
-    refAssocKey = results[0]['maxKey']
+    db.commit()
 
-    results = db.sql('select max(_Accession_key) + 1 as maxKey from ACC_Accession', 'auto')
-    accKey = results[0]['maxKey']
+    results = bcpLoader.bcpStages(bcpStages, bcpWorkers, bcpDone)
 
-    results = db.sql(''' select nextval('mgi_note_seq') as maxKey ''', 'auto')
-    noteKey = results[0]['maxKey']
+    for r in results:
+        loadedRows += r['rows']
+        diagFile.write(r['output'])
+        diagFile.write('%s: status %s, %s rows, %.2f seconds\n' \
+                % (r['table'], r['status'], r['rows'], r['seconds']))
 
-    results = db.sql(''' select max(maxNumericPart) + 1 as maxKey from ACC_AccessionMax where prefixPart = '%s' ''' % (mgiPrefix), 'auto')
-    mgiKey = results[0]['maxKey']
+    if bcpLoader.anyFailed(results):
+        failedTables = [r['table'] for r in results if r['status'] != 0]
+        exit(1, 'bcp failed for: %s' % (', '.join(failedTables)))
 
-    results = db.sql(''' select nextval('all_allele_mutation_seq') as maxKey ''', 'auto')
-    mutationKey = results[0]['maxKey']
+#
+# Purpose:  copy the remaining streamed rows into the database (LOAD_MODE = copy)
+#
+def copyFiles():
 
-    results = db.sql(''' select nextval('all_allele_cellline_seq') as maxKey ''', 'auto')
-    mutantKey = results[0]['maxKey']
+    global loadedRows
 
-    results = db.sql(''' select nextval('voc_annot_seq') as maxKey ''', 'auto')
-    annotKey = results[0]['maxKey']
+    try:
+        closeFiles()
+    except Exception as e:
+        exit(1, 'copy failed: %s' % (e))
+
+    for t in copyLoader.tables:
+        loadedRows += t.rows
+        diagFile.write('%s: copied %s rows\n' % (t.table, t.rows))
+
+    try:
+        copyLoader.commit()
+    except Exception as e:
+        exit(1, 'copy failed: %s' % (e))
+
+    for table in bcpTableNames:
+        loadStatus[table] = 'loaded'
+
+    writeLoadStatus()
+
+#
+# Purpose:  applies the updates to existing IKMC data (see processFileIKMC)
+#
+def applyIKMCUpdates():
+
+    # one statement for all IKMC Colony note updates
+    if loadStatus['notes'] != 'done':
+        noteSQL = ikmcUpdate.noteSQL()
+        if len(noteSQL) > 0:
+            # the statement itself is logged only if SQL_LOG = all
+            diagFile.write('IKMC Colony note update: %s notes, %s bytes\n' \
+                    % (len(ikmcUpdate.mergedNotes()), len(noteSQL)))
+            db.sql(noteSQL, None)
+            db.commit()
+        loadStatus['notes'] = 'done'
+        writeLoadStatus()
+
+    # Allele Status = Approved, in chunks
+    if loadStatus['status'] != 'done':
+        counts = ikmcUpdate.applyStatusUpdates(statusChunkSize)
+        for i in range(len(counts)):
+            diagFile.write('Allele Status chunk %s: %s alleles, %s rows updated\n' \
+                    % (i + 1, counts[i][0], counts[i][1]))
+        loadStatus['status'] = 'done'
+        writeLoadStatus()
+
+#
+# Purpose:  writes the key ranges used by processFile() to the key manifest
+#
+def writeKeyManifest():
+
+    keyManifest.addTable(alleleTable, '_Allele_key', 'all_allele_seq', firstKeys['allele'], alleleKey)
+    keyManifest.addTable(refTable, '_Assoc_key', 'mgi_reference_assoc_seq', firstKeys['reference'], refAssocKey)
+    keyManifest.addTable(noteTable, '_Note_key', 'mgi_note_seq', firstKeys['note'], noteKey)
+    keyManifest.addTable(mutationTable, '_Assoc_key', 'all_allele_mutation_seq', firstKeys['mutation'], mutationKey)
+    keyManifest.addTable(mutantTable, '_Assoc_key', 'all_allele_cellline_seq', firstKeys['cellLine'], mutantKey)
+    keyManifest.addTable(annotTable, '_Annot_key', 'voc_annot_seq', firstKeys['annot'], annotKey)
+
+    try:
+        keyManifest.write(keyManifestFileName)
+    except:
+        exit(1, 'Could not write file %s\n' % keyManifestFileName)
+
+#
+# Purpose:  sets the auto-sequences from the key manifest
+#	(a safety net: the keys were reserved from the sequences,
+#	see keyManifest.py)
+#
+def resyncSequences():
+
+    with loadMetrics.stage('resyncSequences') as m:
+        results = keyManifest.resyncSequences()
+        m['rowsOut'] = len(results)
+
+    for table, value, method in results:
+        diagFile.write('%s: sequence set from %s (%s)\n' % (table, method, value))
+
+    loadStatus['resync'] = 'done'
+    writeLoadStatus()
+
+#
+# Purpose:  writes the load status file
+#
+def writeLoadStatus():
+
+    try:
+        fp = open(loadStatusFileName + '.tmp', 'w')
+        json.dump(loadStatus, fp, indent = 1)
+        fp.close()
+        os.replace(loadStatusFileName + '.tmp', loadStatusFileName)
+    except:
+        exit(1, 'Could not write file %s\n' % loadStatusFileName)
+
+#
+# Purpose:  saves what the load phase needs, so that it can be resumed
+#	(key manifest, IKMC updates, load status = pending)
+#
+def writeCheckpoint():
+
+    writeKeyManifest()
+
+    try:
+        ikmcUpdate.save(ikmcUpdateFileName)
+    except:
+        exit(1, 'Could not write file %s\n' % ikmcUpdateFileName)
+
+    for table in bcpTableNames:
+        loadStatus[table] = 'pending'
+    for step in ['notes', 'status', 'resync']:
+        loadStatus[step] = 'pending'
+
+    writeLoadStatus()
+
+#
+# Purpose:  reads the checkpoint of a previous run (see writeCheckpoint)
+#
+def readCheckpoint():
+
+    try:
+        fp = open(loadStatusFileName, 'r')
+        loadStatus.update(json.load(fp))
+        fp.close()
+        keyManifest.read(keyManifestFileName)
+        ikmcUpdate.load(ikmcUpdateFileName)
+    except:
+        exit(1, 'Could not read the checkpoint of the previous run (%s)\n' % loadStatusFileName)
+
+    # the bcp files were closed before the checkpoint was written;
+    # a newer bcp file was written by another run
+    checkpointTime = os.path.getmtime(keyManifestFileName)
+
+    for table in bcpTableNames:
+        if loadStatus[table] == 'loaded':
+            continue
+        bcpFileName = outputDir + '/' + table + '.bcp'
+        if not os.path.exists(bcpFileName):
+            exit(1, 'Cannot resume: missing bcp file for %s\n' % table)
+        if os.path.getmtime(bcpFileName) > checkpointTime:
+            exit(1, 'Cannot resume: bcp file for %s is newer than the checkpoint\n' % table)
+
+    for k in bcpTableNames + ['notes', 'status', 'resync']:
+        diagFile.write('Resume: %s %s\n' % (k, loadStatus[k]))
 
 #
 # Purpose:  BCPs the data into the database
@@ -340,45 +716,15 @@ def bcpFiles():
     if DEBUG or not bcpon:
         return
 
-    closeFiles()
-
-    bcpI = '%s %s %s' % (BCP_COMMAND, db.get_sqlServer(), db.get_sqlDatabase())
-    bcpII = '"|" "\\n" mgd'
-
-    bcp1 = '%s %s "/" %s %s' % (bcpI, alleleTable, alleleFileName, bcpII)
-    bcp2 = '%s %s "/" %s %s' % (bcpI, mutationTable, mutationFileName, bcpII)
-    bcp3 = '%s %s "/" %s %s' % (bcpI, mutantTable, mutantFileName, bcpII)
-    bcp4 = '%s %s "/" %s %s' % (bcpI, refTable, refFileName, bcpII)
-    bcp5 = '%s %s "/" %s %s' % (bcpI, accTable, accFileName, bcpII)
-    bcp6 = '%s %s "/" %s %s' % (bcpI, accRefTable, accRefFileName, bcpII)
-    bcp7 = '%s %s "/" %s %s' % (bcpI, noteTable, noteFileName, bcpII)
-    bcp8 = '%s %s "/" %s %s' % (bcpI, annotTable, annotFileName, bcpII)
-
-    db.commit()
+    if loadMode == 'copy' and not resume:
+        copyFiles()
+    else:
+        bcpTables([t for t in bcpTableNames if loadStatus[t] != 'loaded'])
 
-    for bcpCmd in [bcp1, bcp2, bcp3, bcp4, bcp5, bcp6, bcp7, bcp8]:
-        diagFile.write('%s\n' % bcpCmd)
-        os.system(bcpCmd)
-
-    if len(ikmcSQLs) > 0:
-        print(ikmcSQLs)
-        db.sql(ikmcSQLs, None)
-        db.commit()
-
-    # update all_allele_seq auto-sequence
-    db.sql(''' select setval('all_allele_seq', (select max(_Allele_key) from ALL_Allele)) ''', None)
-    # update mgi_reference_assoc_seq auto-sequence
-    db.sql(''' select setval('mgi_reference_assoc_seq', (select max(_Assoc_key) from MGI_Reference_Assoc)) ''', None)
-    # update mgi_note_seq auto-sequence
-    db.sql(''' select setval('mgi_note_seq', (select max(_Note_key) from MGI_Note)) ''', None)
-    # update all_allele_mutation_seq auto-sequence
-    db.sql(''' select setval('all_allele_mutation_seq', (select max(_Assoc_key) from ALL_Allele_Mutation)) ''', None)
-    # update all_allele_cellline_seq auto-sequence
-    db.sql(''' select setval('all_allele_cellline_seq', (select max(_Assoc_key) from ALL_Allele_CellLine)) ''', None)
-    # update voc_annot_seq auto-sequence
-    db.sql(''' select setval('voc_annot_seq', (select max(_Annot_key) from VOC_Annot)) ''', None)
+    applyIKMCUpdates()
 
-    db.commit()
+    if loadStatus['resync'] != 'done':
+        resyncSequences()
 
 #
 # Purpose:  processes data
@@ -390,7 +736,7 @@ def bcpFiles():
 def processFileIKMC(createMCL, createNote, setStatus, \
         symbol, ikmcSymbol, mutantCellLine, ikmcNotes, createdByKey, existingAlleleID):
 
-    global noteKey, ikmcSQLs
+    global noteKey
 
     #
     # add new MCLs to new/existing alleles
@@ -411,7 +757,7 @@ def processFileIKMC(createMCL, createNote, setStatus, \
     # set allele/status = Approved for existing "reserved" alleles
     #
     if len(setStatus) > 0:
-        ikmcSQLs.append('update ALL_Allele set _Allele_Status_key = 847114 where _Allele_key = %s' % (setStatus))
+        ikmcUpdate.approveAllele(setStatus)
 
     #
     # Add IKMC Colony/Note to a new or existing allele
@@ -441,7 +787,7 @@ def processFileIKMC(createMCL, createNote, setStatus, \
             if int(aKey) == 0:
                 nKey = alleleLookup[symbol][0][1]
                 note = tokens[1]
-                ikmcSQLs.append('''update MGI_Note set note = '%s' where _Note_key = %s;''' % (note, nKey))
+                ikmcUpdate.replaceNote(nKey, note)
                         
             # child exists, note does not exist : add note to existing child
             else:
@@ -450,10 +796,9 @@ def processFileIKMC(createMCL, createNote, setStatus, \
 
                 if symbol in alleleLookup:
                         nKey = alleleLookup[symbol][0][1]
-                        ikmcSQLs.append('''update MGI_Note set note = rtrim(note) || '|%s' where _Note_key = %s;''' % (note, nKey))
+                        ikmcUpdate.appendNote(nKey, note)
                 else:
-                        noteFile.write('%s|%s|%s|%s|%s|%s|%s|%s|%s\n' \
-                        % (noteKey, aKey, mgiNoteObjectKey, mgiIKMCNoteTypeKey, \
+                        noteFile.write(alleleRecord.bcpRow(noteKey, aKey, mgiNoteObjectKey, mgiIKMCNoteTypeKey, \
                         note, createdByKey, createdByKey, loaddate, loaddate))
 
                         # save symbol/aKey/ikmc note key/allele id
@@ -469,8 +814,7 @@ def processFileIKMC(createMCL, createNote, setStatus, \
 
             tokens = createNote.split('||')
             nKey = tokens[0]
-            note = tokens[1] + '|' + ikmcNotes
-            ikmcSQLs.append('''update MGI_Note set note = '%s' where _Note_key = %s;''' % (note, nKey))
+            ikmcUpdate.appendNote(nKey, ikmcNotes, tokens[1])
                         
     # 
     # print out the proper allele id
@@ -487,6 +831,138 @@ def processFileIKMC(createMCL, createNote, setStatus, \
                         mgi_utils.prvalue(printAlleleID), \
                         mgi_utils.prvalue(ikmcSymbol)))
 
+#
+# Purpose:  resolve the users/markers/strains/references of the input file
+#
+# the distinct values of the whole input file are collected and each
+# entity type is resolved by one set-based query (see lookupCache)
+#
+def preloadLookups(lines):
+
+    logins = set()
+    markerIDs = set()
+    strains = set()
+    jnums = set([jnum])
+    cellLines = set()
+
+    # number of verify*() calls processFile() would make
+    lookupCalls = 0
+
+    for line in lines:
+        r = alleleRecord.parse(line)
+        if r is None:
+            continue
+
+        logins.add(r.createdBy)
+        lookupCalls += 1
+
+        # processing for IKMC-only
+        if len(r.createMCL) > 0 or len(r.createNote) > 0 or len(r.setStatus) > 0:
+            # IKMC "add MCL"
+            if len(r.createMCL) > 0:
+                cellLines.add(r.mutantCellLine)
+                lookupCalls += 1
+            continue
+
+        # mutant cell line of a new allele
+        if len(r.mutantCellLine) > 0:
+            cellLines.add(r.mutantCellLine)
+            lookupCalls += 1
+
+        markerIDs.add(r.markerID)
+        strains.add(r.strainOfOrigin)
+        lookupCalls += 3
+
+        for reference in r.references.split('||'):
+            try:
+                refType, refID = reference.split('|')
+                jnums.add(refID)
+                lookupCalls += 1
+            except:
+                pass
+
+    lookupCache.loadUsers(logins)
+    lookupCache.loadMarkers(markerIDs)
+    lookupCache.loadStrains(strains)
+    lookupCache.loadReferences(jnums)
+    lookupCache.loadCellLines(cellLines)
+
+    message = 'Lookups: %s users, %s markers, %s strains, %s references, %s cell lines; %s queries replace %s round trips (%s saved)' \
+        % (len(lookupCache.userLookup), len(lookupCache.markerLookup), \
+           len(lookupCache.strainLookup), len(lookupCache.referenceLookup), \
+           len(lookupCache.cellLineLookup), \
+           lookupCache.bulkQueryCount, lookupCalls, lookupCalls - lookupCache.bulkQueryCount)
+    print(message)
+    diagFile.write(message + '\n')
+
+#
+# Purpose:  counts the keys processFile() will need
+# Returns:  dictionary of counts
+#
+# the counts are an upper bound: rows that fail verification do not use
+# their keys
+#
+def countKeys(lines):
+
+    counts = {
+        'allele' : 0,
+        'accession' : 0,
+        'mgiID' : 0,
+        'mutation' : 0,
+        'reference' : 0,
+        'annot' : 0,
+        'cellLine' : 0,
+        'note' : 0,
+        }
+
+    for line in lines:
+        r = alleleRecord.parse(line)
+        if r is None:
+            continue
+
+        # processing for IKMC-only
+        if len(r.createMCL) > 0 or len(r.createNote) > 0 or len(r.setStatus) > 0:
+            if len(r.createMCL) > 0:
+                counts['cellLine'] += 1
+            # "child exists, note does not exist" may add a note
+            if r.createNote.find('::') > 0 and not r.createNote.startswith('0::'):
+                counts['note'] += 1
+            continue
+
+        counts['allele'] += 1
+        counts['accession'] += 1
+        counts['mgiID'] += 1
+        counts['mutation'] += len(r.mutations.split('|'))
+        counts['reference'] += len(r.references.split('||'))
+        counts['annot'] += len(r.alleleSubtypes.split('|'))
+
+        if len(r.mutantCellLine) > 0:
+            counts['cellLine'] += 1
+
+        if len(r.molecularNotes) > 0:
+            counts['note'] += 1
+
+        if len(r.ikmcNotes) > 0:
+            counts['note'] += 1
+
+    return counts
+
+#
+# Purpose:  reads the input file, resolves its lookups and counts its keys
+#	lines : the input lines, if they do not come from the input file
+#
+def preprocessFile(lines = None):
+
+    global inputLines, keyCounts
+
+    if lines is None:
+        inputLines = inputFile.readlines()
+    else:
+        inputLines = lines
+
+    preloadLookups(inputLines)
+    keyCounts = countKeys(inputLines)
+
 #
 # Purpose:  processes data
 #
@@ -498,44 +974,24 @@ def processFile():
     lineNum = 0
     # For each line in the input file
 
-    for line in inputFile.readlines():
+    for line in inputLines:
 
         error = 0
         lineNum  += 1
 
-        # Split the line into tokens
-        tokens = line[:-1].split('\t')
-        #print line
-        try:
-            markerID = tokens[0]
-            symbol = tokens[1]
-            name = tokens[2]
-            alleleStatus = tokens[3]
-            alleleType = tokens[4]
-            alleleSubtypes = tokens[5]
-            collectionKey = tokens[6]
-            germLine = tokens[7]
-            references = tokens[8]
-            strainOfOrigin = tokens[9]
-            mutantCellLine = tokens[10]
-            molecularNotes = tokens[11]
-            driverNotes = tokens[12]
-            ikmcNotes = tokens[13]
-            mutations = tokens[14]
-            inheritanceMode = tokens[15]
-            isMixed = tokens[16]
-            isExtinct = tokens[17]
-            createdBy = tokens[18]
-            createMCL = tokens[19]
-            createNote = tokens[20]
-            setStatus = tokens[21]
-            existingAlleleID = tokens[22]
-            ikmcSymbol = tokens[23]
-        except:
+        # Split the line into fields (see alleleRecord.py)
+        record = alleleRecord.parse(line)
+        if record is None:
             exit(1, 'Invalid Line (%d): %s\n' % (lineNum, line))
 
+        markerID, symbol, name, alleleStatus, alleleType, alleleSubtypes, \
+            collectionKey, germLine, references, strainOfOrigin, mutantCellLine, \
+            molecularNotes, driverNotes, ikmcNotes, mutations, inheritanceMode, \
+            isMixed, isExtinct, createdBy, createMCL, createNote, setStatus, \
+            existingAlleleID, ikmcSymbol = record
+
         # creator
-        createdByKey = loadlib.verifyUser(createdBy, lineNum, errorFile)
+        createdByKey = lookupCache.verifyUser(createdBy, lineNum, errorFile)
         if createdByKey == 0:
             continue
 
@@ -547,7 +1003,7 @@ def processFile():
                 continue
 
         # marker key
-        markerKey = loadlib.verifyMarker(markerID, lineNum, errorFile)
+        markerKey = lookupCache.verifyMarker(markerID, lineNum, errorFile)
         
         # hard-coded
         # _vocab_key = 73 (Marker-Allele Association Status)
@@ -555,25 +1011,25 @@ def processFile():
         markerStatusKey = 4268545
 
         # _vocab_key = 37 (Allele Status)
-        alleleStatusKey = loadlib.verifyTerm('', 37, alleleStatus, lineNum, errorFile)
+        alleleStatusKey = lookupCache.verifyTerm(37, alleleStatus, lineNum, errorFile)
 
         # _vocab_key = 38 (Allele Type)
-        alleleTypeKey = loadlib.verifyTerm('', 38, alleleType, lineNum, errorFile)
+        alleleTypeKey = lookupCache.verifyTerm(38, alleleType, lineNum, errorFile)
 
         # _vocab_key = 61 (Allele Transmission)
-        germLineKey = loadlib.verifyTerm('', 61, germLine, lineNum, errorFile)
+        germLineKey = lookupCache.verifyTerm(61, germLine, lineNum, errorFile)
 
         # _vocab_key = 36 (Allele Molecular Mutation)
         allMutations = mutations.split('|')
 
         # _vocab_key = 35 (Allele Status)
-        inheritanceModeKey = loadlib.verifyTerm('', 35, inheritanceMode, lineNum, errorFile)
+        inheritanceModeKey = lookupCache.verifyTerm(35, inheritanceMode, lineNum, errorFile)
 
         # strains
-        strainOfOriginKey = sourceloadlib.verifyStrain(strainOfOrigin, lineNum, errorFile)
+        strainOfOriginKey = lookupCache.verifyStrain(strainOfOrigin, lineNum, errorFile)
 
         # reference
-        refKey = loadlib.verifyReference(jnum, lineNum, errorFile)
+        refKey = lookupCache.verifyReference(jnum, lineNum, errorFile)
 
         # if errors, continue to next record
         # errors are stored (via loadlib) in the .error log
@@ -596,17 +1052,15 @@ def processFile():
         #collectionKey = 11025586
 
         # allele (master)
-        alleleFile.write('%d|%s|%s|%s|%s|%s|%s|%s|%s|%s|0|%s|%s|%s|%s|%s|%s|%s|%s|%s|%s\n' \
-            % (alleleKey, markerKey, strainOfOriginKey, inheritanceModeKey, alleleTypeKey, \
-            alleleStatusKey, germLineKey, collectionKey, symbol, name, \
+        alleleFile.write(alleleRecord.bcpRow(alleleKey, markerKey, strainOfOriginKey, inheritanceModeKey, alleleTypeKey, \
+            alleleStatusKey, germLineKey, collectionKey, symbol, name, 0, \
             isExtinct, isMixed, refKey, markerStatusKey, \
             createdByKey, createdByKey, createdByKey, loaddate, loaddate, loaddate))
 
         # molecular mutation
         for mutation in allMutations:
-                mutationTermKey = loadlib.verifyTerm('', 36, mutation, lineNum, errorFile)
-                mutationFile.write('%s|%s|%s|%s|%s\n' \
-                % (mutationKey, alleleKey, mutationTermKey, loaddate, loaddate))
+                mutationTermKey = lookupCache.verifyTerm(36, mutation, lineNum, errorFile)
+                mutationFile.write(alleleRecord.bcpRow(mutationKey, alleleKey, mutationTermKey, loaddate, loaddate))
                 mutationKey = mutationKey + 1
 
         #
@@ -615,7 +1069,7 @@ def processFile():
         allReferences = references.split('||')
         for reference in allReferences:
                 refType, refID = reference.split('|')
-                refKey = loadlib.verifyReference(refID, lineNum, errorFile)
+                refKey = lookupCache.verifyReference(refID, lineNum, errorFile)
 
                 if refType == 'Original':
                         refAssocTypeKey = 1011
@@ -624,8 +1078,7 @@ def processFile():
                 elif refType == 'Molecular':
                         refAssocTypeKey = 1012
 
-                refFile.write('%s|%s|%s|%s|%s|%s|%s|%s|%s\n' \
-                        % (refAssocKey, refKey, alleleKey, mgiTypeKey, refAssocTypeKey, \
+                refFile.write(alleleRecord.bcpRow(refAssocKey, refKey, alleleKey, mgiTypeKey, refAssocTypeKey, \
                         createdByKey, createdByKey, loaddate, loaddate))
                 refAssocKey = refAssocKey + 1
 
@@ -636,10 +1089,9 @@ def processFile():
         for s in allSubtypes:
 
                 # _vocab_key = 93 (Allele Subtype)
-                alleleSubtypeKey = loadlib.verifyTerm('', 93, s, lineNum, errorFile)
+                alleleSubtypeKey = lookupCache.verifyTerm(93, s, lineNum, errorFile)
 
-                annotFile.write('%s|%s|%s|%s|%s|%s|%s\n' \
-                        % (annotKey, annotTypeKey, alleleKey, alleleSubtypeKey, \
+                annotFile.write(alleleRecord.bcpRow(annotKey, annotTypeKey, alleleKey, alleleSubtypeKey, \
                                 qualifierKey, loaddate, loaddate))
                 annotKey = annotKey + 1
 
@@ -651,8 +1103,7 @@ def processFile():
 
         # MGI Accession ID for the allelearker
 
-        accFile.write('%s|%s%d|%s|%s|1|%d|%d|0|1|%s|%s|%s|%s\n' \
-            % (accKey, mgiPrefix, mgiKey, mgiPrefix, mgiKey, alleleKey, mgiTypeKey, \
+        accFile.write(alleleRecord.bcpRow(accKey, mgiPrefix + str(mgiKey), mgiPrefix, mgiKey, 1, alleleKey, mgiTypeKey, 0, 1, \
                createdByKey, createdByKey, loaddate, loaddate))
 
         # storing data in MGI_Note
@@ -661,8 +1112,7 @@ def processFile():
         mgiNoteSeqNum = 1
         if len(molecularNotes) > 0:
 
-            noteFile.write('%s|%s|%s|%s|%s|%s|%s|%s|%s\n' \
-                % (noteKey, alleleKey, mgiNoteObjectKey, mgiMolecularNoteTypeKey, \
+            noteFile.write(alleleRecord.bcpRow(noteKey, alleleKey, mgiNoteObjectKey, mgiMolecularNoteTypeKey, \
                    molecularNotes, createdByKey, createdByKey, loaddate, loaddate))
 
             noteKey = noteKey + 1
@@ -679,8 +1129,7 @@ def processFile():
         useIKMCnotekey = 0
         if len(ikmcNotes) > 0:
 
-            noteFile.write('%s|%s|%s|%s|%s|%s|%s|%s|%s\n' \
-                % (noteKey, alleleKey, mgiNoteObjectKey, mgiIKMCNoteTypeKey, \
+            noteFile.write(alleleRecord.bcpRow(noteKey, alleleKey, mgiNoteObjectKey, mgiIKMCNoteTypeKey, \
                    ikmcNotes, createdByKey, createdByKey, loaddate, loaddate))
 
             useIKMCnotekey = noteKey
@@ -723,16 +1172,9 @@ def processFile():
         mgiKey = mgiKey + 1
         alleleKey = alleleKey + 1
 
-    #	end of "for line in inputFile.readlines():"
-
-    #
-    # Update the AccessionMax value
-    #
-
-    if not DEBUG:
-        db.sql('select * from ACC_setMax(%d)' % (lineNum), None)
-        db.commit()
+    #	end of "for line in inputLines:"
 
+    # the AccessionMax value was updated by setPrimaryKeys()
 
 #
 # Purpose: write 1 or more mutation cell line associations to bcp file
@@ -741,19 +1183,9 @@ def addMutantCellLine(alleleKey, mutantCellLine, createdByKey):
 
     global mutantKey
 
-    mutantCellLineKey = 0
+    mutantCellLineKey = lookupCache.getCellLine(mutantCellLine)
 
-    results = db.sql('''
-        select _CellLine_key from ALL_CellLine
-        where isMutant = 1 and _Derivation_key is not null
-        and cellLine = '%s'
-        ''' % (mutantCellLine) , 'auto')
-
-    for r in results:
-        mutantCellLineKey = r['_CellLine_key']
-
-    mutantFile.write('%d|%s|%s|%s|%s|%s|%s\n' \
-                % (mutantKey, alleleKey, mutantCellLineKey, \
+    mutantFile.write(alleleRecord.bcpRow(mutantKey, alleleKey, mutantCellLineKey, \
                 createdByKey, createdByKey, loaddate, loaddate))
 
     mutantKey = mutantKey + 1
@@ -763,13 +1195,44 @@ def addMutantCellLine(alleleKey, mutantCellLine, createdByKey):
 #
 
 if __name__ == '__main__':
+
+        if resume:
+            print('initialize (resume)')
+            initialize(0)
+            readCheckpoint()
+            print('bcpFiles')
+            with loadMetrics.stage('bcpFiles') as m:
+                bcpFiles()
+                m['rowsOut'] = loadedRows
+            exit(0)
+
         print('initialize')
-        initialize()
+        with loadMetrics.stage('initialize') as m:
+            initialize()
+            m['rowsOut'] = len(lookupCache.termLookup)
+        print('preprocessFile')
+        with loadMetrics.stage('preprocessFile') as m:
+            preprocessFile()
+            m['rowsIn'] = len(inputLines)
         print('setPrimaryKeys')
-        setPrimaryKeys()
+        with loadMetrics.stage('setPrimaryKeys') as m:
+            setPrimaryKeys()
+            m['rowsOut'] = sum(keyCounts.values())
         print('processFile')
-        processFile()
+        with loadMetrics.stage('processFile') as m:
+            try:
+                processFile()
+            except copyLoader.CopyError as e:
+                exit(1, 'copy failed: %s' % (e))
+            # the bcp files are complete before the checkpoint is written
+            if loadMode != 'copy':
+                closeFiles()
+            writeCheckpoint()
+            m['rowsIn'] = len(inputLines)
+            m['rowsOut'] = alleleKey - firstKeys['allele']
         print('bcpFiles')
-        bcpFiles()
+        with loadMetrics.stage('bcpFiles') as m:
+            bcpFiles()
+            m['rowsOut'] = loadedRows
 
         exit(0)
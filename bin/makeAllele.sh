@@ -10,7 +10,10 @@
 #
 #  Usage:
 #
-#      makeAllele.sh
+#      makeAllele.sh config [--resume]
+#
+#      The arguments after the configuration file are passed to
+#      makeAllele.py (e.g. --resume).
 #
 #  Env Vars:
 #
@@ -45,6 +48,7 @@
 cd `dirname $0`
 
 CONFIG=${1}
+shift
 
 #
 # Make sure the configuration file exists and source it.
@@ -70,7 +74,7 @@ LOG=${LOG_DIAG}
 echo "" >> ${LOG}
 date >> ${LOG}
 echo "Make the Allele bcp files (makeAllele.sh)" | tee -a ${LOG}
-${PYTHON} ./makeAllele.py 2>&1 >> ${LOG}
+${PYTHON} ./makeAllele.py "$@" 2>&1 >> ${LOG}
 STAT=$?
 if [ ${STAT} -ne 0 ]
 then
@@ -44,30 +44,14 @@
 #
 #	Allele file ($INPUTFILE):
 #
-#	field 1:  MGI Marker ID
-#	field 2:  Allele Symbol
-#	field 3:  Allele Name
-#	field 4:  Allele Status
-#	field 5:  Allele Generation (Type)
-#	field 6:  Allele Subtype (currently not used)
-#	field 7:  Allele Collection (currently not used)
-#	field 8:  Germ Line Transmission
-#	field 9:  Reference Type/J#
-#	field 10: Strain of Origin
-#	field 11: Mutant Cell Line ID
-#	field 12: Molecular Notes (_NoteType_key = 1021)
-#       field 13: Driver Gene (MGI_Relationship._Category_key = 1006/_Object_key_2 = marker)
-#	field 14: IKMC Colony Name (_NoteType_key = 1041)
-#	field 15: Molecular Mutation
-#	field 16: Inheritance Mode
-#	field 17: Mixed
-#	field 18: Extinct
-#	field 19: Created By
-#	field 20: Add mutant cell line
-#	field 21: Add IKMC Colony Note
-#	field 22: Set the child's Allele Status = Approved (847114)
-#	field 23: Allele MGI ID (if child allele already exists)
-#	field 24: Allele Symbol minus Marker Symbol (for IKMC format)
+#	the general-Allele input file; see alleleRecord.py for its 24 fields
+#
+#	Metrics file (${OUTPUTDIR}/makeIKMC.metrics.json):
+#	wall/CPU time, rows in/out, rows/sec and peak RSS per stage
+#
+#	Delta file ($IKMC_DELTA_FILE, if IKMC_DELTA = 1):
+#	row -> skip/exists verdict and the fingerprint of the MGI data it
+#	depends on, read back by the next run
 #
 #  Exit Codes:
 #
@@ -96,7 +80,18 @@
 
 import sys 
 import os
-import db
+import json
+import hashlib
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import loadMetrics
+import loadLog
+import sqlProfile
+import alleleRecord
+import ikmcSnapshot
+import ikmcIndex
+import ikmcDuplicates
 
 # LOG_DIAG
 # LOG_CUR
@@ -108,6 +103,7 @@ skipDiagFile = None
 existsDiagFile = None
 
 logitSkip = []
+# (line number, exists entry)
 logitExists = []
 
 # IKMC_COPY_INPUT_FILE
@@ -126,16 +122,46 @@ fpAllele = None
 
 alleleByID = {}
 childAlleleBySymbol = {}
-markerByID = []
 cellLineBySymbol = {}
 cellLineByKey = {}
-alleleAdded = {}
-colonyAdded = {}
+
+# key = child _Allele_key, value = (_Note_key, IKMC Colony note)
 ikmcNotes = {}
 
+# key = parent allele symbol, value = childSymbols()
+childSymbolCache = {}
+
+# key = (parent allele ID, isCre), value = childDerivation()
+childDerivations = {}
+
+# number of IKMC input rows read / Allele records created
+inputRows = 0
+alleleRows = 0
+
+# IKMC_DELTA = 1 : a row that is unchanged since the previous run, and whose
+# MGI data is unchanged (see rowDependencies), is not re-evaluated; its
+# skip/exists verdict is carried forward from IKMC_DELTA_FILE
+deltaMode = os.getenv('IKMC_DELTA', '0') == '1'
+deltaFile = os.getenv('IKMC_DELTA_FILE')
+deltaVersion = 3
+
+# key = IKMC row, value = [skip|exists, logit, fields, dependencies]
+# dependencies = fingerprint of the MGI data of the row (see rowDependencies)
+previousVerdicts = {}
+currentVerdicts = {}
+
+# number of rows whose verdict was carried forward
+carriedRows = 0
+
+# IKMC_RULE_WORKERS > 1 : the rows are partitioned by parent allele (field 9)
+# and evaluated by this many worker processes (see parallelRecords)
+ruleWorkers = int(os.getenv('IKMC_RULE_WORKERS', 1))
+
+# IKMC_SNAPSHOT_CACHE : optional local copy of the MGI snapshot (see ikmcSnapshot.py)
+snapshotCacheFile = os.getenv('IKMC_SNAPSHOT_CACHE')
+
 jnumber = ''
 createdBy = ''
-mgiIKMCNoteTypeKey = 1041
 
 header = 'error\tfield 1\tfield 2\tfield 6\tfield 7\tfield 8\tfield 9\tfield 12\tfield 13\tfield 17\tfull allele symbol\tnew allele symbol\n'
 
@@ -159,7 +185,7 @@ def initialize():
     global ikmcFile, alleleFile
     global fpLogDiag, fpLogCur, fpSkipDiag, fpExistsDiag
     global fpIKMC, fpAllele
-    global alleleByID, childAlleleBySymbol, markerByID
+    global alleleByID, childAlleleBySymbol
     global cellLineBySymbol, cellLineByKey
     global ikmcNotes
     global jnumber, createdBy
@@ -179,41 +205,45 @@ def initialize():
     # Make sure the environment variables are set.
     #
     if not logDiagFile:
-        print('Environment variable not set: LOG_DIAG')
+        loadLog.error('Environment variable not set: LOG_DIAG')
         rc = 1
 
     #
     # Make sure the environment variables are set.
     #
     if not logCurFile:
-        print('Environment variable not set: LOG_CUR')
+        loadLog.error('Environment variable not set: LOG_CUR')
         rc = 1
 
     #
     # Make sure the environment variables are set.
     #
     if not skipDiagFile:
-        print('Environment variable not set: SKIP_DIAG')
+        loadLog.error('Environment variable not set: SKIP_DIAG')
         rc = 1
 
     #
     # Make sure the environment variables are set.
     #
     if not existsDiagFile:
-        print('Environment variable not set: EXISTS_DIAG')
+        loadLog.error('Environment variable not set: EXISTS_DIAG')
         rc = 1
 
     #
     # Make sure the environment variables are set.
     #
     if not ikmcFile:
-        print('Environment variable not set: IKMC_COPY_INPUT_FILE')
+        loadLog.error('Environment variable not set: IKMC_COPY_INPUT_FILE')
         rc = 1
 
     # Make sure the environment variables are set.
     #
     if not alleleFile:
-        print('Environment variable not set: INPUTFILE')
+        loadLog.error('Environment variable not set: INPUTFILE')
+        rc = 1
+
+    if deltaMode and not deltaFile:
+        loadLog.error('Environment variable not set: IKMC_DELTA_FILE')
         rc = 1
 
     #
@@ -227,132 +257,62 @@ def initialize():
     fpAllele = None
 
     #
-    # Parent: Allele Accession ID/Key/Symbol/Name/Strain/Marker Acc ID/Marker Symbol
-    #
-    # KOMP, EUCOMM only : existing parents
-    # excluding NCOM (for now)
-    #		or a.symbol like "%<tm%[ae](NCOM%"
-    #		or a.symbol like "%<tm[0-9](NCOM%"
-    #
-    # includes:  Approved
+    # MGI snapshot : parents, children, cell lines, IKMC notes
+    # (see ikmcSnapshot.py; re-used from IKMC_SNAPSHOT_CACHE if unchanged)
     #
-    print('querying for parents')
-    results = db.sql('''
-        select aa.accID, a._Allele_key, a._Allele_Status_key, a.symbol, a.name, a._Collection_key,
-                s.strain, am.accID as markerID, m.symbol as markerSym
-        from ALL_Allele a, ACC_Accession aa, ACC_Accession am, MRK_Marker m, PRB_Strain s
-        where (lower(a.symbol) ~ '.*<tm([0-9])\(komp.*'
-                or lower(a.symbol) ~ '.*<tm.*([ae])\(komp.*'
-                or lower(a.symbol) ~ '.*<tm([0-9])\(eucomm.*'
-                or lower(a.symbol) ~ '.*<tm.*([ae])\(eucomm.*'
-                )
-        and a._Allele_Status_key in (847114)
-        and a._Allele_key = aa._Object_key
-        and a._Strain_key = s._Strain_key
-        and aa._MGIType_key = 11
-        and aa._LogicalDB_key = 1
-        and aa.prefixPart = 'MGI:'
-        and aa.preferred = 1
-        and a._Marker_key = am._Object_key
-        and am._MGIType_key = 2
-        and am.prefixPart = 'MGI:'
-        and am._LogicalDB_key = 1
-        and am.preferred = 1
-        and a._Marker_key = m._Marker_key
-        ''', 'auto')
-    for r in results:
-        key = r['accID']
-        alleleByID[key] = []
-        alleleByID[key].append(r)
-        key = r['markerID']
-        markerByID.append(key)
+    ikmcSnapshot.load(snapshotCacheFile, addSnapshotRows)
 
-    #
-    # Child: Allele Accession ID/Key/Symbol
-    #
-    # KOMP, EUCOMM only : existing children
-    #	excluding NCOM (for now)
-    #		or a.symbol like "%<tm%.%(NCOM%"
-    #
-    # includes:  Approved, Reserved
-    #
-    print('querying for children')
-    results = db.sql('''
-        select aa.accID, a._Allele_key, a._Allele_Status_key, a.symbol, a._Collection_key
-        from ALL_Allele a, ACC_Accession aa
-        where (lower(a.symbol) ~ '.*<tm.*\..*\(komp.*'
-                or lower(a.symbol) ~ '.*<tm.*b\(komp.*'
-                or lower(a.symbol) ~ '.*<tm.*c\(komp.*'
-                or lower(a.symbol) ~ '.*<tm.*\..*\(eucomm.*'
-                or lower(a.symbol) ~ '.*<tm.*b\(eucomm.*'
-                or lower(a.symbol) ~ '.*<tm.*c\(eucomm.*'
-                )
-        and a._Allele_Status_key in (847114, 847113)
-        and a._Allele_key = aa._Object_key
-        and aa._MGIType_key = 11
-        and aa._LogicalDB_key = 1
-        and aa.prefixPart = 'MGI:'
-        and aa.preferred = 1
-        ''', 'auto')
-    for r in results:
-        key = r['symbol']
-        childAlleleBySymbol[key] = []
-        childAlleleBySymbol[key].append(r)
-
-    #
-    # Mutant Cell Lines and their Alleles
-    #
-    # KOMP, EUCOMM only
-    #	excluding NCOM (for now)
-    #		or a.symbol like "%<tm%(NCOM%"
-    #
-    # includes:  Approved, Reserved
-    #
-    print('querying for cell lines')
-    results = db.sql('''
-        select a._Allele_key, c._CellLine_key, c.cellLine
-        from ALL_Allele a, ALL_Allele_CellLine ac, ALL_CellLine c
-        where (lower(a.symbol) ~ '.*<tm.*\(komp.*'
-                or lower(a.symbol) ~ '.*<tm.*\(eucomm.*'
-                )
-        and a._Allele_Status_key in (847114, 847113)
-        and a._Allele_key = ac._Allele_key
-        and ac._MutantCellLine_key = c._CellLine_key
-        ''', 'auto')
-    for r in results:
-
-        # by cell line symbol
-        key = r['cellLine']
-        if key not in cellLineBySymbol:
-                cellLineBySymbol[key] = []
-        cellLineBySymbol[key].append(r)
-
-        # by allele key
-        key = r['_Allele_key']
-        if key not in cellLineByKey:
-                cellLineByKey[key] = []
-        cellLineByKey[key].append(r)
-
-    #
-    # IKMC Notes
-    #
-    print('quering for ikmc notes')
-    results = db.sql('''
-        select n._Note_key, n._Object_key, rtrim(n.note) as note
-        from MGI_Note n
-        where n._NoteType_key = %s
-        ''' % (mgiIKMCNoteTypeKey), 'auto')
-    for r in results:
-        key = r['_Object_key']
-        ikmcNotes[key] = []
-        ikmcNotes[key].append(r)
+    if deltaMode and rc == 0:
+        readDelta()
 
     return rc
 
+#
+# Purpose: add the rows of one snapshot query to the lookups
+#	(called by ikmcSnapshot.load() as each query completes)
+#
+def addSnapshotRows(name, results):
+
+    # marker/cell line/colony indexes for the rule checks
+    ikmcIndex.add(name, results)
+
+    if name == 'parents':
+        for r in results:
+            key = r['accID']
+            alleleByID[key] = []
+            alleleByID[key].append(r)
+
+    elif name == 'children':
+        for r in results:
+            key = r['symbol']
+            childAlleleBySymbol[key] = []
+            childAlleleBySymbol[key].append(r)
+
+    elif name == 'cellLines':
+        for r in results:
+
+            # by cell line symbol
+            key = r['cellLine']
+            if key not in cellLineBySymbol:
+                    cellLineBySymbol[key] = []
+            cellLineBySymbol[key].append(r)
+
+            # by allele key
+            key = r['_Allele_key']
+            if key not in cellLineByKey:
+                    cellLineByKey[key] = []
+            cellLineByKey[key].append(r)
+
+    elif name == 'notes':
+        for r in results:
+            ikmcNotes[r['_Object_key']] = (r['_Note_key'], r['note'])
+
 #
 # Purpose: Open files.
+#	writeAlleleFile = 0 : the Allele file is not written
+#	(the records are passed in-process to makeAllele, see makeIKMCAllele.py)
 #
-def openFiles():
+def openFiles(writeAlleleFile = 1):
     global fpLogDiag, fpLogCur, fpSkipDiag, fpExistsDiag
     global fpIKMC, fpAllele
 
@@ -362,7 +322,7 @@ def openFiles():
     try:
         fpLogDiag = open(logDiagFile, 'a+')
     except:
-        print('Cannot open diag file: ' + logDiagFile)
+        loadLog.error('Cannot open diag file: %s', logDiagFile)
         return 1
 
     #
@@ -371,7 +331,7 @@ def openFiles():
     try:
         fpLogCur = open(logCurFile, 'a+')
     except:
-        print('Cannot open cur file: ' + logCurFile)
+        loadLog.error('Cannot open cur file: %s', logCurFile)
         return 1
 
     #
@@ -380,7 +340,7 @@ def openFiles():
     try:
         fpSkipDiag = open(skipDiagFile, 'w')
     except:
-        print('Cannot open skip file: ' + skipDiagFile)
+        loadLog.error('Cannot open skip file: %s', skipDiagFile)
         return 1
 
     #
@@ -389,7 +349,7 @@ def openFiles():
     try:
         fpExistsDiag = open(existsDiagFile, 'w')
     except:
-        print('Cannot open exists file: ' + existsDiagFile)
+        loadLog.error('Cannot open exists file: %s', existsDiagFile)
         return 1
 
     #
@@ -398,17 +358,18 @@ def openFiles():
     try:
         fpIKMC = open(ikmcFile, encoding='utf-8', errors='replace')
     except:
-        print('Cannot open ikmc file: ' + ikmcFile)
+        loadLog.error('Cannot open ikmc file: %s', ikmcFile)
         return 1
 
     #
     # Open the IKMC file with genotype sequence #
     #
-    try:
-        fpAllele = open(alleleFile, 'w')
-    except:
-        print('Cannot open allele file: ' + alleleFile)
-        return 1
+    if writeAlleleFile:
+        try:
+            fpAllele = open(alleleFile, 'w')
+        except:
+            loadLog.error('Cannot open allele file: %s', alleleFile)
+            return 1
 
 
     fpSkipDiag.write(header)
@@ -440,24 +401,337 @@ def closeFiles():
     if fpAllele:
         fpAllele.close()
 
+    ikmcDuplicates.close()
+
     return 0
 
 
+#
+# Purpose: returns the candidate child symbols of a parent allele symbol
+#	[tmX.1, tmX.2, tmXb, tmXc]
+#
+def childSymbols(alleleSym):
+
+    if alleleSym in childSymbolCache:
+        return childSymbolCache[alleleSym]
+
+    tokens1 = alleleSym.split('<')
+    tokens2 = tokens1[1].split('(')
+
+    childSymbolCache[alleleSym] = [alleleSym.replace(tokens2[0], tokens2[0] + '.1'),
+            alleleSym.replace(tokens2[0], tokens2[0] + '.2'),
+            alleleSym.replace('a(', 'b('),
+            alleleSym.replace('a(', 'c(')]
+
+    return childSymbolCache[alleleSym]
+
+#
+# Purpose: returns the child of a parent allele for a cre/flp excision
+#	symbol, name, alleleType, alleleSubType, molecularMutation, molecularNote
+#
+# computed on first use, once per (parent allele, cre/flp)
+#
+#	tmX  + cre : tmX.1 (note_tmX1)
+#	tmXe + cre : tmX.1 (note_tmXe)
+#	tmX  + flp : tmX.2 (note_tmX2)
+#	tmXa + cre : tmXb  (note_tmXb)
+#	tmXa + flp : tmXc  (note_tmXc)
+#
+def childDerivation(alleleID, isCre):
+
+    key = (alleleID, isCre)
+    if key in childDerivations:
+        return childDerivations[key]
+
+    alleleSym = alleleByID[alleleID][0]['symbol']
+    alleleName = alleleByID[alleleID][0]['name']
+    newAlleleSym1, newAlleleSym2, newAlleleSymB, newAlleleSymC = childSymbols(alleleSym)
+
+    isXa = alleleSym.find('a(') != -1
+    isXe = not isXa and alleleSym.find('e(') != -1
+    isX = not isXa and not isXe
+
+    alleleType = 'Targeted'
+
+    if isXa:
+        if isCre:
+            newAlleleSym = newAlleleSymB
+            newAlleleName = alleleName.replace('a,', 'b,')
+            alleleSubType = 'Null/knockout|Reporter'
+            molecularMutation = 'Insertion|Intragenic deletion'
+            template = note_tmXb
+        else:
+            newAlleleSym = newAlleleSymC
+            newAlleleName = alleleName.replace('a,', 'c,')
+            alleleSubType = 'Conditional ready'
+            molecularMutation = 'Insertion'
+            template = note_tmXc
+    else:
+        tokens3 = alleleName.split('targeted mutation')
+        tokens4 = tokens3[1].split(',')
+        if isX and isCre:
+            newAlleleSym = newAlleleSym1
+            newAlleleName = alleleName.replace(tokens4[0], tokens4[0] + '.1')
+            alleleSubType = 'Null/knockout|Reporter'
+            molecularMutation = 'Insertion|Intragenic deletion'
+            template = note_tmX1
+        elif isXe and isCre:
+            newAlleleSym = newAlleleSym1
+            newAlleleName = alleleName.replace(tokens4[0], tokens4[0] + '.1')
+            alleleSubType = 'Null/knockout|Reporter'
+            molecularMutation = 'Insertion'
+            template = note_tmXe
+        else:
+            newAlleleSym = newAlleleSym2
+            newAlleleName = alleleName.replace(tokens4[0], tokens4[0] + '.2')
+            alleleSubType = 'Null/knockout'
+            molecularMutation = 'Insertion'
+            template = note_tmX2
+
+    n = alleleSym.replace('>', '</sup>')
+    n = n.replace('<tm', '<sup>tm')
+
+    childDerivations[key] = {
+        'symbol' : newAlleleSym,
+        'name' : newAlleleName,
+        'alleleType' : alleleType,
+        'alleleSubType' : alleleSubType,
+        'molecularMutation' : molecularMutation,
+        'molecularNote' : template % (n),
+        }
+
+    return childDerivations[key]
+
+#
+# Purpose: add a row to the skip/exists log
+#	logit : message template ('line %s' = lineNum)
+#	fingerprint : if set, (row, dependencies); the verdict is saved for
+#	the next delta run
+#
+def logRow(kind, logit, lineNum, fingerprint, fields):
+
+    if kind == 'skip':
+        logitSkip.append(logit % lineNum + fields)
+    else:
+        logitExists.append((lineNum, logit % lineNum + fields))
+
+    if fingerprint:
+        currentVerdicts[fingerprint[0]] = [kind, logit, fields, fingerprint[1]]
+
+#
+# Purpose: returns the fingerprint of the MGI data the verdict of a row
+#	depends on (delta mode)
+#
+# the marker, the parent allele (field 9), the ES cell line (field 8) and
+# its association with the parent, and for each candidate child of the
+# parent: the child, its association with the ES cell line and the
+# colony names of its IKMC Colony note; an edit to any other allele or
+# note leaves the fingerprint unchanged
+#
+def rowDependencies(line):
+
+    tokens = line[:-1].split('\t')
+    markerID = tokens[1]
+    cellLine = tokens[7]
+    alleleID = tokens[8]
+
+    dependencies = [ikmcIndex.hasMarker(markerID), cellLine in cellLineBySymbol]
+
+    if alleleID in alleleByID:
+        parent = alleleByID[alleleID][0]
+        dependencies.append(parent)
+        dependencies.append(ikmcIndex.hasCellLine(parent['_Allele_key'], cellLine))
+
+        for childSym in childSymbols(parent['symbol']):
+            if childSym in childAlleleBySymbol:
+                child = childAlleleBySymbol[childSym][0]
+                dependencies.append([child, ikmcIndex.hasCellLine(child['_Allele_key'], cellLine), \
+                        sorted(ikmcIndex.childColonies.get(child['_Allele_key'], []))])
+            else:
+                dependencies.append(None)
+
+    return hashlib.sha1(json.dumps(dependencies, sort_keys = True, default = str).encode('utf-8')).hexdigest()
+
+#
+# Purpose: read the verdicts of the previous run
+#
+def readDelta():
+
+    global previousVerdicts
+
+    try:
+        fp = open(deltaFile, 'r')
+        delta = json.load(fp)
+        fp.close()
+    except:
+        loadLog.info('No previous delta file: %s', deltaFile)
+        return 0
+
+    if delta.get('version') == deltaVersion:
+        previousVerdicts = delta['verdicts']
+    else:
+        loadLog.info('Delta file of another version: all rows are re-evaluated')
+
+    loadLog.info('previous verdicts: %s', len(previousVerdicts))
+    return 0
+
+#
+# Purpose: write the verdicts of this run, for the next delta run
+#
+def writeDelta():
+
+    if not deltaMode:
+        return 0
+
+    try:
+        fp = open(deltaFile + '.tmp', 'w')
+        json.dump({'version' : deltaVersion, 'verdicts' : currentVerdicts}, fp)
+        fp.close()
+        os.replace(deltaFile + '.tmp', deltaFile)
+    except:
+        loadLog.error('Cannot write delta file: %s', deltaFile)
+        return 1
+
+    loadLog.info('rows carried forward: %s, verdicts saved: %s', carriedRows, len(currentVerdicts))
+    return 0
+
 #
 # Purpose: Read the IKMC file and re-format it to create a general-Allele input file
 #
 def createAlleleFile():
 
-    lineNum = 0
-    header = 1
-    print('reading input file')
-    for line in fpIKMC.readlines():
-        lineNum += 1
-        print('line: %s' % line)
-        if header == 1:
-                header += 1
+    global alleleRows
+
+    for record in alleleRecords():
+        fpAllele.write(record)
+        alleleRows += 1
+
+    return 0
+
+#
+# Purpose: Read the IKMC file and generate the general-Allele input records
+# Returns: generator of Allele file lines (see Outputs)
+#
+def alleleRecords():
+
+    global inputRows
+
+    loadLog.startProgress('reading input file')
+    rows = list(enumerate(fpIKMC.readlines(), 1))
+    inputRows = len(rows)
+
+    if ruleWorkers > 1:
+        for lineNum, record in parallelRecords(rows):
+            yield record
+    else:
+        for lineNum, record in evaluateRows(rows):
+            yield record
+
+    loadLog.endProgress(inputRows)
+
+#
+# Purpose: the worker of parallelRecords() : evaluate one partition
+#	spillFile : the duplicate tracker file of the load
+# Returns: (Allele records, skip entries, exists entries, verdicts, rows carried forward)
+#
+# a worker process can evaluate more than one partition, so the results
+# and the duplicate tracker are reset for each one
+#
+def evaluatePartition(partition, rows, spillFile):
+
+    global logitSkip, logitExists, currentVerdicts, carriedRows
+
+    logitSkip = []
+    logitExists = []
+    currentVerdicts = {}
+    carriedRows = 0
+
+    # the duplicate tracker of each partition spills to its own file
+    ikmcDuplicates.reset()
+    ikmcDuplicates.spillFile = '%s.%s' % (spillFile, partition)
+    loadLog.progressEvery = 0
+
+    records = list(evaluateRows(rows))
+    ikmcDuplicates.close()
+
+    return records, logitSkip, logitExists, currentVerdicts, carriedRows
+
+#
+# Purpose: evaluate the rows in ruleWorkers processes
+#
+# the verdict of a row depends only on the MGI snapshot, which the workers
+# inherit read-only, and on the children already created by this load,
+# which derive from the row's parent allele; so the rows are partitioned by
+# parent allele (field 9) and each partition is evaluated in input order
+#
+# Returns: list of (line number, Allele record), in input order; the skip/exists
+# entries and delta verdicts of the workers are merged into this process
+#
+def parallelRecords(rows):
+
+    global carriedRows
+
+    partitions = []
+    for i in range(ruleWorkers):
+        partitions.append([])
+
+    for lineNum, line in rows:
+        parentID = ''
+        if lineNum > 1:
+            parentID = (line.split('\t')[8:9] or [''])[0]
+        partitions[zlib.crc32(parentID.encode('utf-8')) % ruleWorkers].append((lineNum, line))
+
+    records = []
+    pool = ProcessPoolExecutor(max_workers = ruleWorkers, mp_context = multiprocessing.get_context('fork'))
+    try:
+        futures = [pool.submit(evaluatePartition, i, partitions[i], ikmcDuplicates.spillFile) \
+                for i in range(ruleWorkers) if partitions[i]]
+        for f in futures:
+            r, skip, exists, verdicts, carried = f.result()
+            records.extend(r)
+            logitSkip.extend(skip)
+            logitExists.extend(exists)
+            currentVerdicts.update(verdicts)
+            carriedRows += carried
+    finally:
+        pool.shutdown()
+
+    records.sort(key = lambda r: r[0])
+    logitExists.sort(key = lambda e: e[0])
+
+    loadLog.info('rule workers: %s, rows per partition: %s', ruleWorkers, [len(p) for p in partitions])
+
+    return records
+
+#
+# Purpose: apply the rules to the IKMC rows
+#	rows : list of (line number, line); line 1 is the header
+# Returns: generator of (line number, Allele record)
+#
+def evaluateRows(rows):
+
+    global carriedRows
+
+    for lineNum, line in rows:
+        loadLog.progress(lineNum)
+        loadLog.debug('line: %s', line)
+        if lineNum == 1:
                 continue
 
+        #
+        # delta mode : an unchanged row keeps its previous skip/exists verdict
+        # if the MGI data it depends on is unchanged
+        # (the row itself is the key of the verdict)
+        #
+        fingerprint = None
+        if deltaMode:
+                fingerprint = (line, rowDependencies(line))
+                if line in previousVerdicts and previousVerdicts[line][3] == fingerprint[1]:
+                        kind, logit, fields, dependencies = previousVerdicts[line]
+                        logRow(kind, logit, lineNum, fingerprint, fields)
+                        carriedRows += 1
+                        continue
+
         error = 0
         tokens = line[:-1].split('\t')
 
@@ -473,15 +747,15 @@ def createAlleleFile():
         mgi_allele_id_17 = tokens[16]
 
         if len(mgi_allele_id_17) > 0:
-                logit = 'field 17 line %s: we have already processed this row: ' % lineNum
+                logit = 'field 17 line %s: we have already processed this row: '
                 error = 1
 
-        if ikmc_marker_id_2 not in markerByID:
-                logit = 'field 2 line %s : marker is not in MGI: ' % lineNum
+        if not ikmcIndex.hasMarker(ikmc_marker_id_2):
+                logit = 'field 2 line %s : marker is not in MGI: '
                 error = 1
 
         if ikmc_allele_id_9 not in alleleByID:
-                logit = 'field 9 line %s: allele is not in MGI or is not a tmX, tmXa, tmXe: ' % lineNum
+                logit = 'field 9 line %s: allele is not in MGI or is not a tmX, tmXa, tmXe: '
                 error = 1
 
         else:
@@ -491,31 +765,25 @@ def createAlleleFile():
                 #
 
                 if ikmc_escell_name_8 not in cellLineBySymbol:
-                        logit = 'field 8 line %s: es cell line is not associated with *any* allele in MGI: '% lineNum
+                        logit = 'field 8 line %s: es cell line is not associated with *any* allele in MGI: '
                         error = 1
                 else:
-                        skipIt = 1
                         aKey = alleleByID[ikmc_allele_id_9][0]['_Allele_key']
-                        cellLine = cellLineBySymbol[ikmc_escell_name_8]
-                        for c in cellLine:
-                                cKey = c['_Allele_key']
-                                if aKey == cKey:
-                                        skipIt = 0
-
-                        if skipIt:
-                                logit = 'ES Cell Name (field 9) is not associated with allele ID (field 8) line %s: ' % lineNum
+
+                        if not ikmcIndex.hasCellLine(aKey, ikmc_escell_name_8):
+                                logit = 'ES Cell Name (field 9) is not associated with allele ID (field 8) line %s: '
                                 error = 1
 
         if ikmc_iscre_12 not in ('cre', 'flp'):
-                logit = 'Excision Type (field 12) is not "cre" or "flp" line %s: ' % lineNum
+                logit = 'Excision Type (field 12) is not "cre" or "flp" line %s: '
                 error = 1
 
         if ikmc_tatcre_13 not in ('true', 'false'):
-                logit = 'TAT-Cre (field 13) is not "true" or "false" line %s: ' % lineNum
+                logit = 'TAT-Cre (field 13) is not "true" or "false" line %s: '
                 error = 1
 
         if error:
-                logitSkip.append(logit + ikmc_marker_symbol_1 + '\t' + \
+                logRow('skip', logit, lineNum, fingerprint, ikmc_marker_symbol_1 + '\t' + \
                         ikmc_marker_id_2 + '\t' + \
                         ikmc_allele_symbol_6 + '\t' + \
                         ikmc_allele_escell_symbol_7 + '\t' + \
@@ -534,7 +802,7 @@ def createAlleleFile():
         isFlp = 0
 
         alleleSym = alleleByID[ikmc_allele_id_9][0]['symbol']
-        print('alleleSym: %s' % alleleSym)
+        loadLog.debug('alleleSym: %s', alleleSym)
         alleleName = alleleByID[ikmc_allele_id_9][0]['name']
         alleleKey = alleleByID[ikmc_allele_id_9][0]['_Allele_key']
         collectionKey = alleleByID[ikmc_allele_id_9][0]['_Collection_key']
@@ -544,22 +812,6 @@ def createAlleleFile():
         #alleleSym_6 = ikmc_marker_symbol_1 + '<' + ikmc_allele_symbol_6 + '>'
         alleleSym_6 = ikmc_allele_symbol_6
 
-        tokens1 = alleleSym.split('<')
-        tokens2 = tokens1[1].split('(')
-        newAlleleSym1 = alleleSym.replace(tokens2[0], tokens2[0] + '.1')
-        newAlleleSym2 = alleleSym.replace(tokens2[0], tokens2[0] + '.2')
-        newAlleleSymB = alleleSym.replace('a(', 'b(')
-        newAlleleSymC = alleleSym.replace('a(', 'c(')
-
-        tokens3 = alleleName.split('targeted mutation')
-        tokens4 = tokens3[1].split(',')
-        newAlleleName1 = alleleName.replace(tokens4[0], tokens4[0] + '.1')
-        newAlleleName2 = alleleName.replace(tokens4[0], tokens4[0] + '.2')
-        newAlleleNameB = alleleName.replace('a,', 'b,')
-        newAlleleNameC = alleleName.replace('a,', 'c,')
-
-        molecularNote = ''
-
         childExists = 0
         cellLineExists = 0
         childKey = 0
@@ -585,8 +837,8 @@ def createAlleleFile():
         # if tmXe is not Cre
         #
         if isXe and not isCre:
-                logit = 'This tmXe allele is not Cre line %s: ' % lineNum
-                logitExists.append(logit + ikmc_marker_symbol_1 + '\t' + \
+                logit = 'This tmXe allele is not Cre line %s: '
+                logRow('exists', logit, lineNum, fingerprint, ikmc_marker_symbol_1 + '\t' + \
                         ikmc_marker_id_2 + '\t' + \
                         ikmc_allele_symbol_6 + '\t' + \
                         ikmc_allele_escell_symbol_7 + '\t' + \
@@ -595,7 +847,7 @@ def createAlleleFile():
                         ikmc_iscre_12 + '\t' + \
                         ikmc_tatcre_13 + '\t' + \
                         mgi_allele_id_17 + '\t' + \
-                        alleleSym + '\t' + newAlleleSym2 + '\n')
+                        alleleSym + '\t' + childSymbols(alleleSym)[1] + '\n')
                 continue
 
         #
@@ -607,11 +859,11 @@ def createAlleleFile():
                 # special logging requested by Kim
                 #if len(ikmc_allele_symbol_6) > 4 and ikmc_allele_symbol_6[3] != "e":
                 if len(ikmc_allele_symbol_6) > 4 and ikmc_allele_symbol_6.find('e(') != -1:
-                        logit = "field 9 and field 6 symbols do not match line %s: " % lineNum
+                        logit = "field 9 and field 6 symbols do not match line %s: "
                 else:
-                        logit = 'Must handle special tmXa/tmXe case line %s: ' % lineNum
+                        logit = 'Must handle special tmXa/tmXe case line %s: '
 
-                logitSkip.append(logit + ikmc_marker_symbol_1 + '\t' + \
+                logRow('skip', logit, lineNum, fingerprint, ikmc_marker_symbol_1 + '\t' + \
                         ikmc_marker_id_2 + '\t' + \
                         ikmc_allele_symbol_6 + '\t' + \
                         ikmc_allele_escell_symbol_7 + '\t' + \
@@ -620,7 +872,7 @@ def createAlleleFile():
                         ikmc_iscre_12 + '\t' + \
                         ikmc_tatcre_13 + '\t' + \
                         mgi_allele_id_17 + '\t' + \
-                        alleleSym + '\t' + newAlleleSym2 + '\n')
+                        alleleSym + '\t' + childSymbols(alleleSym)[1] + '\n')
                 continue
 
         #
@@ -630,40 +882,21 @@ def createAlleleFile():
         #
 
         else:
-                if (isX or isXe) and isCre and newAlleleSym1 in childAlleleBySymbol:
-                        childExists = 1
-                        newAlleleSym = newAlleleSym1
+                child = childDerivation(ikmc_allele_id_9, isCre)
+                newAlleleSym = child['symbol']
 
-                elif isX and isFlp and newAlleleSym2 in childAlleleBySymbol:
+                if newAlleleSym in childAlleleBySymbol:
                         childExists = 1
-                        newAlleleSym = newAlleleSym2
-
-                elif isXa and isCre and newAlleleSymB in childAlleleBySymbol:
-                        childExists = 1
-                        newAlleleSym = newAlleleSymB
-
-                elif isXa and isFlp and newAlleleSymC in childAlleleBySymbol:
-                        childExists = 1
-                        newAlleleSym = newAlleleSymC
 
                 if childExists:
 
-                        cellLineExists = 0
-                        colonyExists = 0
                         childKey = childAlleleBySymbol[newAlleleSym][0]['_Allele_key']
 
                         if childAlleleBySymbol[newAlleleSym][0]['_Allele_Status_key'] == 847113:
                                 isReserved = 1
 
-                        if childKey in cellLineByKey:
-                                for c in cellLineByKey[childKey]:
-                                        if c['cellLine'] == ikmc_escell_name_8:
-                                                cellLineExists = 1
-
-                        if childKey in ikmcNotes:
-                                for c in ikmcNotes[childKey]:
-                                        if c['note'].find(ikmc_colony_11) != -1:
-                                                colonyExists = 1
+                        cellLineExists = ikmcIndex.hasCellLine(childKey, ikmc_escell_name_8)
+                        colonyExists = ikmcIndex.hasColony(childKey, ikmc_colony_11)
 
                         #
                         # if the child exists 
@@ -672,8 +905,8 @@ def createAlleleFile():
                         # and the child's status is *not* reserved
                         #
                         if cellLineExists and colonyExists and not isReserved:
-                                logit = 'Child/Cell Line/Colony already exists in MGI line %s: ' % lineNum
-                                logitExists.append(logit + ikmc_marker_symbol_1 + '\t' + \
+                                logit = 'Child/Cell Line/Colony already exists in MGI line %s: '
+                                logRow('exists', logit, lineNum, fingerprint, ikmc_marker_symbol_1 + '\t' + \
                                         ikmc_marker_id_2 + '\t' + \
                                         ikmc_allele_symbol_6 + '\t' + \
                                         ikmc_allele_escell_symbol_7 + '\t' + \
@@ -694,79 +927,27 @@ def createAlleleFile():
         # new Allele has passed the rules...ready to create the new allele
         #
 
-        if isX and isCre:
-                alleleType = 'Targeted'
-                alleleSubType = 'Null/knockout|Reporter'
-                molecularMutation = 'Insertion|Intragenic deletion'
-                newAlleleSym = newAlleleSym1
-                newAlleleName = newAlleleName1
-                n = alleleSym.replace('>', '</sup>')
-                n = n.replace('<tm', '<sup>tm')
-                molecularNote = note_tmX1 % (n)
+        newAlleleName = child['name']
+        alleleType = child['alleleType']
+        alleleSubType = child['alleleSubType']
+        molecularMutation = child['molecularMutation']
+        molecularNote = child['molecularNote']
 
-        elif isXe and isCre:
-                alleleType = 'Targeted'
-                alleleSubType = 'Null/knockout|Reporter'
-                molecularMutation = 'Insertion'
-                newAlleleSym = newAlleleSym1
-                newAlleleName = newAlleleName1
-                n = alleleSym.replace('>', '</sup>')
-                n = n.replace('<tm', '<sup>tm')
-                molecularNote = note_tmXe % (n)
-
-        elif isX and isFlp:
-                alleleType = 'Targeted'
-                alleleSubType = 'Null/knockout'
-                molecularMutation = 'Insertion'
-                newAlleleSym = newAlleleSym2
-                newAlleleName = newAlleleName2
-                n = alleleSym.replace('>', '</sup>')
-                n = n.replace('<tm', '<sup>tm')
-                molecularNote = note_tmX2 % (n)
-
-        elif isXa and isCre:
-                alleleType = 'Targeted'
-                alleleSubType = 'Null/knockout|Reporter'
-                molecularMutation = 'Insertion|Intragenic deletion'
-                newAlleleSym = newAlleleSymB
-                newAlleleName = newAlleleNameB
-                n = alleleSym.replace('>', '</sup>')
-                n = n.replace('<tm', '<sup>tm')
-                molecularNote = note_tmXb % (n)
-
-        elif isXa and isFlp:
-                alleleType = 'Targeted'
-                alleleSubType = 'Conditional ready'
-                molecularMutation = 'Insertion'
-                newAlleleSym = newAlleleSymC
-                newAlleleName = newAlleleNameC
-                n = alleleSym.replace('>', '</sup>')
-                n = n.replace('<tm', '<sup>tm')
-                molecularNote = note_tmXc % (n)
-                
         #
         # if the new Allele has already been created (it's a duplicate)
         #
 
         attachCellLine = 0
         attachColony = 0
-        print('newAlleleSym: %s' % newAlleleSym)
-        if newAlleleSym in alleleAdded:
-
-                attachCellLine = 1
-                attachColony = 1
-
-                for a in alleleAdded[newAlleleSym]:
-                        if a == ikmc_escell_name_8:
-                                attachCellLine = 0
+        loadLog.debug('newAlleleSym: %s', newAlleleSym)
+        if ikmcDuplicates.hasChild(newAlleleSym):
 
-                for a in colonyAdded[newAlleleSym]:
-                        if a == ikmc_colony_11:
-                                attachColony = 0
+                attachCellLine = not ikmcDuplicates.hasCellLine(newAlleleSym, ikmc_escell_name_8)
+                attachColony = not ikmcDuplicates.hasColony(newAlleleSym, ikmc_colony_11)
 
                 if not attachCellLine and not attachColony:
-                        logit = 'Duplicate: child already added by this load line %s: ' % lineNum
-                        logitExists.append(logit + ikmc_marker_symbol_1 + '\t' + \
+                        logit = 'Duplicate: child already added by this load line %s: '
+                        logRow('exists', logit, lineNum, None, ikmc_marker_symbol_1 + '\t' + \
                                 ikmc_marker_id_2 + '\t' + \
                                 ikmc_allele_symbol_6 + '\t' + \
                                 ikmc_allele_escell_symbol_7 + '\t' + \
@@ -778,79 +959,19 @@ def createAlleleFile():
                                 alleleSym + '\n')
                         continue
                 else:
-                        print('alleleAdded[%s].append(%s)' % (newAlleleSym, ikmc_escell_name_8))
-                        alleleAdded[newAlleleSym].append(ikmc_escell_name_8)
-                        print('colonyAdded[%s].append(%s)' % (newAlleleSym, ikmc_colony_11))
-                        colonyAdded[newAlleleSym].append(ikmc_colony_11)
+                        loadLog.debug('duplicate child %s: add cell line %s, colony %s', \
+                                newAlleleSym, ikmc_escell_name_8, ikmc_colony_11)
+                        ikmcDuplicates.add(newAlleleSym, ikmc_escell_name_8, ikmc_colony_11)
 
         # update the new allele list
         elif int(childKey) == 0:
-                alleleAdded[newAlleleSym] = []
-                alleleAdded[newAlleleSym].append(ikmc_escell_name_8)
-                colonyAdded[newAlleleSym] = []
-                colonyAdded[newAlleleSym].append(ikmc_colony_11)
+                ikmcDuplicates.add(newAlleleSym, ikmc_escell_name_8, ikmc_colony_11)
 
         #
         # ready to create the Allele
         #
 
-        print('ready to create the Allele')
-        # Marker ID
-        fpAllele.write(ikmc_marker_id_2 + '\t')
-
-        # Allele Symbol
-        fpAllele.write(newAlleleSym + '\t')
-
-        # Allele Name
-        fpAllele.write(newAlleleName + '\t')
-
-        # Allele Status
-        fpAllele.write('Approved' + '\t')
-
-        # Allele Type
-        fpAllele.write(alleleType + '\t')
-
-        # Allele Subtype
-        fpAllele.write(alleleSubType + '\t')
-
-        # Allele Collection
-        fpAllele.write(str(collectionKey) + '\t')
-
-        # Transmission
-        fpAllele.write('Germline' + '\t')
-
-        # Reference
-        fpAllele.write('Original|' + jnumber + '||Transmission|' + jnumber + '||Molecular|' + jnumber + '\t')
-
-        # Strain of Origin
-        fpAllele.write(strainOfOrigin + '\t')
-
-        # Mutant Cell Line
-        fpAllele.write(ikmc_escell_name_8 + '\t')
-
-        # Molecular Notes
-        fpAllele.write(molecularNote + '\t')
-
-        # Drive Note
-        fpAllele.write('\t')
-
-        # IKMC Allele Colony Name Note (1041)
-        fpAllele.write(ikmc_colony_11 + '\t')
-
-        # Molecular Mutation
-        fpAllele.write(molecularMutation + '\t')
-
-        # Inheritance Mode
-        fpAllele.write('Not Applicable' + '\t')
-
-        # Mixed
-        fpAllele.write('0' + '\t')
-
-        # Exitinct
-        fpAllele.write('0' + '\t')
-
-        # Created By
-        fpAllele.write(createdBy + '\t')
+        loadLog.debug('ready to create the Allele')
 
         #
         # Add additional mutant cell line to a new or existing allele
@@ -859,11 +980,11 @@ def createAlleleFile():
         # > 0 => allele/child key of existing allele
         # blank => do nothing
         #
+        createMCL = ''
         if attachCellLine:
-                fpAllele.write('0')
+                createMCL = '0'
         elif childExists and not cellLineExists:
-                fpAllele.write(str(childKey))
-        fpAllele.write('\t')
+                createMCL = str(childKey)
 
         #
         # Add IKMC Colony/Note to a new or existing allele
@@ -879,66 +1000,108 @@ def createAlleleFile():
         #
         # blank => do nothing
         #
-
+        createNote = ''
         if childExists and childKey in ikmcNotes:
-                ikmcNote = ikmcNotes[childKey]
-                note = ikmcNote[0]['note']
+                noteKey, note = ikmcNotes[childKey]
                 note = note.replace('\n', '')
-                fpAllele.write(str(ikmcNote[0]['_Note_key']) + '||' + note)
+                createNote = str(noteKey) + '||' + note
 
         elif childExists and childKey not in ikmcNotes:
-                fpAllele.write(str(childKey) + '::')
+                createNote = str(childKey) + '::'
 
         elif attachColony:
-                fpAllele.write('0::')
-                fpAllele.write('|'.join(colonyAdded[newAlleleSym]))
-        fpAllele.write('\t')
+                createNote = '0::' + '|'.join(ikmcDuplicates.colonies(newAlleleSym))
 
         #
         # Set the child's Allele Status = Approved
         #
-
+        setStatus = ''
         if isReserved:
-                fpAllele.write(str(childKey))
-        fpAllele.write('\t')
+                setStatus = str(childKey)
 
         #
         # Child Allele MGI ID
         #
+        existingAlleleID = ''
         if newAlleleSym in childAlleleBySymbol:
-                fpAllele.write(childAlleleBySymbol[newAlleleSym][0]['accID'])
-        fpAllele.write('\t')
+                existingAlleleID = childAlleleBySymbol[newAlleleSym][0]['accID']
 
         #
         # Allele Symbol nomenclature minus the Marker name
         # 	Syt17<tm1b(KOMP)Wtsi> => tm1b(KOMP)Wtsi
         #
-
         p1 = newAlleleSym.find('<')
         p2 = newAlleleSym.find('>')
-        fpAllele.write(newAlleleSym[p1+1:p2] + '\n')
 
-    return 0
+        yield lineNum, alleleRecord.format(alleleRecord.AlleleRecord(
+                markerID = ikmc_marker_id_2,
+                symbol = newAlleleSym,
+                name = newAlleleName,
+                alleleStatus = 'Approved',
+                alleleType = alleleType,
+                alleleSubtypes = alleleSubType,
+                collectionKey = collectionKey,
+                germLine = 'Germline',
+                references = 'Original|' + jnumber + '||Transmission|' + jnumber + '||Molecular|' + jnumber,
+                strainOfOrigin = strainOfOrigin,
+                mutantCellLine = ikmc_escell_name_8,
+                molecularNotes = molecularNote,
+                driverNotes = '',
+                ikmcNotes = ikmc_colony_11,
+                mutations = molecularMutation,
+                inheritanceMode = 'Not Applicable',
+                isMixed = '0',
+                isExtinct = '0',
+                createdBy = createdBy,
+                createMCL = createMCL,
+                createNote = createNote,
+                setStatus = setStatus,
+                existingAlleleID = existingAlleleID,
+                ikmcSymbol = newAlleleSym[p1+1:p2]))
 
 def writeReports():
     logitSkip.sort()
     fpSkipDiag.write('\n'.join(logitSkip))
-    fpExistsDiag.write('\n'.join(logitExists))
+    fpExistsDiag.write('\n'.join([e[1] for e in logitExists]))
     return 0
 #
 #  MAIN
 #
 
-if initialize() != 0:
-    sys.exit(1)
+if __name__ == '__main__':
 
-if openFiles() != 0:
-    sys.exit(1)
+    metricsFileName = os.getenv('OUTPUTDIR', '.') + '/makeIKMC.metrics.json'
 
-if createAlleleFile() != 0:
-    closeFiles()
-    sys.exit(1)
+    # number of db round trips per stage
+    if os.getenv('SQL_LOG', 'profile') == 'profile':
+        sqlProfile.enable()
+        loadMetrics.counters['sqlCalls'] = sqlProfile.totalCalls
+
+    with loadMetrics.stage('initialize') as m:
+        rc = initialize()
+        m['rowsOut'] = len(alleleByID) + len(childAlleleBySymbol) + len(cellLineByKey) + len(ikmcNotes)
+
+    if rc != 0:
+        sys.exit(1)
 
-writeReports()
-closeFiles()
-sys.exit(0)
+    if openFiles() != 0:
+        sys.exit(1)
+
+    with loadMetrics.stage('createAlleleFile') as m:
+        rc = createAlleleFile()
+        m['rowsIn'] = inputRows
+        m['rowsOut'] = alleleRows
+
+    if rc != 0:
+        closeFiles()
+        loadMetrics.write(metricsFileName, 'makeIKMC.py')
+        sys.exit(1)
+
+    with loadMetrics.stage('writeReports') as m:
+        writeReports()
+        m['rowsOut'] = len(logitSkip) + len(logitExists)
+
+    writeDelta()
+    closeFiles()
+    loadMetrics.write(metricsFileName, 'makeIKMC.py')
+    sys.exit(0)
@@ -36,6 +36,8 @@
 #      2) Verify that the input file exists.
 #      3) Establish the log file.
 #      4) Call makeIKMC.py to create the association file.
+#      5) Call makeAllele.sh to create the Alleles.
+#         (or, if IKMC_INPROCESS = 1, makeIKMCAllele.py for steps 4 and 5)
 #
 #  Notes:  None
 #
@@ -111,6 +113,21 @@ then
     exit 1
 fi
 
+if [ "${IKMC_INPROCESS}" = "1" ]
+then
+
+#
+# Create the IKMC/Allele records and the Alleles in one process
+#
+echo "" >> ${LOG}
+date >> ${LOG}
+echo "Create the IKMC/Alleles (makeIKMCAllele.py)" | tee -a ${LOG}
+${PYTHON} -W "ignore" ./makeIKMCAllele.py 2>&1 >> ${LOG}
+STAT=$?
+checkStatus ${STAT} 'Create the IKMC/Alleles (makeIKMCAllele.py)'
+
+else
+
 #
 # Create the IKMC/Allele input file
 #
@@ -131,6 +148,8 @@ echo "Create the Alleles (makeAllele.sh)" | tee -a ${LOG}
 STAT=$?
 checkStatus ${STAT} 'Create the Alleles (makeAllele.sh)'
 
+fi
+
 # wts2-1030;11/07/2022;per Cindy, no longer needed at this time
 # copy ${OUTPUTDIR}/mgi_allele_ikmc.txt.new to ${IKMC_FTP} directory
 #
@@ -0,0 +1,117 @@
+#
+#  makeIKMCAllele.py
+###########################################################################
+#
+#  Purpose:
+#
+#      Runs makeIKMC.py and makeAllele.py in one process.
+#
+#      The Allele records created from the IKMC file are passed straight
+#      to makeAllele instead of being written to ($INPUTFILE) and read
+#      back by a second interpreter.  Both steps share one database
+#      connection and one set of lookups.
+#
+#  Usage:
+#
+#      makeIKMCAllele.py
+#
+#  Env Vars:
+#
+#      see ikmc.config
+#
+#      WRITE_INPUTFILE	1 : also write the Allele file ($INPUTFILE) (default)
+#			0 : do not write the Allele file
+#
+#  Inputs:
+#
+#      IKMC file ($IKMC_COPY_INPUT_FILE) from GenTar
+#
+#  Outputs:
+#
+#      see makeIKMC.py and makeAllele.py
+#      ${OUTPUTDIR}/makeIKMCAllele.metrics.json : per-stage metrics
+#
+#  Exit Codes:
+#
+#      0:  Successful completion
+#      1:  An exception occurred
+#
+###########################################################################
+
+import sys
+import os
+import makeAllele
+import makeIKMC
+import loadMetrics
+
+writeAlleleFile = os.getenv('WRITE_INPUTFILE', '1') == '1'
+
+#
+# Purpose: create the Allele records from the IKMC file
+# Returns: list of Allele file lines
+#
+def createAlleleRecords():
+
+    # makeAllele.initialize() has set db.useOneConnection(1); the snapshot
+    # queries cannot run concurrently on the one shared connection
+    makeIKMC.ikmcSnapshot.workers = 1
+
+    if makeIKMC.initialize() != 0:
+        makeAllele.exit(1, 'makeIKMC: initialize failed')
+
+    if makeIKMC.openFiles(writeAlleleFile) != 0:
+        makeAllele.exit(1, 'makeIKMC: openFiles failed')
+
+    records = []
+    for record in makeIKMC.alleleRecords():
+        if makeIKMC.fpAllele:
+            makeIKMC.fpAllele.write(record)
+        records.append(record)
+
+    makeIKMC.writeReports()
+    makeIKMC.writeDelta()
+    makeIKMC.closeFiles()
+
+    return records
+
+#
+#  MAIN
+#
+
+if __name__ == '__main__':
+
+    makeAllele.metricsFileName = makeAllele.outputDir + '/makeIKMCAllele.metrics.json'
+    makeAllele.metricsProgram = 'makeIKMCAllele.py'
+
+    # opens the shared connection used by both steps
+    print('initialize')
+    with loadMetrics.stage('initialize') as m:
+        makeAllele.initialize(0)
+        m['rowsOut'] = len(makeAllele.lookupCache.termLookup)
+
+    print('createAlleleRecords')
+    with loadMetrics.stage('createAlleleRecords') as m:
+        records = createAlleleRecords()
+        m['rowsIn'] = makeIKMC.inputRows
+        m['rowsOut'] = len(records)
+
+    print('preprocessFile')
+    with loadMetrics.stage('preprocessFile') as m:
+        makeAllele.preprocessFile(records)
+        m['rowsIn'] = len(records)
+    print('setPrimaryKeys')
+    with loadMetrics.stage('setPrimaryKeys') as m:
+        makeAllele.setPrimaryKeys()
+        m['rowsOut'] = sum(makeAllele.keyCounts.values())
+    print('processFile')
+    with loadMetrics.stage('processFile') as m:
+        makeAllele.processFile()
+        makeAllele.writeCheckpoint()
+        m['rowsIn'] = len(records)
+        m['rowsOut'] = makeAllele.alleleKey - makeAllele.firstKeys['allele']
+    print('bcpFiles')
+    with loadMetrics.stage('bcpFiles') as m:
+        makeAllele.bcpFiles()
+        m['rowsOut'] = makeAllele.loadedRows
+
+    makeAllele.exit(0)
@@ -0,0 +1,160 @@
+#
+#  sqlProfile.py
+###########################################################################
+#
+#  Purpose:
+#
+#      Aggregated SQL profiling for the db module.
+#
+#      Every db.sql() call is timed and grouped by the normalised shape
+#      of the statement (literals replaced by '?').  For each shape:
+#      call count, total/mean/p95 latency and rows returned.
+#
+#  Usage:
+#
+#      import sqlProfile
+#      sqlProfile.enable()
+#      ...
+#      fp.write(sqlProfile.summary(20))
+#
+#  Notes:
+#
+#      enable() replaces db.sql by a timing wrapper, so the statements
+#      issued by loadlib and the other libraries are profiled as well.
+#
+#      The memory per shape is bounded: the p95 is taken from a random
+#      sample (reservoir) of at most reservoirSize latencies.
+#
+#      The wrapper may be called from several threads (ikmcSnapshot);
+#      the statistics are updated under a lock.
+#
+###########################################################################
+
+import re
+import time
+import random
+import threading
+import db
+
+# key = statement shape
+# value = [calls, total latency in seconds, [sample of latencies], rows returned]
+statements = {}
+statementsLock = threading.Lock()
+
+# latencies kept per shape for the p95
+reservoirSize = 1000
+
+# the db.sql() that is wrapped
+dbSql = None
+
+stringRE = re.compile(r"'(?:[^']|'')*'")
+numberRE = re.compile(r'\b\d+(\.\d+)?\b')
+listRE = re.compile(r'\?(\s*,\s*\?)+')
+valuesRE = re.compile(r'\(\?\)(\s*,\s*\(\?\))+')
+spaceRE = re.compile(r'\s+')
+
+#
+# Purpose: returns the shape of a statement
+#
+def normalise(cmd):
+
+    shape = stringRE.sub('?', cmd)
+    shape = numberRE.sub('?', shape)
+    shape = listRE.sub('?', shape)
+    shape = valuesRE.sub('(?)', shape)
+    return spaceRE.sub(' ', shape).strip()
+
+#
+# Purpose: returns the number of rows in a db.sql() result
+#
+def countRows(results):
+
+    if not isinstance(results, list):
+        return 0
+
+    rows = 0
+    for r in results:
+        if isinstance(r, list):
+            rows += len(r)
+        else:
+            rows += 1
+
+    return rows
+
+#
+# Purpose: db.sql() wrapper; times and records the statement
+#
+def profiledSql(cmd, *args, **kw):
+
+    startTime = time.time()
+    results = dbSql(cmd, *args, **kw)
+    elapsed = time.time() - startTime
+
+    if isinstance(cmd, list):
+        shape = '; '.join(map(normalise, cmd))
+    else:
+        shape = normalise(cmd)
+
+    rowCount = countRows(results)
+
+    with statementsLock:
+
+        if shape not in statements:
+            statements[shape] = [0, 0.0, [], 0]
+
+        s = statements[shape]
+        s[0] += 1
+        s[1] += elapsed
+        s[3] += rowCount
+
+        # reservoir sampling: each latency is kept with probability
+        # reservoirSize / calls
+        if len(s[2]) < reservoirSize:
+            s[2].append(elapsed)
+        else:
+            i = random.randrange(s[0])
+            if i < reservoirSize:
+                s[2][i] = elapsed
+
+    return results
+
+#
+# Purpose: start profiling
+#
+def enable():
+
+    global dbSql
+
+    if dbSql is None:
+        dbSql = db.sql
+        db.sql = profiledSql
+
+#
+# Purpose: returns the total number of db.sql() calls
+#
+def totalCalls():
+    return sum([s[0] for s in statements.values()])
+
+#
+# Purpose: returns the top N statement shapes by total latency, as text
+#
+def summary(topN = 20):
+
+    rows = []
+    for shape in statements:
+        calls, total, latencies, rowCount = statements[shape]
+        latencies = sorted(latencies)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        rows.append((total, calls, total / calls, p95, rowCount, shape))
+
+    rows.sort(reverse = True)
+
+    lines = ['SQL profile: %s calls, %s statement shapes, %.3f seconds\n' \
+                % (totalCalls(), len(statements), sum([r[0] for r in rows]))]
+    lines.append('%10s %8s %10s %10s %10s  %s\n' % ('total(s)', 'calls', 'mean(ms)', 'p95(ms)', 'rows', 'statement'))
+
+    for total, calls, mean, p95, rowCount, shape in rows[:topN]:
+        lines.append('%10.3f %8d %10.2f %10.2f %10d  %s\n' \
+                % (total, calls, mean * 1000, p95 * 1000, rowCount, shape[:200]))
+
+    return ''.join(lines)
@@ -0,0 +1,261 @@
+#
+#  genGenTar.py
+###########################################################################
+#
+#  Purpose:
+#
+#      Generates a synthetic GenTar file (mgi_modification_current) and a
+#      matching stand-in database fixture (see test/standin/db.py).
+#
+#      The same seed always generates the same files.  The rows mix:
+#
+#	tmX / tmXa / tmXe parents (KOMP, EUCOMM)
+#	cre / flp excisions
+#	children that already exist in MGI (approved or reserved), with or
+#	without the row's cell line/colony
+#	duplicates (same row, or same child with another es cell line)
+#	rows the rules skip (unknown marker, bad es cell line, bad TAT-Cre,
+#	field 17 already set)
+#
+#  Usage:
+#
+#      genGenTar.py rows outputDir [seed]
+#
+#  Outputs:
+#
+#      outputDir/mgi_modification_current
+#      outputDir/fixture.json
+#
+###########################################################################
+
+import sys
+import os
+import json
+import random
+
+approvedKey = 847114
+reservedKey = 847113
+ikmcNoteTypeKey = 1041
+
+header = ['Marker Symbol', 'MGI Marker ID', 'Production Plan Colony Name',
+          'Production Plan Colony Background Strain', 'Production Work Unit',
+          'Production Mutation Allele Symbol', 'Es Cell Allele Symbol', 'ES Cell Name',
+          'ES Cell Allele Accession ID', 'ES Cell Parent', 'Modification Plan Colony Name',
+          'Excision Type', 'Tat Cre Phenotype Attempt Deleter Strain', 'Deleter Strain',
+          'Modification Plan Colony Background Strain', 'Modification Work Unit',
+          'Modification Mutation Accession ID', 'Modification Mutation Symbol',
+          'Mutation Identifier']
+
+terms = [
+    (35, 'Not Applicable'),
+    (36, 'Insertion'),
+    (36, 'Intragenic deletion'),
+    (37, 'Approved'),
+    (37, 'Reserved'),
+    (38, 'Targeted'),
+    (61, 'Germline'),
+    (93, 'Null/knockout'),
+    (93, 'Reporter'),
+    (93, 'Conditional ready'),
+    ]
+
+strains = ['C57BL/6N', 'C57BL/6NTac', 'C57BL/6N-A<tm1Brd>/a']
+
+#
+# Purpose: returns the child symbol/name suffix for a parent kind and excision
+#
+def childSuffix(kind, excision):
+
+    if kind == 'a':
+        return {'cre' : 'b', 'flp' : 'c'}[excision]
+    return {'cre' : '.1', 'flp' : '.2'}[excision]
+
+def childSymbol(parentSymbol, kind, excision):
+
+    if kind == 'a':
+        return parentSymbol.replace('a(', childSuffix(kind, excision) + '(')
+    tm = parentSymbol.split('<')[1].split('(')[0]
+    return parentSymbol.replace(tm, tm + childSuffix(kind, excision))
+
+class Fixture:
+
+    def __init__(self):
+        self.tables = {}
+        self.keys = {}
+
+    def key(self, name, start):
+        self.keys[name] = self.keys.get(name, start) + 1
+        return self.keys[name]
+
+    def add(self, table, row):
+        self.tables.setdefault(table, []).append(row)
+
+    def accession(self, accID, prefixPart, numericPart, objectKey, mgiTypeKey):
+        self.add('ACC_Accession', {'_Accession_key' : self.key('acc', 100000000),
+            'accID' : accID, 'prefixPart' : prefixPart, 'numericPart' : numericPart,
+            '_LogicalDB_key' : 1, '_Object_key' : objectKey, '_MGIType_key' : mgiTypeKey,
+            'private' : 0, 'preferred' : 1})
+
+    def cellLine(self, alleleKey, cellLine):
+        cellLineKey = self.key('cellLine', 1000000)
+        self.add('ALL_CellLine', {'_CellLine_key' : cellLineKey, 'cellLine' : cellLine,
+            'isMutant' : 1, '_Derivation_key' : 1})
+        self.add('ALL_Allele_CellLine', {'_Assoc_key' : self.key('cellLineAssoc', 1000000),
+            '_Allele_key' : alleleKey, '_MutantCellLine_key' : cellLineKey})
+
+#
+# Purpose: generate the GenTar rows and the fixture
+# Returns: (list of rows, fixture)
+#
+def generate(rows, seed = 42):
+
+    rng = random.Random(seed)
+    f = Fixture()
+
+    for i in range(len(terms)):
+        f.add('VOC_Term', {'_Term_key' : 10000 + i, '_Vocab_key' : terms[i][0],
+            'term' : terms[i][1], 'modification_date' : '2025-01-01 00:00:00'})
+    for i in range(len(strains)):
+        f.add('PRB_Strain', {'_Strain_key' : 100 + i, 'strain' : strains[i]})
+    f.add('MGI_User', {'_User_key' : 1001, 'login' : 'ikmc_alleleload'})
+    f.accession('J:204739', 'J:', 204739, 204739, 1)
+    f.add('ACC_AccessionMax', {'prefixPart' : 'MGI:', 'maxNumericPart' : 7000000})
+
+    nParents = max(10, rows // 5)
+    parents = []
+    colonyNum = 0
+
+    for i in range(nParents):
+
+        markerKey = 10000 + i
+        markerSym = 'Gm%d' % (10000 + i)
+        markerID = 'MGI:%d' % (1000000 + i)
+        f.add('MRK_Marker', {'_Marker_key' : markerKey, 'symbol' : markerSym, '_Marker_Status_key' : 1})
+        f.accession(markerID, 'MGI:', 1000000 + i, markerKey, 2)
+
+        kind = rng.choices(['', 'a', 'e'], [30, 55, 15])[0]
+        tm = 'tm%d%s' % (rng.randint(1, 3), kind)
+        lab = rng.choice(['KOMP', 'EUCOMM'])
+        alleleKey = f.key('allele', 1000000)
+        symbol = '%s<%s(%s)Wtsi>' % (markerSym, tm, lab)
+        name = 'predicted gene %d; targeted mutation %s, Wellcome Trust Sanger Institute' % (10000 + i, tm[2:])
+        f.add('ALL_Allele', {'_Allele_key' : alleleKey, 'symbol' : symbol, 'name' : name,
+            '_Allele_Status_key' : approvedKey, '_Collection_key' : 1,
+            '_Strain_key' : rng.choice([100, 101, 102]), '_Marker_key' : markerKey})
+        alleleID = 'MGI:%d' % (5000000 + i)
+        f.accession(alleleID, 'MGI:', 5000000 + i, alleleKey, 11)
+
+        cellLines = []
+        for j in range(rng.randint(1, 3)):
+            cellLines.append('EPD%07d_%s' % (i, 'ABCDEFGH'[j]))
+            f.cellLine(alleleKey, cellLines[-1])
+
+        p = {'markerSym' : markerSym, 'markerID' : markerID, 'kind' : kind, 'symbol' : symbol,
+             'alleleID' : alleleID, 'cellLines' : cellLines, 'child' : None}
+
+        # existing child, with one cell line and one colony
+        if rng.random() < 0.25:
+            if kind == 'e':
+                excision = 'cre'
+            else:
+                excision = rng.choice(['cre', 'flp'])
+            childKey = f.key('allele', 1000000)
+            colonyNum += 1
+            colony = 'COL%07d' % (colonyNum)
+            f.add('ALL_Allele', {'_Allele_key' : childKey, 'symbol' : childSymbol(symbol, kind, excision),
+                'name' : name, '_Allele_Status_key' : rng.choice([approvedKey] * 4 + [reservedKey]),
+                '_Collection_key' : 1, '_Strain_key' : 100, '_Marker_key' : markerKey})
+            f.accession('MGI:%d' % (6000000 + i), 'MGI:', 6000000 + i, childKey, 11)
+            f.cellLine(childKey, cellLines[0])
+            if rng.random() < 0.8:
+                f.add('MGI_Note', {'_Note_key' : f.key('note', 1000000), '_Object_key' : childKey,
+                    '_MGIType_key' : 11, '_NoteType_key' : ikmcNoteTypeKey, 'note' : colony})
+            p['child'] = (excision, cellLines[0], colony)
+
+        parents.append(p)
+
+    lines = []
+    for r in range(rows):
+
+        # duplicate of an earlier row
+        if lines and rng.random() < 0.05:
+            lines.append(rng.choice(lines))
+            continue
+
+        p = rng.choice(parents)
+        colonyNum += 1
+        colony = 'COL%07d' % (colonyNum)
+        cellLine = rng.choice(p['cellLines'])
+
+        if p['kind'] == 'e':
+            excision = rng.choices(['cre', 'flp'], [90, 10])[0]
+        else:
+            excision = rng.choice(['cre', 'flp'])
+
+        # row for an existing child, with its cell line and colony or new ones
+        if p['child'] and rng.random() < 0.5:
+            excision = p['child'][0]
+            if rng.random() < 0.5:
+                cellLine = p['child'][1]
+                colony = p['child'][2]
+
+        tokens = [p['markerSym'], p['markerID'], 'PC%07d' % (r), 'C57BL/6N', 'WTSI',
+                  p['symbol'], p['symbol'], cellLine, p['alleleID'], 'JM8A3.N1', colony,
+                  excision, 'false', '', 'C57BL/6NTac', 'WTSI', '', '', '']
+
+        # rows the rules skip
+        bad = rng.random()
+        if bad < 0.01:
+            tokens[1] = 'MGI:9%06d' % (r % 1000000)
+        elif bad < 0.02:
+            tokens[7] = 'EPD_UNKNOWN_%d' % (r)
+        elif bad < 0.03:
+            tokens[12] = ''
+        elif bad < 0.04:
+            tokens[16] = 'MGI:6%06d' % (r % 1000000)
+
+        lines.append('\t'.join(tokens) + '\n')
+
+    keys = f.keys
+    f.sequences = {
+        'all_allele_seq' : keys['allele'],
+        'acc_accession_seq' : keys['acc'],
+        'mgi_note_seq' : keys.get('note', 1000000),
+        'all_allele_cellline_seq' : keys['cellLineAssoc'],
+        'mgi_reference_assoc_seq' : 1000000,
+        'all_allele_mutation_seq' : 1000000,
+        'voc_annot_seq' : 1000000,
+        }
+
+    return ['\t'.join(header) + '\n'] + lines, f
+
+#
+# Purpose: write the GenTar file and the fixture
+#
+def write(rows, outputDir, seed = 42):
+
+    lines, f = generate(rows, seed)
+
+    if not os.path.exists(outputDir):
+        os.makedirs(outputDir)
+
+    fp = open(os.path.join(outputDir, 'mgi_modification_current'), 'w')
+    fp.write(''.join(lines))
+    fp.close()
+
+    fp = open(os.path.join(outputDir, 'fixture.json'), 'w')
+    json.dump({'tables' : f.tables, 'sequences' : f.sequences}, fp)
+    fp.close()
+
+if __name__ == '__main__':
+
+    if len(sys.argv) < 3:
+        print('Usage: genGenTar.py rows outputDir [seed]')
+        sys.exit(1)
+
+    seed = 42
+    if len(sys.argv) > 3:
+        seed = int(sys.argv[3])
+
+    write(int(sys.argv[1]), sys.argv[2], seed)
+    sys.exit(0)
@@ -0,0 +1,158 @@
+#
+#  runBenchmark.py
+###########################################################################
+#
+#  Purpose:
+#
+#      Throughput benchmark of makeIKMC.py and makeAllele.py.
+#
+#      For each size, a synthetic GenTar file and fixture are generated
+#      (genGenTar.py, fixed seed) and both loaders are run against the
+#      stand-in database (test/standin).  The per-stage metrics files of
+#      the loaders are collected into one report:
+#
+#	rows in/out, wall seconds, rows/second, peak RSS and db round trips
+#	(sqlCalls) per stage
+#
+#  Usage:
+#
+#      runBenchmark.py [workDir] [sizes] [seed]
+#
+#      workDir	default /tmp/alleleload.benchmark
+#      sizes	comma-separated row counts, default 1000,10000,100000,1000000
+#      seed	default 42
+#
+#  Outputs:
+#
+#      workDir/<size>/... : generated files, loader output and logs
+#      workDir/benchmark.json : all stages of all sizes
+#      report on stdout
+#
+###########################################################################
+
+import sys
+import os
+import json
+import subprocess
+import genGenTar
+
+benchmarkDir = os.path.dirname(os.path.abspath(__file__))
+installDir = os.path.dirname(os.path.dirname(benchmarkDir))
+standinDir = os.path.join(installDir, 'test', 'standin')
+binDir = os.path.join(installDir, 'bin')
+
+defaultSizes = [1000, 10000, 100000, 1000000]
+
+#
+# Purpose: returns the loader environment for one size
+#
+def environment(runDir):
+
+    env = dict(os.environ)
+    env.update({
+        'PYTHONPATH' : standinDir + os.pathsep + binDir,
+        'STANDIN_FIXTURE' : os.path.join(runDir, 'fixture.json'),
+        'STANDIN_BCPLOG' : os.path.join(runDir, 'bcp.log'),
+        'PG_DBUTILS' : standinDir,
+        'MGD_DBUSER' : 'standin',
+        'MGD_DBPASSWORDFILE' : os.devnull,
+        'OUTPUTDIR' : runDir,
+        'LOG_DIAG' : os.path.join(runDir, 'ikmc.diag.log'),
+        'LOG_CUR' : os.path.join(runDir, 'ikmc.cur.log'),
+        'SKIP_DIAG' : os.path.join(runDir, 'ikmc.skip.log'),
+        'EXISTS_DIAG' : os.path.join(runDir, 'ikmc.exist.log'),
+        'IKMC_COPY_INPUT_FILE' : os.path.join(runDir, 'mgi_modification_current'),
+        'INPUTFILE' : os.path.join(runDir, 'mgi_allele_ikmc.txt'),
+        'JNUMBER' : 'J:204739',
+        'CREATEDBY' : 'ikmc_alleleload',
+        'SQL_LOG' : 'profile',
+        'LOAD_MODE' : 'bcp',
+        })
+
+    for name in ['TERM_CACHE_FILE', 'IKMC_DELTA', 'IKMC_INPROCESS']:
+        env.pop(name, None)
+
+    return env
+
+#
+# Purpose: run one loader
+# Returns: its metrics (see loadMetrics.py)
+#
+def runLoader(program, runDir, env):
+
+    log = open(os.path.join(runDir, program + '.log'), 'w')
+    rc = subprocess.call([sys.executable, os.path.join(binDir, program)], \
+            cwd = runDir, env = env, stdout = log, stderr = subprocess.STDOUT)
+    log.close()
+
+    if rc != 0:
+        raise Exception('%s failed (%s); see %s' % (program, rc, os.path.join(runDir, program + '.log')))
+
+    fp = open(os.path.join(runDir, program.replace('.py', '.metrics.json')), 'r')
+    metrics = json.load(fp)
+    fp.close()
+
+    return metrics
+
+#
+# Purpose: run both loaders for one size
+# Returns: list of stages (program, size added)
+#
+def runSize(workDir, size, seed):
+
+    runDir = os.path.join(workDir, str(size))
+    genGenTar.write(size, runDir, seed)
+    env = environment(runDir)
+
+    if os.path.exists(env['STANDIN_BCPLOG']):
+        os.remove(env['STANDIN_BCPLOG'])
+
+    stages = []
+    for program in ['makeIKMC.py', 'makeAllele.py']:
+        metrics = runLoader(program, runDir, env)
+        for s in metrics['stages']:
+            s['program'] = program
+            s['size'] = size
+            stages.append(s)
+
+    return stages
+
+#
+# Purpose: returns the report, as text
+#
+def report(stages):
+
+    lines = ['%10s %-14s %-16s %10s %10s %10s %12s %10s %8s\n' % ('size', 'program', 'stage', \
+        'rowsIn', 'rowsOut', 'seconds', 'rows/sec', 'peakRSSKB', 'sqlCalls')]
+
+    for s in stages:
+        lines.append('%10s %-14s %-16s %10s %10s %10.3f %12s %10s %8s\n' % (s['size'], s['program'], \
+            s['stage'], s['rowsIn'], s['rowsOut'], s['wallSeconds'], s['rowsPerSecond'], \
+            s['peakRSSKB'], s.get('sqlCalls', '')))
+
+    return ''.join(lines)
+
+if __name__ == '__main__':
+
+    workDir = '/tmp/alleleload.benchmark'
+    sizes = defaultSizes
+    seed = 42
+
+    if len(sys.argv) > 1:
+        workDir = sys.argv[1]
+    if len(sys.argv) > 2:
+        sizes = [int(s) for s in sys.argv[2].split(',')]
+    if len(sys.argv) > 3:
+        seed = int(sys.argv[3])
+
+    stages = []
+    for size in sizes:
+        print('size %s' % (size))
+        stages = stages + runSize(workDir, size, seed)
+
+    fp = open(os.path.join(workDir, 'benchmark.json'), 'w')
+    json.dump({'seed' : seed, 'sizes' : sizes, 'stages' : stages}, fp, indent = 1)
+    fp.close()
+
+    print(report(stages))
+    sys.exit(0)
@@ -0,0 +1,619 @@
+#
+#  db.py (stand-in)
+###########################################################################
+#
+#  Purpose:
+#
+#      In-memory stand-in for the MGI db module, so that makeIKMC.py and
+#      makeAllele.py can run without a database (see test/benchmark and
+#      test/test_alleleload.py).
+#
+#      The tables are seeded from fixture tables; db.sql() answers the
+#      statements the loaders issue, by statement shape, and applies their
+#      updates to the tables.
+#
+#      Every statement is recorded (statements, STANDIN_LOG), as is every
+#      bulk load (bcpLoads): bcp loads by the stand-in bcpin.csh, copy
+#      loads through the stand-in psycopg2 (LOAD_MODE = copy).  Loaded rows are
+#      added to the tables, so that later statements see them.
+#
+#  Usage:
+#
+#      the stand-in is selected by the environment; the loaders are not changed
+#
+#      PYTHONPATH=test/standin:bin PG_DBUTILS=test/standin \
+#      STANDIN_FIXTURE=fixture.json python bin/makeIKMC.py
+#
+#      db.register(r'^select ... from my_table', handler) adds a handler
+#      for a statement shape (handler(statement) returns the result rows)
+#
+#  Env Vars:
+#
+#      STANDIN_FIXTURE	fixture file (json):
+#			{"tables" : {"ALL_Allele" : [{column : value, ...}, ...], ...},
+#			 "sequences" : {"all_allele_seq" : lastValue, ...}}
+#			or a directory of fixture tables, one file per table:
+#			ALL_Allele.txt, tab-delimited, column names on the first
+#			line (sequences.txt : sequence, lastValue)
+#      STANDIN_LOG	optional; every statement is appended to this file
+#      STANDIN_BCPLOG	optional; bcp loads, written by bin/bcpin.csh and
+#			read back by db.sql()
+#
+#  Notes:
+#
+#      Statements that are not recognised raise an exception, so that a
+#      new query in the loaders is noticed.
+#
+###########################################################################
+
+import os
+import re
+import json
+import datetime
+
+# key = lower case table name, value = list of rows (dict)
+tables = {}
+
+# key = sequence name, value = [last value, increment]
+sequences = {}
+
+# number of db.sql() statements / commits
+calls = 0
+commits = 0
+
+# executed statements: [statement, number of result rows]
+statements = []
+
+# bulk loads: [method (bcp|copy), table, rows]
+bcpLoads = []
+
+# number of STANDIN_BCPLOG lines already applied
+bcpLogLines = 0
+
+# columns of the bulk-loaded tables, in bcp file order (see makeAllele.py)
+bcpColumns = {
+    'all_allele' : ['_Allele_key', '_Marker_key', '_Strain_key', '_Mode_key', '_Allele_Type_key',
+        '_Allele_Status_key', '_Transmission_key', '_Collection_key', 'symbol', 'name',
+        'isWildType', 'isExtinct', 'isMixed', '_Refs_key', '_MarkerAllele_Status_key',
+        '_CreatedBy_key', '_ModifiedBy_key', '_ApprovedBy_key', 'approval_date',
+        'creation_date', 'modification_date'],
+    'all_allele_mutation' : ['_Assoc_key', '_Allele_key', '_Mutation_key',
+        'creation_date', 'modification_date'],
+    'all_allele_cellline' : ['_Assoc_key', '_Allele_key', '_MutantCellLine_key',
+        '_CreatedBy_key', '_ModifiedBy_key', 'creation_date', 'modification_date'],
+    'mgi_reference_assoc' : ['_Assoc_key', '_Refs_key', '_Object_key', '_MGIType_key',
+        '_RefAssocType_key', '_CreatedBy_key', '_ModifiedBy_key', 'creation_date', 'modification_date'],
+    'acc_accession' : ['_Accession_key', 'accID', 'prefixPart', 'numericPart', '_LogicalDB_key',
+        '_Object_key', '_MGIType_key', 'private', 'preferred', '_CreatedBy_key', '_ModifiedBy_key',
+        'creation_date', 'modification_date'],
+    'acc_accessionreference' : ['_Accession_key', '_Refs_key', '_CreatedBy_key', '_ModifiedBy_key',
+        'creation_date', 'modification_date'],
+    'mgi_note' : ['_Note_key', '_Object_key', '_MGIType_key', '_NoteType_key', 'note',
+        '_CreatedBy_key', '_ModifiedBy_key', 'creation_date', 'modification_date'],
+    'voc_annot' : ['_Annot_key', '_AnnotType_key', '_Object_key', '_Term_key', '_Qualifier_key',
+        'creation_date', 'modification_date'],
+    }
+
+sqlLogFunction = None
+server = 'standin'
+database = ''
+
+#
+# Purpose: returns a fixture/bcp value as int, None ('') or str
+#
+def fixtureValue(value):
+
+    if value == '':
+        return None
+    if intRE.match(value):
+        return int(value)
+    return value
+
+#
+# Purpose: read a fixture table file (tab-delimited, column names first)
+#
+def readTable(fileName):
+
+    fp = open(fileName, 'r')
+    columns = fp.readline().rstrip('\n').split('\t')
+    results = []
+    for line in fp:
+        values = line.rstrip('\n').split('\t')
+        results.append(dict(zip(columns, map(fixtureValue, values))))
+    fp.close()
+
+    return results
+
+#
+# Purpose: seed the tables from a fixture file or a fixture directory
+#
+def seed(fixture):
+
+    global database
+
+    tables.clear()
+    sequences.clear()
+
+    if os.path.isdir(fixture):
+        for fileName in sorted(os.listdir(fixture)):
+            table, ext = os.path.splitext(fileName)
+            if ext != '.txt':
+                continue
+            if table == 'sequences':
+                for r in readTable(os.path.join(fixture, fileName)):
+                    sequences[r['sequence']] = [r['lastValue'], 1]
+            else:
+                tables[table.lower()] = readTable(os.path.join(fixture, fileName))
+    else:
+        fp = open(fixture, 'r')
+        f = json.load(fp)
+        fp.close()
+        for table in f.get('tables', {}):
+            tables[table.lower()] = f['tables'][table]
+        for name in f.get('sequences', {}):
+            sequences[name] = [f['sequences'][name], 1]
+
+    database = os.path.basename(fixture)
+
+#
+# Purpose: returns the current time, as modification_date of an updated row
+#
+def now():
+    return datetime.datetime.now().isoformat(' ')
+
+def rows(table):
+    return tables.get(table.lower(), [])
+
+#
+# Purpose: returns the column name as used in the rows of a table
+#	(the statements are matched in lower case)
+#
+def columnName(table, column):
+
+    for r in rows(table)[:1]:
+        for c in r:
+            if c.lower() == column.lower():
+                return c
+
+    return column
+
+#
+# Purpose: add bulk-loaded rows to a table
+#	lines : '|' delimited, in bcpColumns order
+#
+def loadRows(method, table, lines, delimiter = '|'):
+
+    columns = bcpColumns.get(table.lower())
+    loaded = tables.setdefault(table.lower(), [])
+    count = 0
+
+    for line in lines:
+        values = line.rstrip('\n').split(delimiter)
+        if columns is None:
+            columns = ['column%d' % (i + 1) for i in range(len(values))]
+        loaded.append(dict(zip(columns, map(fixtureValue, values))))
+        count += 1
+
+    bcpLoads.append([method, table, count])
+    return count
+
+#
+# Purpose: apply the bcp loads written to STANDIN_BCPLOG since the last call
+#
+def applyBcpLog():
+
+    global bcpLogLines
+
+    fileName = os.getenv('STANDIN_BCPLOG')
+    if not fileName or not os.path.exists(fileName):
+        return
+
+    fp = open(fileName, 'r')
+    lines = fp.readlines()
+    fp.close()
+
+    for line in lines[bcpLogLines:]:
+        table, bcpFile = line.rstrip('\n').split('\t')
+        fp = open(bcpFile, 'r')
+        loadRows('bcp', table, fp)
+        fp.close()
+
+    bcpLogLines = len(lines)
+
+#
+# Purpose: add a handler for a statement shape, ahead of the built-in ones
+#
+def register(pattern, handler):
+    handlers.insert(0, (re.compile(pattern), handler))
+
+#
+# copy loads (LOAD_MODE = copy, see copyLoader.py)
+#
+
+class Cursor:
+
+    def copy_expert(self, cmd, fp):
+        m = re.match(r"\s*copy (\w+) from stdin with \(delimiter '(.)'", cmd, re.I)
+        statements.append([cmd, 0])
+        loadRows('copy', m.group(1), fp.read().splitlines(), m.group(2))
+
+    def close(self):
+        pass
+
+class Connection:
+
+    def cursor(self):
+        return Cursor()
+
+    def commit(self):
+        commit()
+
+
+#
+# db module interface
+#
+
+def useOneConnection(value = 0):
+    pass
+
+def set_sqlUser(user):
+    pass
+
+def set_sqlPasswordFromFile(fileName):
+    pass
+
+def set_sqlLogFunction(f):
+    global sqlLogFunction
+    sqlLogFunction = f
+
+def sqlLogAll(cmd, *args, **kw):
+    print(cmd)
+
+def get_sqlServer():
+    return server
+
+def get_sqlDatabase():
+    return database
+
+def commit():
+    global commits
+    commits += 1
+
+#
+# statement handlers
+#
+
+spaceRE = re.compile(r'\s+')
+intRE = re.compile(r'^-?\d+$')
+symbolRE = re.compile(r"lower\(a\.symbol\) ~ '([^']*)'")
+statusRE = re.compile(r'_allele_status_key in \(([^)]*)\)')
+inListRE = re.compile(r' in \(([^)]*)\)')
+inStringsRE = re.compile(r" in \(((?:\s*'(?:[^']|'')*'\s*,?)+)\)")
+stringRE = re.compile(r"'((?:[^']|'')*)'")
+
+def strings(text):
+    return [s.replace("''", "'") for s in stringRE.findall(text)]
+
+def numbers(text):
+    return [int(n) for n in text.split(',') if n.strip()]
+
+def accIDs(mgiTypeKey, prefixPart):
+    return dict([(k, a['accID']) for k, a in accRows(mgiTypeKey, prefixPart).items()])
+
+#
+# accession rows, key = _Object_key
+#
+def accRows(mgiTypeKey, prefixPart):
+    return dict([(a['_Object_key'], a) for a in rows('ACC_Accession') \
+        if a['_MGIType_key'] == mgiTypeKey and a['prefixPart'] == prefixPart \
+        and a['_LogicalDB_key'] == 1 and a['preferred'] == 1])
+
+#
+# alleles matching the symbol regular expressions and status list of the
+# statement (makeIKMC.py)
+#
+def matchAlleles(cmd):
+
+    patterns = [re.compile(p) for p in symbolRE.findall(cmd)]
+    statusKeys = numbers(statusRE.search(cmd).group(1))
+
+    return [a for a in rows('ALL_Allele') \
+        if a['_Allele_Status_key'] in statusKeys \
+        and [p for p in patterns if p.match(a['symbol'].lower())]]
+
+#
+# the snapshot queries (ikmcSnapshot.py)
+# each returns a list of (result row, the table rows it was joined from)
+#
+
+def parentRows(cmd):
+
+    alleleIDs = accRows(11, 'MGI:')
+    markerIDs = accRows(2, 'MGI:')
+    markers = dict([(m['_Marker_key'], m) for m in rows('MRK_Marker')])
+    strains = dict([(s['_Strain_key'], s) for s in rows('PRB_Strain')])
+
+    results = []
+    for a in matchAlleles(cmd):
+        if a['_Allele_key'] in alleleIDs and a['_Marker_key'] in markerIDs:
+            aa = alleleIDs[a['_Allele_key']]
+            am = markerIDs[a['_Marker_key']]
+            m = markers[a['_Marker_key']]
+            s = strains[a['_Strain_key']]
+            results.append(({'accID' : aa['accID'], '_Allele_key' : a['_Allele_key'],
+                '_Allele_Status_key' : a['_Allele_Status_key'], 'symbol' : a['symbol'],
+                'name' : a['name'], '_Collection_key' : a['_Collection_key'],
+                'strain' : s['strain'], 'markerID' : am['accID'],
+                'markerSym' : m['symbol']}, [a, aa, am, m, s]))
+    return results
+
+def childRows(cmd):
+
+    alleleIDs = accRows(11, 'MGI:')
+
+    return [({'accID' : alleleIDs[a['_Allele_key']]['accID'], '_Allele_key' : a['_Allele_key'],
+              '_Allele_Status_key' : a['_Allele_Status_key'], 'symbol' : a['symbol'],
+              '_Collection_key' : a['_Collection_key']}, [a, alleleIDs[a['_Allele_key']]]) \
+        for a in matchAlleles(cmd) if a['_Allele_key'] in alleleIDs]
+
+def cellLineRows(cmd):
+
+    alleles = dict([(a['_Allele_key'], a) for a in matchAlleles(cmd)])
+    cellLines = dict([(c['_CellLine_key'], c) for c in rows('ALL_CellLine')])
+
+    return [({'_Allele_key' : ac['_Allele_key'], '_CellLine_key' : ac['_MutantCellLine_key'],
+              'cellLine' : cellLines[ac['_MutantCellLine_key']]['cellLine']},
+             [alleles[ac['_Allele_key']], ac, cellLines[ac['_MutantCellLine_key']]]) \
+        for ac in rows('ALL_Allele_CellLine') if ac['_Allele_key'] in alleles]
+
+def noteRows(cmd):
+
+    noteTypeKey = int(re.search(r'_notetype_key = (\d+)', cmd).group(1))
+    alleles = dict([(a['_Allele_key'], a) for a in matchAlleles(cmd)])
+
+    return [({'_Note_key' : n['_Note_key'], '_Object_key' : n['_Object_key'],
+              'note' : n['note'].rstrip()}, [n, alleles[n['_Object_key']]]) \
+        for n in rows('MGI_Note') if n['_NoteType_key'] == noteTypeKey \
+        and n['_Object_key'] in alleles]
+
+# key = from clause of the query, value = rows of the query
+snapshotQueries = [
+    (re.compile(r'from all_allele a, acc_accession aa, acc_accession am, mrk_marker m, prb_strain s'), parentRows),
+    (re.compile(r'from all_allele a, acc_accession aa '), childRows),
+    (re.compile(r'from all_allele a, all_allele_cellline ac, all_cellline c'), cellLineRows),
+    (re.compile(r'from mgi_note n, all_allele a'), noteRows),
+    ]
+
+def snapshotQuery(cmd):
+
+    for pattern, queryRows in snapshotQueries:
+        if pattern.search(cmd):
+            return [r for r, joined in queryRows(cmd)]
+
+#
+# the row count and the last modification date of a snapshot query
+# (a row without a modification_date counts as '')
+#
+def snapshotFingerprint(cmd):
+
+    for pattern, queryRows in snapshotQueries:
+        if pattern.search(cmd):
+            joined = queryRows(cmd)
+            dates = [str(t.get('modification_date') or '') for r, j in joined for t in j]
+            return [{'rowCount' : len(joined), 'lastModified' : max(dates or [None])}]
+
+def termFingerprint(cmd):
+
+    vocabKeys = numbers(inListRE.search(cmd).group(1))
+    terms = [t for t in rows('VOC_Term') if t['_Vocab_key'] in vocabKeys]
+    dates = [t.get('modification_date', '') for t in terms]
+
+    return [{'termCount' : len(terms), 'lastModified' : max(dates or [None])}]
+
+def terms(cmd):
+
+    vocabKeys = numbers(inListRE.search(cmd).group(1))
+
+    return [{'_Vocab_key' : t['_Vocab_key'], '_Term_key' : t['_Term_key'], 'term' : t['term']} \
+        for t in rows('VOC_Term') if t['_Vocab_key'] in vocabKeys]
+
+def cellLines(cmd):
+
+    if cmd.find(' in (') > 0:
+        values = set(strings(inStringsRE.search(cmd).group(1)))
+    else:
+        values = set(strings(cmd))
+
+    return [{'_CellLine_key' : c['_CellLine_key'], 'cellLine' : c['cellLine']} \
+        for c in rows('ALL_CellLine') \
+        if c['cellLine'] in values and c['isMutant'] == 1 and c.get('_Derivation_key') is not None]
+
+def users(cmd):
+
+    values = set(strings(inStringsRE.search(cmd).group(1)))
+
+    return [{'_User_key' : u['_User_key'], 'login' : u['login']} \
+        for u in rows('MGI_User') if u['login'] in values]
+
+def markers(cmd):
+
+    values = set(strings(inStringsRE.search(cmd).group(1)))
+    official = set([m['_Marker_key'] for m in rows('MRK_Marker') if m['_Marker_Status_key'] == 1])
+    markerIDs = accIDs(2, 'MGI:')
+
+    return [{'accID' : markerIDs[k], '_Object_key' : k} \
+        for k in markerIDs if markerIDs[k] in values and k in official]
+
+def strains(cmd):
+
+    values = set(strings(inStringsRE.search(cmd).group(1)))
+
+    return [{'_Strain_key' : s['_Strain_key'], 'strain' : s['strain']} \
+        for s in rows('PRB_Strain') if s['strain'] in values]
+
+def references(cmd):
+
+    values = set(strings(inStringsRE.search(cmd).group(1)))
+    refIDs = accIDs(1, 'J:')
+
+    return [{'accID' : refIDs[k], '_Object_key' : k} for k in refIDs if refIDs[k] in values]
+
+def alterSequence(cmd):
+
+    m = re.search(r'alter sequence (\w+) increment by (\d+)', cmd)
+    sequences.setdefault(m.group(1), [0, 1])[1] = int(m.group(2))
+    return None
+
+def nextval(cmd):
+
+    name = re.search(r"nextval\('(\w+)'\)", cmd).group(1)
+    s = sequences.setdefault(name, [0, 1])
+    s[0] += s[1]
+    return [{'lastKey' : s[0]}]
+
+def hasSequence(cmd):
+
+    name = re.search(r"to_regclass\('(\w+)'\)", cmd).group(1)
+    return [{'hasSeq' : name in sequences}]
+
+def accessionMax(cmd):
+
+    m = re.search(r"maxnumericpart \+ (\d+) where prefixpart = '([^']*)'", cmd)
+    for r in rows('ACC_AccessionMax'):
+        if r['prefixPart'] == m.group(2):
+            r['maxNumericPart'] += int(m.group(1))
+            return [{'maxNumericPart' : r['maxNumericPart']}]
+    return []
+
+def noteUpdate(cmd):
+
+    notes = dict([(n['_Note_key'], n) for n in rows('MGI_Note')])
+
+    for noteKey, isAppend, note in re.findall(r"\((\d+), (\d), '((?:[^']|'')*)'\)", cmd):
+        n = notes.get(int(noteKey))
+        if n is None:
+            continue
+        note = note.replace("''", "'")
+        if isAppend == '1':
+            n['note'] = n['note'].rstrip() + note
+        else:
+            n['note'] = note
+        n['modification_date'] = now()
+
+    return None
+
+def statusUpdate(cmd):
+
+    statusKey = int(re.search(r'set _allele_status_key = (\d+)', cmd).group(1))
+    alleleKeys = set(numbers(re.search(r'any\(array\[([^\]]*)\]\)', cmd).group(1)))
+
+    results = []
+    for a in rows('ALL_Allele'):
+        if a['_Allele_key'] in alleleKeys:
+            a['_Allele_Status_key'] = statusKey
+            a['modification_date'] = now()
+            results.append({'_Allele_key' : a['_Allele_key']})
+    return results
+
+def keyRange(cmd):
+
+    m = re.search(r'max\((\w+)\) as lastkey from (\w+) where \w+ between (\d+) and (\d+)', cmd)
+    column = columnName(m.group(2), m.group(1))
+    keys = [r[column] for r in rows(m.group(2)) \
+        if column in r and int(m.group(3)) <= r[column] <= int(m.group(4))]
+
+    return [{'rows' : len(keys), 'lastKey' : max(keys or [None])}]
+
+def setval(cmd):
+
+    m = re.search(r"setval\('(\w+)', greatest\((.*), \(select last_value from \w+\)\)\)", cmd)
+    s = sequences.setdefault(m.group(1), [0, 1])
+    value = m.group(2)
+    if value.isdigit():
+        s[0] = max(s[0], int(value))
+    else:
+        t = re.search(r'select max\((\w+)\) from (\w+)', value)
+        column = columnName(t.group(2), t.group(1))
+        keys = [r[column] for r in rows(t.group(2)) if r.get(column) is not None]
+        s[0] = max([s[0]] + keys)
+    return [{'value' : s[0]}]
+
+def selectOne(cmd):
+    return [{'?column?' : 1}]
+
+# (statement shape, handler), in match order
+handlers = [
+    (re.compile(r'^select count\(\*\) as rowcount, max\(greatest\('), snapshotFingerprint),
+    (re.compile(r'^select (aa\.accid|a\._allele_key|n\._note_key), .* from (all_allele|mgi_note) '), snapshotQuery),
+    (re.compile(r'^select count\(\*\) as termcount'), termFingerprint),
+    (re.compile(r'^select _vocab_key, _term_key, term from voc_term'), terms),
+    (re.compile(r'from all_cellline where'), cellLines),
+    (re.compile(r'from mgi_user where login in'), users),
+    (re.compile(r'from acc_accession a, mrk_marker m'), markers),
+    (re.compile(r'from prb_strain where strain in'), strains),
+    (re.compile(r'^select accid, _object_key from acc_accession where accid in'), references),
+    (re.compile(r'^alter sequence'), alterSequence),
+    (re.compile(r'^select nextval'), nextval),
+    (re.compile(r'^select to_regclass'), hasSequence),
+    (re.compile(r'^update acc_accessionmax'), accessionMax),
+    (re.compile(r'^update mgi_note n set note'), noteUpdate),
+    (re.compile(r'^update all_allele set _allele_status_key'), statusUpdate),
+    (re.compile(r'^select count\(\*\) as rows, max'), keyRange),
+    (re.compile(r'^select setval'), setval),
+    (re.compile(r'^select 1$'), selectOne),
+    ]
+
+#
+# Purpose: run a statement (or a list of statements)
+#
+def sql(cmd, parser = 'auto'):
+
+    global calls
+
+    if isinstance(cmd, list):
+        return [sql(c, parser) for c in cmd]
+
+    calls += 1
+
+    if sqlLogFunction:
+        sqlLogFunction(cmd)
+
+    applyBcpLog()
+
+    # the literals are kept as they are; everything else is matched in
+    # lower case, with the white space collapsed
+    parts = stringRE.split(cmd)
+    for i in range(len(parts)):
+        if i % 2 == 0:
+            parts[i] = spaceRE.sub(' ', parts[i]).lower()
+        else:
+            parts[i] = "'" + parts[i] + "'"
+    shape = ''.join(parts).strip()
+
+    for pattern, handler in handlers:
+        if pattern.search(shape):
+            results = handler(shape)
+            record(cmd, results)
+            return results
+
+    raise Exception('db (stand-in): statement not recognised: %s' % (shape[:200]))
+
+#
+# Purpose: record an executed statement
+#
+def record(cmd, results):
+
+    count = 0
+    if isinstance(results, list):
+        count = len(results)
+
+    statements.append([cmd, count])
+
+    fileName = os.getenv('STANDIN_LOG')
+    if fileName:
+        fp = open(fileName, 'a')
+        fp.write('%s;\n-- %s rows\n' % (cmd.strip(), count))
+        fp.close()
+
+if os.getenv('STANDIN_FIXTURE'):
+    seed(os.environ['STANDIN_FIXTURE'])
@@ -0,0 +1,50 @@
+#
+#  loadlib.py (stand-in)
+###########################################################################
+#
+#  Purpose:
+#
+#      The loadlib functions used by the loaders, answered from the
+#      stand-in db module.  A value that is not found is reported to the
+#      error file and 0 is returned, as loadlib does.
+#
+###########################################################################
+
+import time
+import db
+
+loaddate = time.strftime('%m/%d/%Y')
+
+def error(errorFile, message, lineNum):
+    errorFile.write('%s (line %s)\n' % (message, lineNum))
+    return 0
+
+def verifyTerm(termID, vocabKey, term, lineNum, errorFile):
+
+    for t in db.rows('VOC_Term'):
+        if t['_Vocab_key'] == vocabKey and t['term'] == term:
+            return t['_Term_key']
+
+    return error(errorFile, 'Invalid Term (%s): %s' % (vocabKey, term), lineNum)
+
+def verifyUser(login, lineNum, errorFile):
+
+    for u in db.rows('MGI_User'):
+        if u['login'] == login:
+            return u['_User_key']
+
+    return error(errorFile, 'Invalid User: %s' % (login), lineNum)
+
+def verifyMarker(markerID, lineNum, errorFile):
+
+    for r in db.markers("in ('%s')" % (markerID.replace("'", "''"))):
+        return r['_Object_key']
+
+    return error(errorFile, 'Invalid Marker: %s' % (markerID), lineNum)
+
+def verifyReference(jnum, lineNum, errorFile):
+
+    for r in db.references("in ('%s')" % (jnum.replace("'", "''"))):
+        return r['_Object_key']
+
+    return error(errorFile, 'Invalid Reference: %s' % (jnum), lineNum)
@@ -0,0 +1,19 @@
+#
+#  mgi_utils.py (stand-in)
+###########################################################################
+#
+#  Purpose:
+#
+#      The mgi_utils functions used by the loaders.
+#
+###########################################################################
+
+import time
+
+def date(format = '%c'):
+    return time.strftime(format)
+
+def prvalue(value):
+    if value is None:
+        return ''
+    return str(value)
@@ -0,0 +1,21 @@
+#
+#  sourceloadlib.py (stand-in)
+###########################################################################
+#
+#  Purpose:
+#
+#      The sourceloadlib functions used by the loaders, answered from the
+#      stand-in db module.
+#
+###########################################################################
+
+import db
+import loadlib
+
+def verifyStrain(strain, lineNum, errorFile):
+
+    for s in db.rows('PRB_Strain'):
+        if s['strain'] == strain:
+            return s['_Strain_key']
+
+    return loadlib.error(errorFile, 'Invalid Strain: %s' % (strain), lineNum)
@@ -0,0 +1,337 @@
+#
+#  test_alleleload.py
+###########################################################################
+#
+#  Purpose:
+#
+#      Runs makeIKMC.py and makeAllele.py against the stand-in database
+#      (test/standin) on a synthetic GenTar file and fixture
+#      (test/benchmark/genGenTar.py) and checks the outputs.
+#
+#  Usage:
+#
+#      python -m pytest test
+#
+###########################################################################
+
+import sys
+import os
+import re
+import json
+import importlib
+import subprocess
+
+testDir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(testDir, 'benchmark'))
+
+import genGenTar
+import runBenchmark
+
+sys.path.insert(0, runBenchmark.binDir)
+
+import ikmcIndex
+
+rows = 300
+seed = 42
+
+# the makeIKMC.py outputs compared between runs
+outputFiles = ['mgi_allele_ikmc.txt', 'ikmc.skip.log', 'ikmc.exist.log']
+
+#
+# Purpose: generate the GenTar file and fixture
+# Returns: the loader environment
+#
+def setup(runDir):
+
+    genGenTar.write(rows, str(runDir), seed)
+    return runBenchmark.environment(str(runDir))
+
+#
+# Purpose: run a loader; extra = additional environment variables
+# Returns: its log
+#
+def runLoader(program, runDir, env, *args, **extra):
+
+    env = dict(env)
+    env.update(extra)
+
+    result = subprocess.run([sys.executable, os.path.join(runBenchmark.binDir, program)] + list(args), \
+            cwd = str(runDir), env = env, stdout = subprocess.PIPE, stderr = subprocess.STDOUT, \
+            universal_newlines = True)
+    assert result.returncode == 0, result.stdout
+
+    return result.stdout
+
+#
+# Purpose: returns the makeIKMC.py outputs
+#
+def outputs(runDir):
+
+    results = {}
+    for fileName in outputFiles:
+        fp = open(os.path.join(str(runDir), fileName), 'r')
+        results[fileName] = fp.read()
+        fp.close()
+
+    return results
+
+#
+# Purpose: returns (rows carried forward, verdicts saved) of a delta run
+#
+def deltaCounts(log):
+
+    m = re.search(r'rows carried forward: (\d+), verdicts saved: (\d+)', log)
+    return int(m.group(1)), int(m.group(2))
+
+def readFixture(runDir):
+
+    fp = open(os.path.join(str(runDir), 'fixture.json'), 'r')
+    fixture = json.load(fp)
+    fp.close()
+
+    return fixture
+
+def writeFixture(runDir, fixture):
+
+    fp = open(os.path.join(str(runDir), 'fixture.json'), 'w')
+    json.dump(fixture, fp)
+    fp.close()
+
+#
+# an edit to an allele and a note that no row depends on (a KOMP child
+# with its IKMC Colony note, and a note of another type) keeps the
+# carried verdicts
+#
+def test_delta_unrelated_edit(tmp_path):
+
+    env = setup(tmp_path)
+    delta = {'IKMC_DELTA' : '1', 'IKMC_DELTA_FILE' : str(tmp_path / 'delta.json')}
+
+    runLoader('makeIKMC.py', tmp_path, env, **delta)
+    first = outputs(tmp_path)
+
+    fixture = readFixture(tmp_path)
+    tables = fixture['tables']
+
+    allele = dict(tables['ALL_Allele'][0])
+    allele.update({'_Allele_key' : 9000001, 'symbol' : 'Zzz1<tm1.1(KOMP)Wtsi>',
+        '_Allele_Status_key' : genGenTar.approvedKey, 'modification_date' : '2026-10-18 10:00:00'})
+    tables['ALL_Allele'].append(allele)
+
+    acc = dict([a for a in tables['ACC_Accession'] if a['_MGIType_key'] == 11][0])
+    acc.update({'_Accession_key' : 9000001, 'accID' : 'MGI:9000001', 'numericPart' : 9000001,
+        '_Object_key' : 9000001})
+    tables['ACC_Accession'].append(acc)
+
+    tables['MGI_Note'].append({'_Note_key' : 9000001, '_Object_key' : 9000001, '_MGIType_key' : 11,
+        '_NoteType_key' : genGenTar.ikmcNoteTypeKey, 'note' : 'ZZZ1',
+        'modification_date' : '2026-10-18 10:00:00'})
+    tables['MGI_Note'].append({'_Note_key' : 9000002, '_Object_key' : tables['MGI_Note'][0]['_Object_key'],
+        '_MGIType_key' : 11, '_NoteType_key' : 1020, 'note' : 'general note',
+        'modification_date' : '2026-10-18 10:00:00'})
+
+    writeFixture(tmp_path, fixture)
+
+    log = runLoader('makeIKMC.py', tmp_path, env, **delta)
+    carried, saved = deltaCounts(log)
+
+    assert saved > 0
+    assert carried >= saved
+    assert outputs(tmp_path) == first
+
+#
+# an edit to the IKMC Colony note of a child that a verdict depends on
+# re-evaluates that row only
+#
+def test_delta_related_edit(tmp_path):
+
+    env = setup(tmp_path)
+    delta = {'IKMC_DELTA' : '1', 'IKMC_DELTA_FILE' : str(tmp_path / 'delta.json')}
+
+    log = runLoader('makeIKMC.py', tmp_path, env, **delta)
+    carried, saved = deltaCounts(log)
+    exists = outputs(tmp_path)['ikmc.exist.log'].splitlines()
+    child = [e for e in exists if e.find('already exists in MGI') >= 0][0].split('\t')[-1]
+
+    fixture = readFixture(tmp_path)
+    tables = fixture['tables']
+    alleleKey = [a['_Allele_key'] for a in tables['ALL_Allele'] if a['symbol'] == child][0]
+    for n in tables['MGI_Note']:
+        if n['_Object_key'] == alleleKey:
+            n['note'] = 'ZZZ'
+    writeFixture(tmp_path, fixture)
+
+    runLoader('makeIKMC.py', tmp_path, env)
+    expected = outputs(tmp_path)
+
+    log = runLoader('makeIKMC.py', tmp_path, env, **delta)
+    carried, resaved = deltaCounts(log)
+
+    assert carried < saved
+    assert outputs(tmp_path) == expected
+
+#
+# the rule workers and a second delta run give the same outputs as a
+# sequential run
+#
+def test_workers_and_delta_match_sequential(tmp_path):
+
+    env = setup(tmp_path)
+
+    runLoader('makeIKMC.py', tmp_path, env)
+    sequential = outputs(tmp_path)
+
+    runLoader('makeIKMC.py', tmp_path, env, IKMC_RULE_WORKERS = '4')
+    assert outputs(tmp_path) == sequential
+
+    delta = {'IKMC_DELTA' : '1', 'IKMC_DELTA_FILE' : str(tmp_path / 'delta.json')}
+    runLoader('makeIKMC.py', tmp_path, env, **delta)
+    assert outputs(tmp_path) == sequential
+
+    log = runLoader('makeIKMC.py', tmp_path, env, **delta)
+    carried, saved = deltaCounts(log)
+    assert carried > 0
+    assert outputs(tmp_path) == sequential
+
+    log = runLoader('makeIKMC.py', tmp_path, env, IKMC_RULE_WORKERS = '4', **delta)
+    assert outputs(tmp_path) == sequential
+
+#
+# a colony matches a whole token of the IKMC Colony note, not a substring
+#
+def test_colony_token_match():
+
+    ikmcIndex.add('notes', [{'_Note_key' : 1, '_Object_key' : 1001, 'note' : 'COL10|COL2'}])
+
+    assert ikmcIndex.hasColony(1001, 'COL10')
+    assert ikmcIndex.hasColony(1001, 'COL2')
+    assert not ikmcIndex.hasColony(1001, 'COL1')
+    assert not ikmcIndex.hasColony(1002, 'COL10')
+
+#
+# --resume only loads the tables that are not marked loaded in .status
+#
+def test_resume_skips_loaded_tables(tmp_path):
+
+    env = setup(tmp_path)
+
+    runLoader('makeIKMC.py', tmp_path, env)
+    runLoader('makeAllele.py', tmp_path, env)
+
+    statusFileName = os.path.join(str(tmp_path), 'mgi_allele_ikmc.txt.status')
+    fp = open(statusFileName, 'r')
+    status = json.load(fp)
+    fp.close()
+
+    assert set([status[t] for t in status]) == set(['loaded', 'done'])
+
+    status['MGI_Note'] = 'pending'
+    status['VOC_Annot'] = 'failed'
+    status['resync'] = 'pending'
+    fp = open(statusFileName, 'w')
+    json.dump(status, fp)
+    fp.close()
+
+    bcpLog = os.path.join(str(tmp_path), 'resume.bcp.log')
+    runLoader('makeAllele.py', tmp_path, env, '--resume', STANDIN_BCPLOG = bcpLog)
+
+    fp = open(bcpLog, 'r')
+    loaded = [line.split('\t')[0] for line in fp]
+    fp.close()
+
+    assert sorted(loaded) == ['MGI_Note', 'VOC_Annot']
+
+    fp = open(statusFileName, 'r')
+    status = json.load(fp)
+    fp.close()
+
+    assert set([status[t] for t in status]) == set(['loaded', 'done'])
+
+#
+# the coalesced IKMC Colony note update gives the same notes as the
+# per-row statements of the original makeAllele.py:
+#
+#	replaceNote(nKey, note)			set note = 'note'
+#	appendNote(nKey, colony)		set note = rtrim(note) || '|colony'
+#	appendNote(nKey, colony, existing)	set note = 'existing|colony'
+#
+# except that the third statement of a second row for the same note
+# replaced the colony of the first row (existing is the note as makeIKMC.py
+# read it); the coalesced update keeps the colonies of all the rows, as if
+# the later rows appended to the note, and adds each colony once
+#
+# makeAllele.py runs in this process, so that the notes of the stand-in
+# can be compared after the update
+#
+def test_note_update_matches_per_row_statements(tmp_path, monkeypatch):
+
+    env = setup(tmp_path)
+    runLoader('makeIKMC.py', tmp_path, env)
+
+    for name in env:
+        monkeypatch.setenv(name, env[name])
+    monkeypatch.syspath_prepend(runBenchmark.standinDir)
+    monkeypatch.setattr(sys, 'argv', ['makeAllele.py'])
+
+    for module in ['db', 'ikmcUpdate', 'lookupCache', 'makeAllele']:
+        sys.modules.pop(module, None)
+
+    import db
+    import ikmcUpdate
+    makeAllele = importlib.import_module('makeAllele')
+
+    # the per-row statements, in the order makeAllele.py issues them
+    perRow = []
+    appendNote = ikmcUpdate.appendNote
+    replaceNote = ikmcUpdate.replaceNote
+
+    def recordAppend(noteKey, colony, existingNote = None):
+        perRow.append(('append', int(noteKey), colony, existingNote))
+        appendNote(noteKey, colony, existingNote)
+
+    def recordReplace(noteKey, note):
+        perRow.append(('replace', int(noteKey), note, None))
+        replaceNote(noteKey, note)
+
+    monkeypatch.setattr(ikmcUpdate, 'appendNote', recordAppend)
+    monkeypatch.setattr(ikmcUpdate, 'replaceNote', recordReplace)
+
+    makeAllele.initialize()
+    makeAllele.preprocessFile()
+    makeAllele.setPrimaryKeys()
+    makeAllele.processFile()
+    makeAllele.closeFiles()
+    makeAllele.writeCheckpoint()
+    makeAllele.bcpTables(makeAllele.bcpTableNames)
+
+    # the notes before the update (including the notes of this load)
+    db.sql('select 1', 'auto')
+    expected = dict([(n['_Note_key'], n['note']) for n in db.rows('MGI_Note')])
+
+    replaced = set()
+    appended = set()
+    for kind, noteKey, text, existingNote in perRow:
+        if kind == 'replace':
+            expected[noteKey] = text
+            appended = set([a for a in appended if a[0] != noteKey])
+            continue
+        if (noteKey, text) in appended:
+            continue
+        appended.add((noteKey, text))
+        if existingNote is None or noteKey in replaced:
+            expected[noteKey] = expected[noteKey].rstrip() + '|' + text
+        else:
+            expected[noteKey] = existingNote + '|' + text
+            replaced.add(noteKey)
+
+    makeAllele.applyIKMCUpdates()
+
+    notes = dict([(n['_Note_key'], n['note']) for n in db.rows('MGI_Note')])
+
+    assert len(perRow) > 0
+    assert notes == expected
+
+    makeAllele.diagFile.close()
+    makeAllele.errorFile.close()
+    makeAllele.newAlleleFile.close()
+    makeAllele.inputFile.close()